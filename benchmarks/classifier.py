@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# get_action_type as it was (copied below) vs the precompiled OperationClassifier, per row and per column.
+# usage: ./benchmarks/classifier.py --rows 1000000
+
+import sys
+import time
+import random
+import argparse
+from os import path
+from typing import Any, Callable
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+# pylint: disable=wrong-import-position
+from tools.operations import OPERATIONS, get_classifier
+from benchmarks.synthetic import OPERATIONS as SYNTHETIC_OPERATIONS
+
+
+def list_action_type(operation: str) -> str:
+    transfer_choices = ["POS savings purchase", "POS savings redemption", "transfer_out", "transfer_in"]
+    swap_choices = ["Small assets exchange BNB", "Large OTC trading", "Buy", "Sell"]
+    same_choices = ["ADJUSTMENT", "TRANSFER", "INTEREST", "FEE", "WITHDRAW", "DEPOSIT", "MINING"]
+    if operation == "POS savings interest":
+        action_type = "INTEREST"
+    elif operation in transfer_choices:
+        action_type = "TRANSFER"
+    elif operation in swap_choices:
+        action_type = "SWAP"
+    elif operation.upper() in same_choices:
+        action_type = operation.upper()
+    else:
+        raise Exception(f"Error: action '{operation}' is invalid")
+    return action_type
+
+
+def timed(func: Callable[[], Any]) -> tuple[float, Any]:
+    start = time.perf_counter()
+    result = func()
+    return time.perf_counter() - start, result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the statement operation classifier.")
+    parser.add_argument("--rows", type=int, default=1000000, help="Number of operations to classify")
+    args = vars(parser.parse_args())
+
+    rng = random.Random(42)
+    choices = [operation for operations in SYNTHETIC_OPERATIONS.values() for operation in operations]
+    operations = [rng.choice(choices) for _ in range(args["rows"])]
+    classifier = get_classifier()
+
+    list_time, expected = timed(lambda: [list_action_type(operation) for operation in operations])
+    row_time, per_row = timed(lambda: [classifier.classify(operation) for operation in operations])
+    column_time, (per_column, unknown) = timed(lambda: classifier.classify_column(operations))
+    # every operation the old function accepted keeps its action type
+    same = all(classifier.classify(operation) == list_action_type(operation) for operation in OPERATIONS)
+
+    print(f"rows:        {len(operations):,}")
+    print(f"lists:       {list_time:.3f}s ({len(operations) / list_time:,.0f} rows/s)")
+    print(f"per row:     {row_time:.3f}s ({len(operations) / row_time:,.0f} rows/s)")
+    print(f"per column:  {column_time:.3f}s ({len(operations) / column_time:,.0f} rows/s)")
+    print(f"identical:   {expected == per_row == per_column and not unknown and same}")
+
+
+if __name__ == "__main__":
+    main()
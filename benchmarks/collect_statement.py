@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# Collect statement path: the swap group fixtures and the bundled statement collected into a SQLite file through
+# Storage, then read back like Report would. A trade priced from a kline store gets its GAIN rows and collecting the
+# statement again changes nothing.
+# Exits with 1 when a leg differs from the fixture or from Report, a GAIN/LOSS row is missing or the summary drifts.
+# usage: ./benchmarks/collect_statement.py
+
+import sys
+import logging
+import tempfile
+from os import makedirs, path
+from typing import Any
+
+import numpy as np
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+# pylint: disable=wrong-import-position
+from tools.collect import Collect
+from tools.db import Actions
+from tools.fixed import to_cents
+from tools.klines import KlineStore, to_epochs
+from tools.pricing import PricingEngine
+from tools.report import Report
+from benchmarks.harness import exit_with
+from benchmarks.swap_groups import FIXTURES, SWAP_TIME, write_fixture
+
+ROOT_DIR = path.dirname(path.dirname(path.abspath(__file__)))
+STATEMENT = path.join(ROOT_DIR, "data", "csv", "best-binance.csv")
+PRICED_FIXTURE = "two trades in the same second"
+# BUSD price of the coins bought by PRICED_FIXTURE at SWAP_TIME and the GAIN in cents of every bought leg, its value
+# at Collect.FIAT_EXCHANGE_RATE less its investment: 0.05 ETH are 128.00 bought for 111.11
+PRICES = {"ETHBUSD": 2000.0, "BTCBUSD": 50000.0}
+GAINS = {"ETH": 12800 - 11111, "BTC": 25600 - 25397}
+
+
+def collect(file_path: str, statement: str, kline_dir: str | None = None) -> Collect:
+    # a file collected before keeps its schema and rows
+    new = not path.exists(file_path)
+    collector = Collect(file_path)
+    if new:
+        collector.storage.create_schema()
+    if kline_dir:
+        collector.klines = KlineStore(kline_dir)
+        collector.pricing = PricingEngine(collector.klines, list(PRICES), collector.STABLE_COIN)
+    collector.proccess_raw_statement(statement)
+    return collector
+
+
+def read_actions(file_path: str) -> tuple[list[Any], list[tuple[str, str, float, float]]]:
+    report = Report(database_url=f"sqlite:///{file_path}")
+    actions = report.conn.query(Actions).order_by(Actions.utc_date, Actions.statement_row).all()
+    differences = report.verify_summary()
+    report.close()
+    return actions, differences
+
+
+def write_klines(kline_dir: str) -> None:
+    makedirs(kline_dir)
+    store = KlineStore(kline_dir)
+    open_time = to_epochs([SWAP_TIME])
+    for pair, price in PRICES.items():
+        np.save(store.get_file(pair, "time"), open_time)
+        np.save(store.get_file(pair, "ohlc"), np.full((1, 4), price))
+
+
+def check_fixture(workspace: str, name: str, statement: str, expected: dict[tuple[str, str], int]) -> list[str]:
+    file_path = path.join(workspace, f"{name.replace(' ', '-')}.db")
+    collect(file_path, statement).close_db()
+    actions, differences = read_actions(file_path)
+    legs = {
+        (row.coin, f"{row.amount:.8f}"): to_cents(row.investment)
+        for row in actions
+        if row.action_type in ("SWAP", "FEE")
+    }
+    failures = [
+        f"{name}: {coin} {amount} is {legs.get((coin, amount))} not {cents}"
+        for (coin, amount), cents in expected.items()
+        if legs.get((coin, amount)) != cents
+    ]
+    return failures + [f"{name}: summary {difference}" for difference in differences]
+
+
+def check_gain_loss(workspace: str, statement: str) -> list[str]:
+    kline_dir = path.join(workspace, "klines")
+    write_klines(kline_dir)
+    file_path = path.join(workspace, "gain-loss.db")
+    # @INFO: the second run finds every row, the GAIN rows included, and leaves the table as it was
+    for _ in range(2):
+        collect(file_path, statement, kline_dir).close_db()
+    actions, differences = read_actions(file_path)
+    action_ids = {row.coin: row.action_id for row in actions if row.action_type == "SWAP"}
+    gains = [row for row in actions if row.action_type in ("GAIN", "LOSS")]
+    failures = [f"gain/loss: summary {difference}" for difference in differences]
+    if sorted(row.coin for row in gains) != sorted(GAINS):
+        failures.append(f"gain/loss: rows for {sorted(row.coin for row in gains)} not {sorted(GAINS)}")
+    for row in gains:
+        if to_cents(row.investment) != GAINS.get(row.coin) or row.action_type != "GAIN":
+            failures.append(f"gain/loss: {row.coin} {row.action_type} is {to_cents(row.investment)} cents")
+        if row.action_id != action_ids[row.coin]:
+            failures.append(f"gain/loss: {row.coin} has action_id {row.action_id}, not the one of its swap")
+    print(f"gain/loss:  {len(gains)} rows out of {len(actions)} actions")
+    return failures
+
+
+def check_statement(workspace: str, statement: str) -> list[str]:
+    file_path = path.join(workspace, "statement.db")
+    collect(file_path, statement).close_db()
+    actions, differences = read_actions(file_path)
+    report = Report(database_url="sqlite://")
+    report.load_raw_statement(statement)
+    report.process()
+    expected = {row.id: to_cents(row.investment) for row in report.conn.query(Actions)}
+    report.close()
+    failures = [f"{path.basename(statement)}: summary {difference}" for difference in differences]
+    off = sum(1 for row in actions if expected.get(row.id) != to_cents(row.investment))
+    if off or len(actions) != len(expected):
+        failures.append(f"{path.basename(statement)}: {off} of {len(actions)} actions differ from Report")
+    print(f"statement:  {len(actions)} actions, {off} differ from Report")
+    return failures
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.ERROR)
+    failures = []
+    with tempfile.TemporaryDirectory() as workspace:
+        for idx, (name, (fixture, expected)) in enumerate(FIXTURES.items()):
+            statement = write_fixture(path.join(workspace, f"fixture-{idx}.csv"), fixture)
+            failures += check_fixture(workspace, name, statement, expected)
+            if name == PRICED_FIXTURE:
+                failures += check_gain_loss(workspace, statement)
+        print(f"fixtures:   {len(FIXTURES)} statements, {len(failures)} failures")
+        failures += check_statement(workspace, STATEMENT)
+    exit_with(failures)
+
+
+if __name__ == "__main__":
+    main()
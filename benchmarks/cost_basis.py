@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# Per-row Report.replay vs the vectorised engine on a synthetic ledger.
+# usage: ./benchmarks/cost_basis.py --rows 1000000
+
+import gc
+import sys
+import time
+import logging
+import argparse
+from os import path
+from types import SimpleNamespace
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+# pylint: disable=wrong-import-position
+from tools.fixed import to_cents
+from tools.engine import build_ledger, replay_ledger
+from benchmarks.harness import replay_report
+from benchmarks.synthetic import generate_actions
+
+
+def run_loop(rows: list[SimpleNamespace]) -> tuple[float, list[int]]:
+    start = time.perf_counter()
+    report = replay_report(rows)
+    return time.perf_counter() - start, [report.investments.get(row.id, to_cents(row.investment)) for row in rows]
+
+
+def run_vectorised(rows: list[tuple]) -> tuple[float, list[int]]:
+    start = time.perf_counter()
+    ledger = build_ledger(rows)
+    result = replay_ledger(ledger)
+    return time.perf_counter() - start, result.investment.tolist()
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.ERROR)
+    parser = argparse.ArgumentParser(description="Benchmark the per-row and vectorised cost-basis engines.")
+    parser.add_argument("--rows", type=int, default=1000000, help="Number of synthetic actions")
+    parser.add_argument("--swap-ratio", type=float, default=0.4, help="Share of rows that start a SWAP")
+    args = vars(parser.parse_args())
+
+    # each engine gets its input the way the database hands it over: objects for the loop, column tuples otherwise
+    actions = list(generate_actions(args["rows"], swap_ratio=args["swap_ratio"]))
+    objects = [SimpleNamespace(**action._asdict()) for action in actions]
+    columns = [
+        (action.coin, action.action_type, action.action_id, action.amount, action.investment) for action in actions
+    ]
+    gc.collect()
+    gc.disable()
+    loop_time, loop_investment = run_loop(objects)
+    vector_time, vector_investment = run_vectorised(columns)
+    gc.enable()
+    print(f"rows:       {len(actions):,}")
+    print(f"loop:       {loop_time:.3f}s ({len(actions) / loop_time:,.0f} rows/s)")
+    print(f"vectorised: {vector_time:.3f}s ({len(actions) / vector_time:,.0f} rows/s)")
+    print(f"identical:  {loop_investment == vector_investment}")
+
+
+if __name__ == "__main__":
+    main()
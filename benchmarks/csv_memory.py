@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# Peak RSS of loading a kline month file and a statement, materialised as lists vs streamed.
+# usage: ./benchmarks/csv_memory.py --rows 500000
+
+import sys
+import csv
+import sqlite3
+import resource
+import argparse
+import tempfile
+import multiprocessing
+from os import path
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+# pylint: disable=wrong-import-position
+from tools.readers import chunked, load_hist_file, process_raw_data
+
+HISTORY_SQL = path.join(path.dirname(path.dirname(path.abspath(__file__))), "data", "history.sql")
+
+
+def write_klines(csv_dir: str, rows: int) -> str:
+    file_name = "BTCBUSD-1m-2021-03.csv"
+    open_time = 1614556800000
+    with open(path.join(csv_dir, file_name), mode="w", encoding="utf-8", newline="") as csv_file:
+        writer = csv.writer(csv_file)
+        for i in range(rows):
+            start = open_time + i * 60000
+            writer.writerow([start, 49000.1, 49010.2, 48990.3, 49005.4, 12.5, start + 59999, 0, 10, 0, 0, 0])
+    return file_name
+
+
+def write_statement(csv_dir: str, rows: int) -> str:
+    file_path = path.join(csv_dir, "statement.csv")
+    with open(file_path, mode="w", encoding="utf-8", newline="") as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(["UTC_Time", "Operation", "Coin", "Amount", "Investment", "Wallet"])
+        for i in range(rows):
+            writer.writerow([f"2021-03-19 22:{(i // 60) % 60:02d}:{i % 60:02d}", "Deposit", "BTC", i, 10, "BINANCE"])
+    return file_path
+
+
+def run_mode(mode: str, csv_dir: str, kline_file: str, statement: str, queue: multiprocessing.Queue) -> None:
+    conn = sqlite3.connect(":memory:")
+    with open(HISTORY_SQL, encoding="utf-8") as sql_file:
+        conn.executescript(sql_file.read())
+    conn.execute("INSERT INTO history_index(id, file_name) VALUES(1, ?)", (kline_file,))
+    sql_str = "INSERT INTO history VALUES(?, ?, ?, ?, ?, ?, ?, ?)"
+    history = load_hist_file(csv_dir, kline_file, 1)
+    if mode == "list":
+        conn.executemany(sql_str, list(history))
+        lines = len(list(process_raw_data(statement)))
+    else:
+        conn.executemany(sql_str, history)
+        lines = sum(len(chunk) for chunk in chunked(process_raw_data(statement), 5000))
+    conn.commit()
+    rows = conn.execute("SELECT COUNT(*) FROM history").fetchone()[0]
+    queue.put((rows, lines, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare peak RSS of list vs streamed CSV loading.")
+    parser.add_argument("--rows", type=int, default=500000, help="Rows in the synthetic kline and statement files")
+    args = vars(parser.parse_args())
+
+    ctx = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as csv_dir:
+        kline_file = write_klines(csv_dir, args["rows"])
+        statement = write_statement(csv_dir, args["rows"])
+        for mode in ("list", "stream"):
+            queue = ctx.Queue()
+            process = ctx.Process(target=run_mode, args=(mode, csv_dir, kline_file, statement, queue))
+            process.start()
+            rows, lines, max_rss = queue.get()
+            process.join()
+            print(f"{mode:>6}: {rows} klines, {lines} statement lines, peak RSS {max_rss / 1024:,.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
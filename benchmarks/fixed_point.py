@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+# Float cost basis (the pre fixed-point code, copied below) vs the integer satoshi/cent path, plus a drift check of
+# the bundled statements. Exits with 1 when the fixed-point parse is slower than --min-ratio times float, a replayed
+# leg is a cent or more off the float one, the replay falls below --min-replay-ratio times float or the portfolio
+# total drifts from actual_investment.
+# The replays aren't the same algorithm: float pairs one src with one dest leg, fixed-point is Report.replay with swap
+# groups, FEE legs and the rows kept for the writeback, and runs at about 0.5x float. Its gate is matching float to the
+# cent, the speed floor only catches a regression. Timings are the best of --repeat runs taken in turns with float
+# usage: ./benchmarks/fixed_point.py --rows 200000
+
+import io
+import sys
+import logging
+import argparse
+from contextlib import redirect_stdout
+from os import path
+from types import SimpleNamespace
+from typing import Any
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+# pylint: disable=wrong-import-position
+from tools.db import Actions, Portfolio
+from tools.fixed import AMOUNT_DECIMALS, INVESTMENT_DECIMALS, from_cents, parse_units, to_cents
+from tools.report import Report
+from benchmarks.harness import exit_with, race, replay_report
+from benchmarks.synthetic import generate_actions
+
+ROOT_DIR = path.dirname(path.dirname(path.abspath(__file__)))
+STATEMENTS = (
+    path.join(ROOT_DIR, "data", "csv", "best-binance.csv"),
+    path.join(ROOT_DIR, "data", "csv", "test-data.csv"),
+)
+
+
+def float_replay(rows: list[SimpleNamespace]) -> dict[Any, float]:
+    track: dict[str, dict[str, float]] = {}
+    investments: dict[Any, float] = {}
+    swap: dict[str, SimpleNamespace] = {}
+    for data in rows:
+        if data.coin not in track:
+            track[data.coin] = {"amount": 0.0, "investment": 0.0}
+        if data.action_type in ["DEPOSIT", "WITHDRAW", "ADJUSTMENT"]:
+            track[data.coin]["investment"] += data.investment
+            track[data.coin]["amount"] += data.amount
+        elif data.action_type in ["FEE", "INTEREST", "MINING", "TRANSFER"]:
+            track[data.coin]["amount"] += data.amount
+        elif data.action_type == "SWAP":
+            if swap and swap[next(iter(swap))].action_id != data.action_id:
+                swap = {}
+            swap["dest" if data.amount > 0 else "src"] = data
+            if "src" in swap and "dest" in swap:
+                src, dest = track[swap["src"].coin], track[swap["dest"].coin]
+                src["amount"] = round(src["amount"], 8) + round(swap["src"].amount, 8)
+                dest["amount"] = dest["amount"] + swap["dest"].amount
+                swapped = swap["src"].amount * -1
+                if src["amount"] < swapped:
+                    percentage = 1.0
+                elif src["amount"] > 0.0:
+                    percentage = swapped / src["amount"]
+                else:
+                    percentage = 0.0
+                track_investment = round(src["investment"] * percentage, 2)
+                src["investment"] -= track_investment
+                dest["investment"] += track_investment
+                investments[swap["src"].id] = track_investment * -1
+                investments[swap["dest"].id] = track_investment
+    return investments
+
+
+def fixed_replay(rows: list[SimpleNamespace]) -> dict[Any, int]:
+    return replay_report(rows).investments
+
+
+def benchmark(rows: int, repeat: int, min_ratio: float, min_replay_ratio: float) -> list[str]:
+    actions = [SimpleNamespace(**action._asdict()) for action in generate_actions(rows)]
+    amounts = [f"{action.amount:.8f}" for action in actions]
+    investments = [f"{action.investment:.2f}" for action in actions]
+
+    float_parse, fixed_parse, _, _ = race(
+        repeat,
+        lambda: [(round(float(a), 8), round(float(i), 2)) for a, i in zip(amounts, investments)],
+        lambda: [
+            (parse_units(a, AMOUNT_DECIMALS), parse_units(i, INVESTMENT_DECIMALS)) for a, i in zip(amounts, investments)
+        ],
+    )
+    float_time, fixed_time, float_result, fixed_result = race(
+        repeat, lambda: float_replay(actions), lambda: fixed_replay(actions)
+    )
+    off = sum(1 for row_id, cents in fixed_result.items() if to_cents(float_result[row_id]) != cents)
+
+    print(f"rows:          {len(actions):,}")
+    print(f"parse float:   {float_parse:.3f}s ({len(actions) / float_parse:,.0f} rows/s)")
+    print(f"parse fixed:   {fixed_parse:.3f}s ({len(actions) / fixed_parse:,.0f} rows/s)")
+    print(f"replay float:  {float_time:.3f}s ({len(actions) / float_time:,.0f} rows/s)")
+    print(f"replay fixed:  {fixed_time:.3f}s ({len(actions) / fixed_time:,.0f} rows/s)")
+    print(f"legs off by at least a cent: {off:,} of {len(fixed_result):,}")
+
+    failures = [f"{off:,} replayed legs are a cent or more off float"] if off else []
+    return failures + check_speed(
+        {"parse": (float_parse, fixed_parse, min_ratio), "replay": (float_time, fixed_time, min_replay_ratio)}
+    )
+
+
+def check_speed(timings: dict[str, tuple[float, float, float]]) -> list[str]:
+    # the speed of the fixed-point stage over float's against the least it is allowed
+    failures = []
+    for stage, (float_seconds, fixed_seconds, min_ratio) in timings.items():
+        ratio = float_seconds / fixed_seconds
+        if ratio < min_ratio:
+            failures.append(f"{stage} fixed runs at {ratio:.2f}x float, at least {min_ratio:.2f}x expected")
+    return failures
+
+
+class Warnings(logging.Handler):
+    def __init__(self) -> None:
+        super().__init__(logging.WARNING)
+        self.messages: list[str] = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.messages.append(record.getMessage())
+
+
+def check_drift(statement: str) -> list[str]:
+    name = path.basename(statement)
+    report = Report(database_url="sqlite://")
+    handler = Warnings()
+    report.logger.addHandler(handler)
+    report.load_raw_statement(statement)
+    report.process()
+    portfolio = report.conn.query(Portfolio).all()
+    actual_investment = report.get_actual_investment()
+    with redirect_stdout(io.StringIO()):
+        report.render_portfolio(portfolio, {item.coin: 1.0 for item in portfolio}, actual_investment)
+
+    # the exact figures are summed in cents straight from the actions table
+    coins: dict[str, int] = {}
+    actual = 0
+    swaps: dict[Any, int] = {}
+    for row in report.conn.query(Actions):
+        coins[row.coin] = coins.get(row.coin, 0) + to_cents(row.investment)
+        if row.action_type in ("DEPOSIT", "WITHDRAW"):
+            actual += to_cents(row.investment)
+        elif row.action_type in ("SWAP", "FEE"):
+            # the fees of a swap hand their investment to the bought coin
+            swaps[row.action_id] = swaps.get(row.action_id, 0) + to_cents(row.investment)
+    report.close()
+
+    failures = [f"{name}: swap {action_id} creates {cents} cents" for action_id, cents in swaps.items() if cents]
+    failures += [
+        f"{name}: {item.coin} investment {item.investment} drifts from {from_cents(coins[item.coin])}"
+        for item in portfolio
+        if to_cents(item.investment) != coins[item.coin]
+    ]
+    if to_cents(actual_investment) != actual:
+        failures.append(f"{name}: actual investment {actual_investment} drifts from {from_cents(actual)}")
+    # @INFO: investment left on coins that are no longer held is a real difference and keeps its warning
+    left = actual - sum(coins[item.coin] for item in portfolio)
+    for message in handler.messages:
+        if "are different" in message and not message.endswith(f" {from_cents(left)}"):
+            failures.append(f"{name}: {message}")
+    print(f"{name}: {len(portfolio)} coins, {from_cents(left):,.2f} not held in the portfolio")
+    return failures
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.ERROR)
+    parser = argparse.ArgumentParser(description="Benchmark the fixed-point cost basis and check portfolio drift.")
+    parser.add_argument("--rows", type=int, default=200000, help="Number of synthetic actions")
+    parser.add_argument("--statements", nargs="+", default=STATEMENTS, help="Statements checked for drift")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs of every timing, the fastest is kept")
+    parser.add_argument(
+        "--min-ratio", type=float, default=1.0, help="Speed the fixed-point parse needs relative to float"
+    )
+    parser.add_argument(
+        "--min-replay-ratio", type=float, default=0.3, help="Speed the fixed-point replay needs relative to float"
+    )
+    args = vars(parser.parse_args())
+
+    failures = benchmark(args["rows"], args["repeat"], args["min_ratio"], args["min_replay_ratio"])
+    failures += [failure for statement in args["statements"] for failure in check_drift(statement)]
+    exit_with(failures)
+
+
+if __name__ == "__main__":
+    main()
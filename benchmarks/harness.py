@@ -0,0 +1,47 @@
+import gc
+import sys
+import time
+import logging
+from typing import Any, Callable, Iterable
+
+from tools.report import Report
+from tools.tracker import Tracker
+
+
+def replay_report(rows: Iterable[Any]) -> Report:
+    # @INFO: a Report without a database, only what replay() touches. rows are the actions as any object with their
+    # columns as attributes, the benchmarks hand over SimpleNamespace rows
+    report = Report.__new__(Report)
+    report.investments = {}
+    report.stored_investments = {}
+    report.logger = logging.getLogger("REPORT")
+    report.track = Tracker()
+    report.replay(rows)
+    return report
+
+
+def timed(func: Callable[..., Any], *args: Any) -> tuple[float, Any]:
+    gc.collect()
+    gc.disable()
+    start = time.perf_counter()
+    result = func(*args)
+    seconds = time.perf_counter() - start
+    gc.enable()
+    return seconds, result
+
+
+def race(repeat: int, first: Callable[[], Any], second: Callable[[], Any]) -> tuple[float, float, Any, Any]:
+    # the fastest of repeat runs of each, taken in turns so both see the same load on the machine
+    runs = [(timed(first), timed(second)) for _ in range(repeat)]
+    return (
+        min(first_run[0] for first_run, _ in runs),
+        min(second_run[0] for _, second_run in runs),
+        runs[0][0][1],
+        runs[0][1][1],
+    )
+
+
+def exit_with(failures: list[str]) -> None:
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
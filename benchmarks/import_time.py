@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# Cold start budget of run.py measured with `python -X importtime`, exits with 1 when a budget is exceeded.
+# usage: ./benchmarks/import_time.py --budget-ms 50
+
+import sys
+import argparse
+import subprocess
+from os import path
+
+ROOT_DIR = path.dirname(path.dirname(path.abspath(__file__)))
+RUN_PY = path.join(ROOT_DIR, "run.py")
+
+# command line -> modules it must not import
+SCENARIOS = {
+    "--help": ("sqlalchemy", "requests", "numpy", "psycopg2", "prettytable", "tools.report", "tools.collect"),
+    "ingest --help": ("sqlalchemy", "requests", "numpy", "psycopg2"),
+    "import-history --help": ("sqlalchemy", "requests", "numpy"),
+}
+# module -> modules it must not import, these are what the commands load once they run
+MODULES = {
+    "tools.report": ("numpy", "requests"),
+    "tools.readers": ("sqlalchemy", "numpy", "requests"),
+    "tools": ("sqlalchemy", "numpy", "requests"),
+}
+
+
+def parse_importtime(stderr: str) -> dict[str, int]:
+    # "import time: self [us] | cumulative | imported package", nested imports are indented. Interpreter start up
+    # ends with site, the top level imports after it are the ones of the script alone
+    imports: dict[str, int] = {"<total>": 0, "<script>": 0}
+    started = False
+    for line in stderr.splitlines():
+        if line.startswith("import time:") and not line.endswith("imported package"):
+            _, cumulative, name = line[len("import time:") :].split("|")
+            imports[name.strip()] = imports.get(name.strip(), 0) + int(cumulative)
+            if not name.startswith("  "):
+                imports["<total>"] += int(cumulative)
+                imports["<script>"] += int(cumulative) if started else 0
+                started = started or name.strip() == "site"
+    return imports
+
+
+def measure(command: list[str]) -> dict[str, int]:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", *command], cwd=ROOT_DIR, capture_output=True, text=True, check=False
+    )
+    return parse_importtime(result.stderr)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Check the import time budget of run.py.")
+    parser.add_argument(
+        "--budget-ms", type=float, default=50.0, help="Import time 'run.py --help' may add to the bare interpreter"
+    )
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per scenario, the fastest one is kept")
+    args = vars(parser.parse_args())
+
+    failures = []
+    baseline = min(measure(["-c", "pass"])["<total>"] for _ in range(args["repeat"]))
+    print(f"{'interpreter':>28}: {baseline / 1000:8.1f} ms")
+    for scenario, forbidden in SCENARIOS.items():
+        runs = [measure([RUN_PY, *scenario.split()]) for _ in range(args["repeat"])]
+        best = min(runs, key=lambda imports: imports["<script>"])
+        overhead = best["<script>"] / 1000
+        print(f"{'run.py ' + scenario:>28}: {best['<total>'] / 1000:8.1f} ms, {overhead:.1f} ms of it run.py")
+        failures += [f"'run.py {scenario}' imports {module}" for module in forbidden if module in best]
+        if scenario == "--help" and overhead > args["budget_ms"]:
+            failures.append(f"'run.py --help' adds {overhead:.1f} ms, budget {args['budget_ms']} ms")
+
+    for module, forbidden in MODULES.items():
+        imports = min((measure(["-c", f"import {module}"]) for _ in range(args["repeat"])), key=lambda i: i["<total>"])
+        print(f"{'import ' + module:>28}: {imports['<total>'] / 1000:8.1f} ms")
+        failures += [f"'import {module}' imports {name}" for name in forbidden if name in imports]
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
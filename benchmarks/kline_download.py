@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+# download-history against a local stub of data.binance.vision serving zipped synthetic kline months: a bad checksum
+# and an unpublished month are retried by the next run, a run interrupted halfway is resumed, a run without a start
+# month fills the gaps of every pair, and the history ends the same as import-history of the extracted CSV files.
+# Then sequential vs concurrent downloads with latency.
+# Exits with 1 when a check fails.
+# usage: ./benchmarks/kline_download.py --pairs 3 --months 2 --latency 2.0
+
+import io
+import sys
+import time
+import hashlib
+import logging
+import argparse
+import tempfile
+import zipfile
+from datetime import datetime
+from os import path, makedirs
+from typing import Any, Callable
+from urllib.parse import ParseResult
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+# pylint: disable=wrong-import-position
+from tools.collect import Collect
+from tools.downloader import KLINES_PATH, KlineMonth
+from benchmarks.harness import exit_with
+from benchmarks.stub_server import Response, StubServer
+from benchmarks.synthetic import COINS, write_klines
+
+HISTORY_SQL = path.join(path.dirname(path.dirname(path.abspath(__file__))), "data", "history.sql")
+QUOTE_COIN = "BUSD"
+YEAR = 2021
+
+
+class KlineStubServer(StubServer):
+    # answers /data/spot/monthly/klines/<pair>/1m/<name>.zip and its .CHECKSUM like data.binance.vision does
+    def __init__(self, latency: float = 0.0) -> None:
+        super().__init__(latency)
+        self.files: dict[str, bytes] = {}
+        self.checksums: dict[str, str] = {}
+
+    def add_month(self, csv_file: str, kline_month: KlineMonth) -> None:
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, mode="w", compression=zipfile.ZIP_DEFLATED) as zip_file:
+            zip_file.write(csv_file, kline_month.file_name)
+        url_path = f"/{KLINES_PATH}/{kline_month.pair}/1m/{kline_month.name}.zip"
+        self.files[url_path] = buffer.getvalue()
+        self.checksums[url_path] = f"{hashlib.sha256(buffer.getvalue()).hexdigest()}  {kline_month.name}.zip\n"
+
+    def handle(self, url: ParseResult) -> Response:
+        url_path = url.path
+        if url_path in self.files:
+            return 200, "application/zip", self.files[url_path]
+        if url_path.endswith(".CHECKSUM") and url_path[: -len(".CHECKSUM")] in self.checksums:
+            return 200, "text/plain", self.checksums[url_path[: -len(".CHECKSUM")]].encode()
+        return 404, "text/plain", b""
+
+    def zip_requests(self) -> list[str]:
+        return [request for request in self.requests if request.endswith(".zip")]
+
+
+class Interrupted(Exception):
+    pass
+
+
+def get_history(history_db: str) -> list[tuple[Any, ...]]:
+    collect = Collect(history_db)
+    rows = collect.query("SELECT open_time, pair, close_time, open, high, low, close FROM history ORDER BY 1, 2;", {})
+    collect.close_db()
+    return rows
+
+
+def download(history_db: str, server: KlineStubServer, pairs: list[str], months: int, workers: int) -> str | None:
+    collect = Collect(history_db)
+    error = None
+    try:
+        collect.download_history(pairs, datetime(YEAR, 3, 1), datetime(YEAR, 2 + months, 1), server.url, workers)
+    except Exception as err:  # pylint: disable=broad-except
+        error = str(err)
+    collect.close_db()
+    return error
+
+
+def interrupted_download(history_db: str, server: KlineStubServer, pairs: list[str], months: int) -> int:
+    # the writer stops halfway like a Ctrl+C would, returns the months imported before that
+    collect = Collect(history_db)
+    write_history_zip = collect.write_history_zip
+    imported: list[KlineMonth] = []
+
+    def stop_halfway(kline_month: KlineMonth, data: bytes) -> None:
+        if len(imported) == len(pairs) * months // 2:
+            raise Interrupted()
+        write_history_zip(kline_month, data)
+        imported.append(kline_month)
+
+    collect.write_history_zip = stop_halfway  # type: ignore[method-assign]
+    try:
+        collect.download_history(pairs, datetime(YEAR, 3, 1), datetime(YEAR, 2 + months, 1), server.url, 2)
+    except Interrupted:
+        pass
+    collect.close_db()
+    return len(imported)
+
+
+def check_default_start(
+    history_db: str, server: KlineStubServer, pairs: list[str], months: int, expected: list[tuple[Any, ...]]
+) -> list[str]:
+    # uneven coverage: the first pair holds only its last month and the second only its first one, without a start
+    # month every missing month of every pair is fetched
+    collect = Collect(history_db)
+    last_month = datetime(YEAR, 2 + months, 1)
+    collect.download_history(pairs[:1], last_month, last_month, server.url, 1)
+    collect.download_history(pairs[1:2], datetime(YEAR, 3, 1), datetime(YEAR, 3, 1), server.url, 1)
+    missing = len(pairs) * months - len(collect.get_history_files())
+    server.requests.clear()
+    collect.download_history(pairs, end=last_month, base_url=server.url)
+    collect.close_db()
+    failures = []
+    if len(server.zip_requests()) != missing:
+        failures.append(f"without a start month {len(server.zip_requests())} months were fetched, not {missing}")
+    if get_history(history_db) != expected:
+        failures.append("the download without a start month differs from import-history")
+    return failures
+
+
+def new_history(history_db: str) -> str:
+    collect = Collect(history_db)
+    collect.reset_db(HISTORY_SQL)
+    collect.close_db()
+    return history_db
+
+
+def timed(func: Callable[..., Any], *args: Any) -> tuple[float, Any]:
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.CRITICAL)
+    parser = argparse.ArgumentParser(description="Check and benchmark the kline downloader against a local stub.")
+    parser.add_argument("--pairs", type=int, default=3, help="Pairs served by the stub")
+    parser.add_argument("--months", type=int, default=2, help="Months served for every pair, from March")
+    parser.add_argument("--latency", type=float, default=2.0, help="Seconds the stub waits before every answer")
+    parser.add_argument("--workers", type=int, default=8, help="Concurrent downloads")
+    args = vars(parser.parse_args())
+
+    failures = []
+    coins = [coin for coin in COINS if coin != QUOTE_COIN][: args["pairs"]]
+    pairs = [f"{coin}{QUOTE_COIN}" for coin in coins]
+    total = len(pairs) * args["months"]
+    server = KlineStubServer()
+    server.start()
+    with tempfile.TemporaryDirectory() as workspace:
+        csv_dir = path.join(workspace, "csv")
+        makedirs(csv_dir)
+        for coin in coins:
+            for month in range(3, 3 + args["months"]):
+                csv_file = path.join(csv_dir, write_klines(csv_dir, coin, QUOTE_COIN, YEAR, month))
+                server.add_month(csv_file, KlineMonth(f"{coin}{QUOTE_COIN}", YEAR, month))
+        expected_db = new_history(path.join(workspace, "expected.db"))
+        collect = Collect(expected_db)
+        collect.save_history(csv_dir, 1)
+        collect.close_db()
+        expected = get_history(expected_db)
+
+        # a month with a bad checksum and one that isn't published yet, both are retried by the next run
+        url_paths = list(server.files)
+        bad_path, missing_path = url_paths[0], url_paths[1]
+        good_checksum = server.checksums[bad_path]
+        server.checksums[bad_path] = f"{'0' * 64}  bad.zip\n"
+        missing_file = server.files.pop(missing_path)
+        history_db = new_history(path.join(workspace, "history.db"))
+        error = download(history_db, server, pairs, args["months"], args["workers"])
+        if not error or "1 kline months failed" not in error:
+            failures.append(f"the bad checksum wasn't reported: {error}")
+        server.checksums[bad_path] = good_checksum
+        server.files[missing_path] = missing_file
+        server.requests.clear()
+        error = download(history_db, server, pairs, args["months"], args["workers"])
+        if error or sorted(server.zip_requests()) != sorted((bad_path, missing_path)):
+            failures.append(f"the second run fetched {server.zip_requests()} ({error})")
+        if get_history(history_db) != expected:
+            failures.append("the retried download differs from import-history")
+
+        history_db = new_history(path.join(workspace, "interrupted.db"))
+        imported = interrupted_download(history_db, server, pairs, args["months"])
+        server.requests.clear()
+        error = download(history_db, server, pairs, args["months"], args["workers"])
+        if error or len(server.zip_requests()) != total - imported:
+            failures.append(f"resuming fetched {len(server.zip_requests())} months, not {total - imported} ({error})")
+        if get_history(history_db) != expected:
+            failures.append("the resumed download differs from import-history")
+        failures += check_default_start(
+            new_history(path.join(workspace, "uneven.db")), server, pairs, args["months"], expected
+        )
+        print(f"months:     {total} of {len(expected) // total:,} klines, {imported} before the interruption")
+
+        server.latency = args["latency"]
+        for workers in (1, args["workers"]):
+            history_db = new_history(path.join(workspace, f"workers-{workers}.db"))
+            seconds, error = timed(download, history_db, server, pairs, args["months"], workers)
+            print(f"{f'{workers} workers:':<12}{seconds:.3f}s ({total / seconds:,.1f} months/s)")
+            if error or get_history(history_db) != expected:
+                failures.append(f"the download with {workers} workers differs from import-history ({error})")
+    server.stop()
+    exit_with(failures)
+
+
+if __name__ == "__main__":
+    main()
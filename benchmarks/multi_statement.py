@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# Several overlapping statements of one ledger, like monthly exports that repeat the edges of the month: loaded one
+# after the other as before, then parsed serially and by worker processes and merged before a single insert.
+# Exits with 1 when the loads end with different actions or the summary drifts.
+# usage: ./benchmarks/multi_statement.py --rows 1000000 --statements 12 --overlap 0.1 --workers 4
+
+import csv
+import sys
+import time
+import logging
+import argparse
+import tempfile
+from os import path
+from typing import Any, Callable
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+# pylint: disable=wrong-import-position
+from tools.db import Actions
+from tools.report import Report
+from benchmarks.harness import exit_with
+from benchmarks.synthetic import STATEMENT_HEADER, write_statement
+
+
+def split_statement(workspace: str, statement: str, statements: int, overlap: float) -> list[str]:
+    # consecutive windows of the statement, every one also repeats a share of the rows of the next one
+    with open(statement, encoding="utf-8", newline="") as csv_file:
+        lines = list(csv.reader(csv_file))[1:]
+    size = -(-len(lines) // statements)
+    extra = int(size * overlap)
+    file_list = []
+    for idx in range(statements):
+        file_path = path.join(workspace, f"statement-{idx:02d}.csv")
+        with open(file_path, mode="w", encoding="utf-8", newline="") as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(STATEMENT_HEADER)
+            writer.writerows(lines[idx * size : (idx + 1) * size + extra])
+        file_list.append(file_path)
+    return file_list
+
+
+def timed(func: Callable[[], Any]) -> tuple[float, Any]:
+    start = time.perf_counter()
+    result = func()
+    return time.perf_counter() - start, result
+
+
+def one_by_one(report: Report, file_list: list[str]) -> tuple[int, int]:
+    inserted = 0
+    skipped = 0
+    for statement in file_list:
+        statement_inserted, statement_skipped = report.load_raw_statement(statement)
+        inserted += statement_inserted
+        skipped += statement_skipped
+    return inserted, skipped
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.ERROR)
+    parser = argparse.ArgumentParser(description="Benchmark loading several overlapping statements.")
+    parser.add_argument("--rows", type=int, default=1000000, help="Rows in the synthetic ledger")
+    parser.add_argument("--statements", type=int, default=12, help="Statements the ledger is split into")
+    parser.add_argument("--overlap", type=float, default=0.1, help="Share of the next statement repeated by each one")
+    parser.add_argument("--workers", type=int, default=4, help="Processes parsing the statements")
+    args = vars(parser.parse_args())
+
+    failures = []
+    with tempfile.TemporaryDirectory() as workspace:
+        statement = write_statement(path.join(workspace, "statement.csv"), args["rows"])
+        file_list = split_statement(workspace, statement, args["statements"], args["overlap"])
+        loads: dict[str, Callable[[Report], tuple[int, int]]] = {
+            "one by one": lambda report: one_by_one(report, file_list),
+            "serial": lambda report: report.load_raw_statements(file_list, workers=1),
+            "parallel": lambda report: report.load_raw_statements(file_list, workers=args["workers"]),
+        }
+        actions = {}
+        print(f"rows:       {args['rows']:,} in {len(file_list)} statements")
+        for name, load in loads.items():
+            report = Report(database_url=f"sqlite:///{path.join(workspace, name.replace(' ', '-'))}.db")
+            report.storage.create_schema()
+            seconds, (inserted, skipped) = timed(lambda: load(report))  # pylint: disable=cell-var-from-loop
+            print(f"{name + ':':<12}{seconds:.3f}s, {inserted:,} rows inserted, {skipped:,} rows skipped")
+            actions[name] = {row.id for row in report.conn.query(Actions.id)}
+            if len(actions[name]) != inserted:
+                failures.append(f"{name}: {inserted} rows inserted but {len(actions[name])} in actions")
+            failures += [f"{name}: summary {difference}" for difference in report.verify_summary()]
+            report.close()
+        if len({frozenset(ids) for ids in actions.values()}) != 1:
+            failures.append("the loads end with different actions")
+    exit_with(failures)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+# Access path of the replay query: EXPLAIN checks that the queries on actions use the indexes of data/migrations/,
+# then full and incremental replays with and without them, and the old load of whole Actions objects.
+# usage: ./benchmarks/replay_query.py --rows 1000000
+#        ./benchmarks/replay_query.py --plans-only --database-url postgresql+psycopg2://juanpa:@localhost/report
+
+import gc
+import sys
+import time
+import logging
+import argparse
+import tempfile
+import tracemalloc
+from datetime import datetime
+from os import path
+from typing import Any, Callable
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+# pylint: disable=wrong-import-position
+from sqlalchemy import func
+from sqlalchemy.orm import Query
+
+from tools.db import Actions, Replay_Checkpoint
+from tools.report import Report
+from tools.tracker import Tracker
+from benchmarks.synthetic import write_statement
+
+INDEXES = ("actions_utc_date_action_id_idx", "actions_coin_action_type_idx")
+# the migrations that build INDEXES, they run again to put them back
+INDEX_MIGRATIONS = ("001_actions_indexes.sql", "005_actions_replay_order.sql")
+
+
+def explain(report: Report, query: Query) -> str:
+    compiled = query.statement.compile(dialect=report.storage.engine.dialect)
+    sqlite = report.storage.engine.dialect.name == "sqlite"
+    params: Any
+    if sqlite:
+        # sqlite3 no longer adapts datetime on its own
+        params = tuple(
+            value.isoformat(" ") if isinstance(value, datetime) else value
+            for value in map(compiled.params.__getitem__, compiled.positiontup)
+        )
+    else:
+        params = compiled.params
+    cursor = report.storage.engine.raw_connection().cursor()
+    cursor.execute(f"{'EXPLAIN QUERY PLAN' if sqlite else 'EXPLAIN'} {compiled}", params)
+    plan = "\n".join(str(row[-1]) for row in cursor.fetchall())
+    cursor.close()
+    return plan
+
+
+def check_plans(report: Report) -> bool:
+    # @INFO: SQLite picks its plan from the schema alone, PostgreSQL also looks at the table statistics and may
+    # rightly prefer a sequential scan on a small table, so there the plans are only printed
+    last_date = report.conn.query(func.max(Actions.utc_date)).scalar()
+    checkpoint = Replay_Checkpoint(id=1, utc_date=last_date)
+    queries = {
+        "replay": (report.get_replay_query(), INDEXES[0]),
+        "incremental replay": (report.get_replay_query(checkpoint), INDEXES[0]),
+        "existing ids": (
+            report.conn.query(Actions.id).filter(Actions.utc_date.between(last_date, last_date)),
+            INDEXES[0],
+        ),
+        "summary": (
+            report.conn.query(Actions.coin, Actions.action_type, func.sum(Actions.amount)).group_by(
+                Actions.coin, Actions.action_type
+            ),
+            INDEXES[1],
+        ),
+    }
+    sqlite = report.storage.engine.dialect.name == "sqlite"
+    passed = True
+    for name, (query, index) in queries.items():
+        plan = explain(report, query)
+        ok = not sqlite or (index in plan and "TEMP B-TREE" not in plan)
+        passed = passed and ok
+        print(f"{'ok' if ok else 'FAIL':<5}{name}: {' | '.join(plan.splitlines())}")
+    return passed
+
+
+def drop_indexes(report: Report) -> None:
+    raw_conn = report.storage.engine.raw_connection()
+    cursor = raw_conn.cursor()
+    for index in INDEXES:
+        cursor.execute(f"DROP INDEX IF EXISTS {index};", ())
+    for migration in INDEX_MIGRATIONS:
+        cursor.execute(f"DELETE FROM schema_migrations WHERE name = '{migration}';", ())
+    raw_conn.commit()
+    raw_conn.close()
+
+
+def orm_replay(report: Report) -> Any:
+    # Report.process as it was: whole Actions objects, sorted by utc_date and loaded in one list
+    report.investments = {}
+    report.stored_investments = {}
+    report.track = Tracker()
+    rows = report.conn.query(Actions).order_by(Actions.utc_date).all()
+    report.replay(rows)
+    report.conn.expunge_all()
+    return report.track
+
+
+def column_replay(report: Report, checkpoint: Replay_Checkpoint | None = None) -> Any:
+    report.investments = {}
+    report.stored_investments = {}
+    report.track = Tracker()
+    report.replay(report.get_replay_query(checkpoint).yield_per(report.REPLAY_BATCH_SIZE))
+    return report.track
+
+
+def timed(replay: Callable[[], Any]) -> tuple[float, Any]:
+    gc.collect()
+    start = time.perf_counter()
+    result = replay()
+    return time.perf_counter() - start, result
+
+
+def peak(replay: Callable[[], Any]) -> int:
+    gc.collect()
+    tracemalloc.start()
+    replay()
+    _, size = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.ERROR)
+    parser = argparse.ArgumentParser(description="Check and time the access path of the replay query.")
+    parser.add_argument("--rows", type=int, default=1000000, help="Rows in the synthetic ledger")
+    parser.add_argument("--database-url", default=None, help="Database to use, a temporary sqlite file by default")
+    parser.add_argument("--plans-only", action="store_true", help="Only check the plans of an existing database")
+    args = vars(parser.parse_args())
+
+    with tempfile.TemporaryDirectory() as workspace:
+        database_url = args["database_url"] or f"sqlite:///{path.join(workspace, 'replay.db')}"
+        report = Report(database_url=database_url)
+        if args["plans_only"]:
+            report.storage.migrate()
+            passed = check_plans(report)
+            report.close()
+            sys.exit(0 if passed else 1)
+
+        report.storage.create_schema()
+        statement = write_statement(path.join(workspace, "statement.csv"), args["rows"])
+        report.load_raw_statement(statement)
+        print(f"rows: {args['rows']:,}")
+        plans_passed = check_plans(report)
+
+        # @INFO: the incremental replay picks up the last tenth of the ledger, the usual case after an ingest
+        utc_dates = report.conn.query(Actions.utc_date).order_by(Actions.utc_date)
+        checkpoint = Replay_Checkpoint(id=1, utc_date=utc_dates.offset(args["rows"] * 9 // 10).limit(1).scalar())
+        identical = True
+        for indexed in (True, False):
+            if not indexed:
+                drop_indexes(report)
+            label = "indexes" if indexed else "no indexes"
+            orm_time, orm_track = timed(lambda: orm_replay(report))
+            column_time, column_track = timed(lambda: column_replay(report))
+            tail_time, _ = timed(lambda: column_replay(report, checkpoint))  # pylint: disable=cell-var-from-loop
+            print(f"{label + ':':<12} objects {orm_time:.3f}s, columns {column_time:.3f}s, last tenth {tail_time:.3f}s")
+            identical = identical and orm_track == column_track
+        orm_peak = peak(lambda: orm_replay(report))
+        column_peak = peak(lambda: column_replay(report))
+        print(f"peak memory: objects {orm_peak / 2**20:,.1f} MiB, columns {column_peak / 2**20:,.1f} MiB")
+        report.storage.migrate()
+        print(f"identical:   {identical}")
+        report.close()
+        sys.exit(0 if plans_passed and identical else 1)
+
+
+if __name__ == "__main__":
+    main()
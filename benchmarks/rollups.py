@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+# History rollups: synthetic kline months imported one month at a time must leave the same 1h and 1d rollups as a
+# rebuild and as a plain aggregate of the 1m klines, then a daily valuation over the whole range at 1m vs the
+# rollup HistoryStore picks, with the rows each one reads.
+# Exits with 1 when a check fails.
+# usage: ./benchmarks/rollups.py --pairs 3 --months 6
+
+import sys
+import time
+import logging
+import argparse
+import tempfile
+from os import path, makedirs
+from typing import Any, Callable
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+# pylint: disable=wrong-import-position
+import numpy as np
+
+from tools.collect import Collect
+from tools.metrics import METRICS
+from tools.rollups import DAY_INTERVAL, HOUR_INTERVAL, RESOLUTIONS, HistoryStore, get_resolution
+from tools.klines import KLINE_INTERVAL
+from benchmarks.harness import exit_with
+from benchmarks.synthetic import COINS, write_klines
+
+HISTORY_SQL = path.join(path.dirname(path.dirname(path.abspath(__file__))), "data", "history.sql")
+QUOTE_COIN = "BUSD"
+YEAR = 2021
+
+
+def get_rollups(collect: Collect) -> dict[str, list[tuple[Any, ...]]]:
+    return {
+        table: collect.query(f"SELECT * FROM {table} ORDER BY pair, open_time;", {})
+        for table, _ in list(RESOLUTIONS.values())[1:]
+    }
+
+
+def expected_rollup(collect: Collect, pair: str, interval: int) -> np.ndarray:
+    # the rollup straight from the 1m klines: open_time, open, high, low, close and klines of every bucket
+    rows = collect.query(
+        "SELECT open_time, open, high, low, close FROM history WHERE pair = :pair ORDER BY open_time;", {"pair": pair}
+    )
+    klines = np.array(rows, dtype=np.float64)
+    buckets = klines[:, 0].astype(np.int64) // interval * interval
+    expected = []
+    for bucket in np.unique(buckets):
+        selected = klines[buckets == bucket]
+        expected.append(
+            (bucket, selected[0, 1], selected[:, 2].max(), selected[:, 3].min(), selected[-1, 4], len(selected))
+        )
+    return np.array(expected, dtype=np.float64)
+
+
+def check_rollups(collect: Collect, pairs: list[str]) -> list[str]:
+    failures = []
+    for table, interval in list(RESOLUTIONS.values())[1:]:
+        for pair in pairs:
+            rows = collect.query(
+                f"SELECT open_time, open, high, low, close, klines FROM {table} WHERE pair = :pair ORDER BY open_time;",
+                {"pair": pair},
+            )
+            stored = np.array(rows, dtype=np.float64)
+            expected = expected_rollup(collect, pair, interval)
+            if stored.shape != expected.shape or not np.allclose(stored, expected, rtol=0, atol=1e-12):
+                failures.append(f"{table} of {pair} differs from the 1m klines")
+    return failures
+
+
+def get_opens(collect: Collect, pair: str, days: np.ndarray) -> list[float]:
+    # open of the 1m kline at every timestamp
+    rows = dict(
+        collect.query(
+            "SELECT open_time, open FROM history WHERE pair = :pair AND open_time BETWEEN :first AND :last;",
+            {"pair": pair, "first": int(days[0]), "last": int(days[-1])},
+        )
+    )
+    return [rows.get(day, np.nan) for day in days.tolist()]
+
+
+def timed(func: Callable[[], Any]) -> tuple[float, Any]:
+    start = time.perf_counter()
+    result = func()
+    return time.perf_counter() - start, result
+
+
+def value_daily(history_db: str, pairs: list[str], days: np.ndarray, precision: int) -> tuple[np.ndarray, int]:
+    METRICS.reset()
+    store = HistoryStore(history_db, precision)
+    prices = np.array([store.get_prices(pair, days) for pair in pairs])
+    store.close()
+    return prices, sum(METRICS.counters.values())
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.ERROR)
+    parser = argparse.ArgumentParser(description="Check and benchmark the history rollups.")
+    parser.add_argument("--pairs", type=int, default=3, help="Pairs in the history")
+    parser.add_argument("--months", type=int, default=6, help="Months of 1m klines for every pair, from January")
+    args = vars(parser.parse_args())
+
+    failures = []
+    resolutions = {1: "1m", KLINE_INTERVAL: "1m", 4 * HOUR_INTERVAL: "1h", 7 * DAY_INTERVAL: "1d"}
+    if any(get_resolution(precision) != resolution for precision, resolution in resolutions.items()):
+        failures.append("get_resolution doesn't pick the coarsest resolution within precision")
+
+    coins = [coin for coin in COINS if coin != QUOTE_COIN][: args["pairs"]]
+    pairs = [f"{coin}{QUOTE_COIN}" for coin in coins]
+    METRICS.enable()
+    with tempfile.TemporaryDirectory() as workspace:
+        csv_dir = path.join(workspace, "csv")
+        makedirs(csv_dir)
+        history_db = path.join(workspace, "history.db")
+        collect = Collect(history_db)
+        collect.reset_db(HISTORY_SQL)
+        import_time = 0.0
+        for month in range(1, args["months"] + 1):
+            for coin in coins:
+                write_klines(csv_dir, coin, QUOTE_COIN, YEAR, month)
+            seconds, _ = timed(lambda: collect.save_history(csv_dir, 1))
+            import_time += seconds
+        rollup_time = sum(METRICS.spans["history.rollups"])
+        klines = collect.query("SELECT COUNT(*) FROM history;", {})[0][0]
+        print(f"klines:     {klines:,} in {args['months'] * len(pairs)} files")
+        print(f"import:     {import_time:.3f}s, {rollup_time:.3f}s of it updating the rollups")
+
+        failures += check_rollups(collect, pairs)
+        incremental = get_rollups(collect)
+        seconds, _ = timed(lambda: collect.update_rollups(rebuild=True))
+        print(f"rebuild:    {seconds:.3f}s")
+        if get_rollups(collect) != incremental:
+            failures.append("the incremental rollups differ from a rebuild")
+        start = np.datetime64(f"{YEAR}-01-01", "ms").astype(np.int64)
+        days = np.arange(start, start + args["months"] * 28 * DAY_INTERVAL, DAY_INTERVAL)
+        opens = np.array([get_opens(collect, pair, days) for pair in pairs])
+        collect.close_db()
+
+        results = {}
+        for resolution, (_, interval) in RESOLUTIONS.items():
+            # pylint: disable-next=cell-var-from-loop
+            seconds, (prices, rows) = timed(lambda: value_daily(history_db, pairs, days, interval))
+            results[resolution] = prices
+            print(
+                f"{resolution + ':':<12}{seconds:.3f}s, {rows:,} rows read for {len(days)} days of {len(pairs)} pairs"
+            )
+            if np.isnan(prices).any():
+                failures.append(f"{resolution} leaves days without a price")
+        # @INFO: a rollup prices a day at its open, which is the open of the 00:00 minute. Nothing after 00:00 may
+        # leak in. At 1m precision the 00:00 minute is priced at its OHLC average, so it differs by that minute alone
+        for resolution in list(RESOLUTIONS)[1:]:
+            if not np.array_equal(results[resolution], opens):
+                failures.append(f"{resolution} doesn't price a day at the open of its 00:00 minute")
+        drift = np.abs(results["1m"] / opens - 1).max()
+        print(f"1m average vs 00:00 open: {drift:.4%} at most")
+    exit_with(failures)
+
+
+if __name__ == "__main__":
+    main()
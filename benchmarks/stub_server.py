@@ -0,0 +1,77 @@
+import json
+import threading
+import time
+from abc import ABC, abstractmethod
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import ParseResult, parse_qs, urlparse
+
+from benchmarks.synthetic import COINS, PRICES
+
+Response = tuple[int, str, bytes]
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args) -> None:  # pylint: disable=arguments-differ
+        pass
+
+    def do_GET(self) -> None:  # pylint: disable=invalid-name
+        url = urlparse(self.path)
+        stub: StubServer = self.server.stub  # type: ignore[attr-defined]
+        stub.requests.append(self.path)
+        if stub.latency:
+            time.sleep(stub.latency)
+        status, content_type, body = stub.handle(url)
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class StubServer(ABC):
+    # @INFO: local HTTP server on a free port, subclasses answer the requests in handle()
+    NOT_FOUND: Response = (404, "application/json", b"{}")
+
+    def __init__(self, latency: float = 0.0) -> None:
+        self.latency = latency
+        self.requests: list[str] = []
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+        self.httpd.stub = self  # type: ignore[attr-defined]
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    @abstractmethod
+    def handle(self, url: ParseResult) -> Response:
+        pass
+
+    def start(self) -> str:
+        self.thread.start()
+        return self.url
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class PriceStubServer(StubServer):
+    # answers /api/v3/ticker/price like Binance does, for a single symbol or a JSON list of them
+    QUOTE_COIN = "BUSD"
+
+    def __init__(self, latency: float = 0.0) -> None:
+        super().__init__(latency)
+        self.prices = {f"{coin}{self.QUOTE_COIN}": price for coin, price in zip(COINS, PRICES)}
+
+    def handle(self, url: ParseResult) -> Response:
+        if url.path != "/api/v3/ticker/price":
+            return self.NOT_FOUND
+
+        query = parse_qs(url.query)
+        symbols = json.loads(query["symbols"][0]) if "symbols" in query else query.get("symbol", [])
+        if not symbols or any(symbol not in self.prices for symbol in symbols):
+            return 400, "application/json", json.dumps({"code": -1121, "msg": "Invalid symbol."}).encode()
+
+        body = [{"symbol": symbol, "price": f"{self.prices[symbol]:.8f}"} for symbol in symbols]
+        return 200, "application/json", json.dumps(body if "symbols" in query else body[0]).encode()
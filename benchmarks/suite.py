@@ -0,0 +1,286 @@
+#!/usr/bin/env python
+# Times the hot paths on synthetic data and writes throughput, latency percentiles and peak RSS to JSON.
+# usage: ./benchmarks/suite.py --rows 1000000 --output before.json
+#        ./benchmarks/suite.py --rows 1000000 --output after.json --compare before.json
+
+import io
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+import multiprocessing
+from contextlib import redirect_stdout
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from os import path, makedirs
+from typing import Any, Callable
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+# pylint: disable=wrong-import-position
+import numpy as np
+from prettytable import PrettyTable
+
+from tools.report import Report
+from tools.collect import Collect
+from tools.prices import save_snapshot
+from benchmarks.stub_server import PriceStubServer
+from benchmarks.synthetic import COINS, PRICES, write_klines, write_statement
+
+ROOT_DIR = path.dirname(path.dirname(path.abspath(__file__)))
+HISTORY_SQL = path.join(ROOT_DIR, "data", "history.sql")
+QUOTE_COIN = "BUSD"
+
+
+def get_commit() -> str:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = "unknown"
+    return commit
+
+
+def get_metrics(seconds: float, items: int, latencies: list[float] | None = None) -> dict[str, Any]:
+    metrics: dict[str, Any] = {
+        "seconds": round(seconds, 6),
+        "items": items,
+        "throughput": round(items / seconds, 2) if seconds else None,
+    }
+    if latencies:
+        p50, p90, p99 = np.percentile(np.array(latencies) * 1000, [50, 90, 99]).tolist()
+        metrics["latency_ms"] = {
+            "p50": round(p50, 4),
+            "p90": round(p90, 4),
+            "p99": round(p99, 4),
+            "max": round(max(latencies) * 1000, 4),
+        }
+    return metrics
+
+
+def timed(func: Callable[[], Any]) -> tuple[float, Any]:
+    start = time.perf_counter()
+    result = func()
+    return time.perf_counter() - start, result
+
+
+def case_ingest(params: dict) -> dict[str, Any]:
+    report = Report(database_url=params["database_url"])
+    report.storage.create_schema()
+    seconds, (inserted, _) = timed(lambda: report.load_raw_statement(params["statement"]))
+    report.close()
+    return get_metrics(seconds, inserted)
+
+
+def run_process(params: dict, vectorised: bool) -> dict[str, Any]:
+    report = Report(database_url=params["database_url"])
+    seconds, investments = timed(lambda: report.process(full=True, vectorised=vectorised))
+    rows = params["rows"]
+    report.close()
+    metrics = get_metrics(seconds, rows)
+    metrics["swap_legs"] = len(investments)
+    return metrics
+
+
+def case_process(params: dict) -> dict[str, Any]:
+    return run_process(params, vectorised=False)
+
+
+def case_process_vectorised(params: dict) -> dict[str, Any]:
+    return run_process(params, vectorised=True)
+
+
+def case_portfolio(params: dict) -> dict[str, Any]:
+    stub = PriceStubServer(latency=params["stub_latency"])
+    # @INFO: the cache is disabled so every call pays for a round trip to the stub
+    report = Report(database_url=params["database_url"], binance_url=stub.start(), price_ttl=0)
+    latencies = []
+    with redirect_stdout(io.StringIO()):
+        for _ in range(params["repeat"]):
+            seconds, _ = timed(report.get_portfolio)
+            latencies.append(seconds)
+    report.close()
+    stub.stop()
+    return get_metrics(sum(latencies), len(latencies), latencies)
+
+
+def case_portfolio_snapshot(params: dict) -> dict[str, Any]:
+    # the portfolio priced from a local snapshot, no network at all
+    save_snapshot(params["price_snapshot"], dict(zip(COINS, PRICES)))
+    report = Report(database_url=params["database_url"], price_snapshot=params["price_snapshot"], offline=True)
+    latencies = []
+    with redirect_stdout(io.StringIO()):
+        for _ in range(params["repeat"]):
+            seconds, _ = timed(report.get_portfolio)
+            latencies.append(seconds)
+    report.close()
+    return get_metrics(sum(latencies), len(latencies), latencies)
+
+
+def case_portfolio_series(params: dict) -> dict[str, Any]:
+    # a year of daily portfolio totals answered from the running-total timeline
+    report = Report(database_url=params["database_url"])
+    with redirect_stdout(io.StringIO()):
+        seconds, rows = timed(lambda: report.get_portfolio_series(datetime(2021, 1, 1), datetime(2021, 12, 31)))
+    report.close()
+    return get_metrics(seconds, len(rows))
+
+
+def case_save_history(params: dict) -> dict[str, Any]:
+    collect = Collect(params["history_db"])
+    collect.reset_db(HISTORY_SQL)
+    seconds, _ = timed(lambda: collect.save_history(params["kline_dir"], params["workers"]))
+    klines = collect.query("SELECT COUNT(*) FROM history;", {})[0][0]
+    collect.close_db()
+    return get_metrics(seconds, klines)
+
+
+def case_price_lookup(params: dict) -> dict[str, Any]:
+    collect = Collect(params["history_db"])
+    collect.load_klines(params["kline_store"], rebuild=True)
+    assert collect.pricing is not None
+    first, last = collect.query("SELECT MIN(open_time), MAX(open_time) FROM history;", {})[0]
+    rng = random.Random(42)
+    coins = [coin for coin in COINS[: params["coins"]] if coin != QUOTE_COIN]
+    samples = [(rng.choice(coins), rng.randrange(first, last)) for _ in range(params["repeat"] * 100)]
+
+    latencies = []
+    get_price = collect.pricing.get_price
+    for coin, open_time in samples:
+        seconds, _ = timed(partial(get_price, coin, open_time))
+        latencies.append(seconds)
+    metrics = get_metrics(sum(latencies), len(latencies), latencies)
+
+    open_times = np.array([open_time for _, open_time in samples], dtype=np.int64)
+    batch_seconds, _ = timed(lambda: [collect.pricing.get_prices(coin, open_times) for coin in coins])  # type: ignore
+    metrics["batch"] = get_metrics(batch_seconds, len(open_times) * len(coins))
+    collect.close_db()
+    return metrics
+
+
+CASES: dict[str, Callable[[dict], dict[str, Any]]] = {
+    "ingest": case_ingest,
+    "process": case_process,
+    "process_vectorised": case_process_vectorised,
+    "portfolio": case_portfolio,
+    "portfolio_snapshot": case_portfolio_snapshot,
+    "portfolio_series": case_portfolio_series,
+    "save_history": case_save_history,
+    "price_lookup": case_price_lookup,
+}
+
+
+def run_case(name: str, params: dict) -> dict[str, Any]:
+    # @INFO: every case runs in its own process so ru_maxrss is the peak of that case alone
+    logging.basicConfig(level=logging.ERROR)
+    metrics = CASES[name](params)
+    metrics["peak_rss_mib"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    return metrics
+
+
+def prepare(params: dict, cases: list[str]) -> None:
+    if "ingest" in cases:
+        write_statement(
+            params["statement"],
+            params["rows"],
+            coins=params["coins"],
+            swap_ratio=params["swap_ratio"],
+            wallets=params["wallets"],
+        )
+    if "save_history" in cases:
+        makedirs(params["kline_dir"], exist_ok=True)
+        for coin in COINS[: params["coins"]]:
+            if coin != QUOTE_COIN:
+                for month in range(1, params["kline_months"] + 1):
+                    write_klines(params["kline_dir"], coin, QUOTE_COIN, 2021, month)
+
+
+def compare(results: dict, baseline_file: str) -> None:
+    with open(baseline_file, encoding="utf-8") as json_file:
+        baseline = json.load(json_file)
+    table = PrettyTable()
+    table.field_names = ["case", "baseline items/s", "current items/s", "speedup", "baseline MiB", "current MiB"]
+    for name, metrics in results["cases"].items():
+        old = baseline["cases"].get(name)
+        if old and old["throughput"] and metrics["throughput"]:
+            table.add_row(
+                [
+                    name,
+                    f"{old['throughput']:,.0f}",
+                    f"{metrics['throughput']:,.0f}",
+                    f"{metrics['throughput'] / old['throughput']:.2f}x",
+                    old["peak_rss_mib"],
+                    metrics["peak_rss_mib"],
+                ]
+            )
+    print(f"{baseline['commit']} -> {results['commit']}")
+    print(table)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark ingest, replay, pricing and rendering.")
+    parser.add_argument("--rows", type=int, default=100000, help="Rows in the synthetic statement")
+    parser.add_argument("--coins", type=int, default=8, help="Number of coins in the synthetic data")
+    parser.add_argument("--wallets", type=int, default=3, help="Number of wallets in the synthetic statement")
+    parser.add_argument("--swap-ratio", type=float, default=0.4, help="Share of rows that start a SWAP")
+    parser.add_argument("--kline-months", type=int, default=1, help="Months of 1m klines per pair")
+    parser.add_argument("--workers", type=int, default=None, help="Workers used by save_history")
+    parser.add_argument("--repeat", type=int, default=20, help="Calls timed for the latency cases")
+    parser.add_argument("--stub-latency", type=float, default=0.0, help="Seconds the price stub waits per request")
+    parser.add_argument("--database-url", default=None, help="Database for the Report cases, sqlite file by default")
+    parser.add_argument("--cases", nargs="+", choices=list(CASES), default=list(CASES), help="Cases to run")
+    parser.add_argument("--workspace", default=None, help="Directory for the generated files, temporary by default")
+    parser.add_argument("--output", default=None, help="JSON file to write, benchmark-<commit>.json by default")
+    parser.add_argument("--compare", default=None, help="JSON file of an earlier run to compare against")
+    args = vars(parser.parse_args())
+
+    commit = get_commit()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        workspace = args["workspace"] or temp_dir
+        makedirs(workspace, exist_ok=True)
+        params = {
+            **{key: args[key] for key in ("rows", "coins", "wallets", "swap_ratio", "kline_months", "workers")},
+            "repeat": args["repeat"],
+            "stub_latency": args["stub_latency"],
+            "database_url": args["database_url"] or f"sqlite:///{path.join(workspace, 'report.db')}",
+            "statement": path.join(workspace, "statement.csv"),
+            "history_db": path.join(workspace, "history.db"),
+            "kline_dir": path.join(workspace, "klines"),
+            "kline_store": path.join(workspace, "kline_store"),
+            "price_snapshot": path.join(workspace, "prices.json"),
+        }
+        prepare(params, args["cases"])
+
+        results: dict[str, Any] = {
+            "commit": commit,
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "params": {key: value for key, value in params.items() if not isinstance(value, str)},
+            "cases": {},
+        }
+        ctx = multiprocessing.get_context("spawn")
+        for name in args["cases"]:
+            with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+                results["cases"][name] = pool.submit(run_case, name, params).result()
+            metrics = results["cases"][name]
+            print(f"{name:>18}: {metrics['seconds']:.3f}s, {metrics['throughput'] or 0:,.0f} items/s")
+
+    output = args["output"] or f"benchmark-{commit}.json"
+    with open(output, mode="w", encoding="utf-8") as json_file:
+        json.dump(results, json_file, indent=2)
+    print(f"results written to {output}")
+    if args["compare"]:
+        compare(results, args["compare"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+# Swap groups: small statements with dust conversions, fees and interleaved trades replayed through the database with
+# the figures they must produce, then the loop and vectorised replays on a synthetic ledger with multi-leg swaps.
+# Exits with 1 when a fixture or the comparison fails.
+# usage: ./benchmarks/swap_groups.py --rows 1000000 --dust-ratio 0.05 --fee-ratio 0.3
+
+import csv
+import sys
+import logging
+import argparse
+import tempfile
+from os import path
+from types import SimpleNamespace
+from typing import Any
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+# pylint: disable=wrong-import-position
+from tools.db import Actions
+from tools.engine import build_ledger, replay_ledger
+from tools.fixed import to_cents
+from tools.report import Report
+from benchmarks.harness import exit_with, replay_report, timed
+from benchmarks.synthetic import STATEMENT_HEADER, generate_actions
+
+DEPOSIT_TIME = "2021-05-01 10:00:00"
+SWAP_TIME = "2021-05-02 10:00:00"
+# @INFO: rows are (UTC_Time, Operation, Coin, Amount, Investment) and expected the investment in cents of every leg
+# of the swap by coin and amount. The share of a src coin is worked out on what is left of it once the legs left,
+# the way Report has always done it: 50.00 of ADA with 90 ADA left after swapping 10 moves 5000 * 10 / 90 cents
+FIXTURES: dict[str, tuple[list[tuple[str, str, str, str, str]], dict[tuple[str, str], int]]] = {
+    "dust to BNB": (
+        [
+            (DEPOSIT_TIME, "Deposit", "ADA", "100.00000000", "50.00"),
+            (DEPOSIT_TIME, "Deposit", "DOT", "10.00000000", "300.00"),
+            (DEPOSIT_TIME, "Deposit", "XRP", "1000.00000000", "800.00"),
+            (DEPOSIT_TIME, "Deposit", "BNB", "1.00000000", "400.00"),
+            (SWAP_TIME, "Small assets exchange BNB", "BNB", "0.01000000", "0.00"),
+            (SWAP_TIME, "Small assets exchange BNB", "BNB", "0.05000000", "0.00"),
+            (SWAP_TIME, "Small assets exchange BNB", "ADA", "-10.00000000", "0.00"),
+            (SWAP_TIME, "Small assets exchange BNB", "BNB", "0.20000000", "0.00"),
+            (SWAP_TIME, "Small assets exchange BNB", "DOT", "-1.00000000", "0.00"),
+            (SWAP_TIME, "Small assets exchange BNB", "XRP", "-100.00000000", "0.00"),
+        ],
+        {
+            ("ADA", "-10.00000000"): -556,
+            ("DOT", "-1.00000000"): -3333,
+            ("XRP", "-100.00000000"): -8889,
+            # 12778 cents shared 1:5:20 by the BNB amounts
+            ("BNB", "0.01000000"): 491,
+            ("BNB", "0.05000000"): 2458,
+            ("BNB", "0.20000000"): 9829,
+        },
+    ),
+    "buy with a BNB fee": (
+        [
+            (DEPOSIT_TIME, "Deposit", "USDT", "2000.00000000", "1000.00"),
+            (DEPOSIT_TIME, "Deposit", "BNB", "2.00000000", "600.00"),
+            (SWAP_TIME, "Fee", "BNB", "-0.01000000", "0.00"),
+            (SWAP_TIME, "Buy", "BTC", "0.02000000", "0.00"),
+            (SWAP_TIME, "Sell", "USDT", "-500.00000000", "0.00"),
+        ],
+        {
+            ("USDT", "-500.00000000"): -33333,
+            ("BNB", "-0.01000000"): -302,
+            ("BTC", "0.02000000"): 33635,
+        },
+    ),
+    "fee paid in the bought coin": (
+        [
+            (DEPOSIT_TIME, "Deposit", "XMR", "1.00000000", "250.00"),
+            (SWAP_TIME, "Sell", "XMR", "-0.50000000", "0.00"),
+            (SWAP_TIME, "Fee", "USDT", "-0.12000000", "0.00"),
+            (SWAP_TIME, "Buy", "USDT", "120.00000000", "0.00"),
+        ],
+        {
+            ("XMR", "-0.50000000"): -25000,
+            ("USDT", "-0.12000000"): 0,
+            ("USDT", "120.00000000"): 25000,
+        },
+    ),
+    "two trades in the same second": (
+        [
+            (DEPOSIT_TIME, "Deposit", "BUSD", "1000.00000000", "1000.00"),
+            (SWAP_TIME, "Sell", "BUSD", "-100.00000000", "0.00"),
+            (SWAP_TIME, "Buy", "ETH", "0.05000000", "0.00"),
+            (SWAP_TIME, "Sell", "BUSD", "-200.00000000", "0.00"),
+            (SWAP_TIME, "Buy", "BTC", "0.00400000", "0.00"),
+        ],
+        {
+            ("BUSD", "-100.00000000"): -11111,
+            ("ETH", "0.05000000"): 11111,
+            ("BUSD", "-200.00000000"): -25397,
+            ("BTC", "0.00400000"): 25397,
+        },
+    ),
+}
+
+
+def write_fixture(file_path: str, rows: list[tuple[str, str, str, str, str]]) -> str:
+    with open(file_path, mode="w", encoding="utf-8", newline="") as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(STATEMENT_HEADER)
+        writer.writerows([*row, "BINANCE"] for row in rows)
+    return file_path
+
+
+def check_fixture(name: str, statement: str, expected: dict[tuple[str, str], int], vectorised: bool) -> list[str]:
+    label = f"{name} ({'vectorised' if vectorised else 'loop'})"
+    report = Report(database_url="sqlite://")
+    report.load_raw_statement(statement)
+    report.process(vectorised=vectorised)
+    legs = {
+        (row.coin, f"{row.amount:.8f}"): to_cents(row.investment)
+        for row in report.conn.query(Actions).filter(Actions.action_type.in_(("SWAP", "FEE")))
+    }
+    failures = [
+        f"{label}: {coin} {amount} is {legs.get((coin, amount))} not {cents}"
+        for (coin, amount), cents in expected.items()
+        if legs.get((coin, amount)) != cents
+    ]
+    if sum(legs.values()):
+        failures.append(f"{label}: the legs create {sum(legs.values())} cents")
+    failures += [f"{label}: summary {difference}" for difference in report.verify_summary()]
+    report.close()
+    return failures
+
+
+def check_conservation(rows: list[SimpleNamespace], investment: list[int]) -> int:
+    # swap groups that create or destroy investment
+    groups: dict[Any, int] = {}
+    for row, cents in zip(rows, investment):
+        if row.action_type in ("SWAP", "FEE"):
+            groups[row.action_id] = groups.get(row.action_id, 0) + cents
+    return sum(1 for cents in groups.values() if cents)
+
+
+def run_loop(rows: list[SimpleNamespace]) -> list[int]:
+    report = replay_report(rows)
+    return [report.investments.get(row.id, to_cents(row.investment)) for row in rows]
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.ERROR)
+    parser = argparse.ArgumentParser(description="Check and benchmark multi-leg swap groups.")
+    parser.add_argument("--rows", type=int, default=1000000, help="Number of synthetic actions")
+    parser.add_argument("--dust-ratio", type=float, default=0.05, help="Share of rows that start a dust conversion")
+    parser.add_argument("--fee-ratio", type=float, default=0.3, help="Share of swaps with a FEE leg")
+    args = vars(parser.parse_args())
+
+    failures = []
+    with tempfile.TemporaryDirectory() as workspace:
+        for idx, (name, (fixture, expected)) in enumerate(FIXTURES.items()):
+            statement = write_fixture(path.join(workspace, f"fixture-{idx}.csv"), fixture)
+            for vectorised in (False, True):
+                failures += check_fixture(name, statement, expected, vectorised)
+    print(f"fixtures:   {len(FIXTURES)} statements, {len(failures)} failures")
+
+    actions = list(generate_actions(args["rows"], dust_ratio=args["dust_ratio"], fee_ratio=args["fee_ratio"]))
+    objects = [SimpleNamespace(**action._asdict()) for action in actions]
+    columns = [(row.coin, row.action_type, row.action_id, row.amount, row.investment) for row in actions]
+    loop_time, loop_investment = timed(lambda: run_loop(objects))
+    vector_time, vector_result = timed(lambda: replay_ledger(build_ledger(columns)))
+    vector_investment = vector_result.investment.tolist()
+    print(f"rows:       {len(actions):,} ({vector_result.swaps:,} swap groups)")
+    print(f"loop:       {loop_time:.3f}s ({len(actions) / loop_time:,.0f} rows/s)")
+    print(f"vectorised: {vector_time:.3f}s ({len(actions) / vector_time:,.0f} rows/s)")
+    if loop_investment != vector_investment:
+        failures.append("the loop and vectorised replays differ")
+    unbalanced = check_conservation(objects, loop_investment)
+    if unbalanced:
+        failures.append(f"{unbalanced} swap groups create or destroy investment")
+    exit_with(failures)
+
+
+if __name__ == "__main__":
+    main()
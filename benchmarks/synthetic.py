@@ -0,0 +1,177 @@
+import csv
+import random
+import uuid
+from datetime import datetime, timedelta
+from os import path
+from typing import Iterator, NamedTuple
+
+COINS = ("BTC", "ETH", "BNB", "ADA", "DOT", "SOL", "XRP", "LTC", "BUSD", "USDT")
+PRICES = (45000.0, 3000.0, 400.0, 1.5, 30.0, 150.0, 0.9, 180.0, 1.0, 1.0)
+WALLETS = ("BINANCE", "TREZOR", "METAMASK", "YOROI", "PHANTOM")
+STATEMENT_HEADER = ["UTC_Time", "Operation", "Coin", "Amount", "Investment", "Wallet"]
+# @INFO: statement operation written for each action type, all of them are understood by get_action_type
+OPERATIONS = {
+    "DEPOSIT": ("Deposit",),
+    "WITHDRAW": ("Withdraw",),
+    "FEE": ("Fee",),
+    "TRANSFER": ("transfer_in", "transfer_out"),
+    "INTEREST": ("POS savings interest",),
+    "MINING": ("Mining",),
+    "SWAP": ("Buy", "Sell", "Large OTC trading"),
+}
+KLINE_INTERVAL = 60000
+DUST_COIN = "BNB"
+
+
+class Action(NamedTuple):
+    id: uuid.UUID
+    utc_date: datetime
+    action_type: str
+    coin: str
+    action_id: uuid.UUID
+    amount: float
+    investment: float
+    wallet: str
+
+
+def generate_actions(
+    rows: int,
+    coins: int = 8,
+    swap_ratio: float = 0.4,
+    seed: int = 42,
+    wallets: int = 3,
+    dust_ratio: float = 0.0,
+    fee_ratio: float = 0.0,
+) -> Iterator[Action]:
+    # @INFO: deterministic ledger ordered by utc_date, SWAP legs share utc_date/action_id and are adjacent.
+    # dust_ratio adds "Small assets exchange BNB" conversions of every coin held and fee_ratio a FEE leg to that
+    # share of the swaps, both are off by default so the other benchmarks keep their ledger
+    rng = random.Random(seed)
+    coin_list = COINS[:coins]
+    prices = dict(zip(COINS, PRICES))
+    holdings = {coin: 0.0 for coin in coin_list}
+    utc_date = datetime(2021, 1, 1)
+    produced = 0
+    while produced < rows:
+        utc_date += timedelta(seconds=rng.randint(1, 600))
+        action_id = uuid.uuid5(uuid.NAMESPACE_DNS, str(utc_date))
+        wallet = rng.choice(WALLETS[:wallets])
+        coin = rng.choice(coin_list)
+        dice = rng.random()
+        if dust_ratio and DUST_COIN in holdings and rng.random() < dust_ratio:
+            dust = [other for other in coin_list if other != DUST_COIN and holdings[other] > 0]
+            dust = dust[: (rows - produced) // 2]
+            if dust:
+                dust_legs = []
+                for dust_coin in dust:
+                    src_amount = round(holdings[dust_coin] * rng.uniform(0.001, 0.01), 8)
+                    dest_amount = round(src_amount * prices[dust_coin] / prices[DUST_COIN] * 0.98, 8)
+                    holdings[dust_coin] -= src_amount
+                    holdings[DUST_COIN] += dest_amount
+                    dust_legs += [(dust_coin, -src_amount), (DUST_COIN, dest_amount)]
+                rng.shuffle(dust_legs)
+                for leg_coin, leg_amount in dust_legs:
+                    yield Action(uuid.uuid4(), utc_date, "SWAP", leg_coin, action_id, leg_amount, 0.0, wallet)
+                produced += len(dust_legs)
+                continue
+        if dice < swap_ratio and holdings[coin] > 0 and produced + 2 <= rows:
+            dest = rng.choice([other for other in coin_list if other != coin])
+            src_amount = round(holdings[coin] * rng.uniform(0.05, 0.9), 8)
+            dest_amount = round(src_amount * prices[coin] / prices[dest] * rng.uniform(0.97, 1.03), 8)
+            holdings[coin] -= src_amount
+            holdings[dest] += dest_amount
+            legs = [("SWAP", coin, -src_amount), ("SWAP", dest, dest_amount)]
+            if fee_ratio and produced + 3 <= rows and rng.random() < fee_ratio:
+                fee_coin = DUST_COIN if holdings.get(DUST_COIN, 0.0) > 0 else dest
+                fee_amount = round(holdings[fee_coin] * rng.uniform(0.0001, 0.001), 8)
+                holdings[fee_coin] -= fee_amount
+                legs.append(("FEE", fee_coin, -fee_amount))
+            rng.shuffle(legs)
+            for action_type, leg_coin, leg_amount in legs:
+                yield Action(uuid.uuid4(), utc_date, action_type, leg_coin, action_id, leg_amount, 0.0, wallet)
+            produced += len(legs)
+            continue
+        if dice < swap_ratio + 0.1 and holdings[coin] > 0:
+            action_type = "WITHDRAW"
+            amount = -round(holdings[coin] * rng.uniform(0.01, 0.3), 8)
+            investment = -round(rng.uniform(1, 100), 2)
+        elif dice < swap_ratio + 0.2 and holdings[coin] > 0:
+            action_type = rng.choice(("FEE", "TRANSFER"))
+            amount = -round(holdings[coin] * rng.uniform(0.0001, 0.01), 8)
+            investment = 0.0
+        elif dice < swap_ratio + 0.35:
+            action_type = rng.choice(("INTEREST", "MINING"))
+            amount = round(rng.uniform(0.001, 1) / prices[coin], 8)
+            investment = 0.0
+        else:
+            action_type = "DEPOSIT"
+            amount = round(rng.uniform(10, 1000) / prices[coin], 8)
+            investment = round(rng.uniform(10, 1000), 2)
+        holdings[coin] += amount
+        yield Action(uuid.uuid4(), utc_date, action_type, coin, action_id, amount, investment, wallet)
+        produced += 1
+
+
+def write_statement(
+    file_path: str,
+    rows: int,
+    coins: int = 8,
+    swap_ratio: float = 0.4,
+    seed: int = 42,
+    wallets: int = 3,
+    dust_ratio: float = 0.0,
+    fee_ratio: float = 0.0,
+) -> str:
+    rng = random.Random(seed)
+    with open(file_path, mode="w", encoding="utf-8", newline="") as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(STATEMENT_HEADER)
+        for action in generate_actions(rows, coins, swap_ratio, seed, wallets, dust_ratio, fee_ratio):
+            writer.writerow(
+                [
+                    action.utc_date.strftime("%Y-%m-%d %H:%M:%S"),
+                    rng.choice(OPERATIONS[action.action_type]),
+                    action.coin,
+                    f"{action.amount:.8f}",
+                    f"{action.investment:.2f}",
+                    action.wallet,
+                ]
+            )
+    return file_path
+
+
+def write_klines(csv_dir: str, coin: str, quote: str, year: int, month: int, seed: int = 42) -> str:
+    # @INFO: one Binance 1m kline month file, prices follow a random walk around the coin's reference price
+    rng = random.Random(f"{seed}{coin}{quote}{year}{month}")
+    prices = dict(zip(COINS, PRICES))
+    price = prices[coin] / prices[quote]
+    start = datetime(year, month, 1)
+    end = datetime(year + month // 12, month % 12 + 1, 1)
+    open_time = int((start - datetime(1970, 1, 1)).total_seconds()) * 1000
+    file_name = f"{coin}{quote}-1m-{year}-{month:02d}.csv"
+    with open(path.join(csv_dir, file_name), mode="w", encoding="utf-8", newline="") as csv_file:
+        writer = csv.writer(csv_file)
+        for _ in range(int((end - start).total_seconds()) // 60):
+            close = price * rng.uniform(0.999, 1.001)
+            high = max(price, close) * rng.uniform(1.0, 1.0005)
+            low = min(price, close) * rng.uniform(0.9995, 1.0)
+            volume = rng.uniform(0.1, 100)
+            writer.writerow(
+                [
+                    open_time,
+                    price,
+                    high,
+                    low,
+                    close,
+                    volume,
+                    open_time + KLINE_INTERVAL - 1,
+                    volume * price,
+                    10,
+                    0,
+                    0,
+                    0,
+                ]
+            )
+            price = close
+            open_time += KLINE_INTERVAL
+    return file_name
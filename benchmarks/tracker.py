@@ -0,0 +1,237 @@
+#!/usr/bin/env python
+# Report.track as a dict of per-coin dicts (the code before tools/tracker.py, copied below) vs the interned Tracker:
+# replay speed, snapshot speed and memory on a synthetic ledger. Both structures run the same replay, the one from
+# before the swap groups that pairs swap legs two at a time, so the timings only differ by the structure. Report.replay
+# with the swap groups of tools/swaps.py is timed on its own for reference.
+# The Tracker does not make the replay faster: on 100k-300k rows it runs between 0.8x and 1.15x the dicts from one run
+# to the next, the time goes to the rows and the fixed point parsing, not to the lookups. What it buys is memory, about a third of the
+# dicts per coin, and snapshots that are a fifth of the size and four times faster to take for the what-if analysis.
+# Exits with 1 when the structures end with different figures or the Tracker is not smaller in memory and snapshots.
+# usage: ./benchmarks/tracker.py --rows 1000000
+
+import gc
+import sys
+import logging
+import argparse
+import tracemalloc
+from os import path
+from types import SimpleNamespace
+from typing import Any, Callable, Iterable
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+# pylint: disable=wrong-import-position
+from tools.fixed import div_round, to_cents, to_sats
+from tools.tracker import Tracker
+from benchmarks.harness import exit_with, race, replay_report, timed
+from benchmarks.synthetic import generate_actions
+
+Swap = dict[str, Any]
+
+
+class DictReplay:
+    # Report.replay, apply_swap and get_swap_investment as they were with a dict of per-coin dicts
+    def __init__(self) -> None:
+        self.logger = logging.getLogger("REPORT")
+        self.track: dict[str, dict[str, int]] = {}
+        self.investments: dict[Any, int] = {}
+        self.stored_investments: dict[Any, tuple[str, int]] = {}
+
+    def get_swap_investment(self, src_coin: str, swapped: int) -> int:
+        tracked = self.track[src_coin]
+        if tracked["amount"] < swapped:
+            investment = tracked["investment"]
+        elif tracked["amount"] > 0:
+            investment = div_round(tracked["investment"] * swapped, tracked["amount"])
+        else:
+            investment = 0
+        return investment
+
+    def apply_swap(self, swap: Swap) -> None:
+        src_coin = swap["src"].coin
+        dest_coin = swap["dest"].coin
+        src_amount = to_sats(swap["src"].amount)
+        dest_amount = to_sats(swap["dest"].amount)
+        if (self.track[src_coin]["amount"] + src_amount) < 0:
+            self.logger.warning(f"WARNING: amount of {src_coin} exceed available")
+        self.track[src_coin]["amount"] += src_amount
+        self.track[dest_coin]["amount"] += dest_amount
+        track_investment = self.get_swap_investment(src_coin, src_amount * -1)
+        self.track[src_coin]["investment"] -= track_investment
+        self.track[dest_coin]["investment"] += track_investment
+        self.stored_investments.setdefault(swap["src"].id, (src_coin, to_cents(swap["src"].investment)))
+        self.stored_investments.setdefault(swap["dest"].id, (dest_coin, to_cents(swap["dest"].investment)))
+        self.investments[swap["src"].id] = track_investment * -1
+        self.investments[swap["dest"].id] = track_investment
+
+    def replay(self, actions: Iterable[Any]) -> Any:
+        swap: dict[Any, Swap] = {}
+        last_action = None
+        for data in actions:
+            last_action = data
+            if data.coin not in self.track:
+                self.track[data.coin] = {"amount": 0, "investment": 0}
+            if data.action_type in ["DEPOSIT", "WITHDRAW", "ADJUSTMENT"]:
+                self.track[data.coin]["investment"] += to_cents(data.investment)
+                self.track[data.coin]["amount"] += to_sats(data.amount)
+            elif data.action_type in ["FEE", "INTEREST", "MINING", "TRANSFER"]:
+                self.track[data.coin]["amount"] += to_sats(data.amount)
+            elif data.action_type == "SWAP":
+                if data.action_id not in swap:
+                    swap = {data.action_id: {}}
+                swap[data.action_id]["dest" if data.amount > 0.0 else "src"] = data
+                if all(k in swap[data.action_id] for k in ("dest", "src")):
+                    self.apply_swap(swap[data.action_id])
+            else:
+                raise Exception(f"Unknown action {data.action_type}")
+        return last_action
+
+
+class TrackerReplay(DictReplay):
+    # DictReplay line by line on the interned lists of a Tracker
+    def __init__(self) -> None:
+        super().__init__()
+        self.tracker = Tracker()
+
+    def get_swap_investment(self, src_coin: str, swapped: int) -> int:
+        idx = self.tracker.index[src_coin]
+        amount, tracked = self.tracker.amounts[idx], self.tracker.investments[idx]
+        if amount < swapped:
+            investment = tracked
+        elif amount > 0:
+            investment = div_round(tracked * swapped, amount)
+        else:
+            investment = 0
+        return investment
+
+    def apply_swap(self, swap: Swap) -> None:
+        index, amounts, investments = self.tracker.index, self.tracker.amounts, self.tracker.investments
+        src_coin = swap["src"].coin
+        dest_coin = swap["dest"].coin
+        src, dest = index[src_coin], index[dest_coin]
+        src_amount = to_sats(swap["src"].amount)
+        dest_amount = to_sats(swap["dest"].amount)
+        if (amounts[src] + src_amount) < 0:
+            self.logger.warning(f"WARNING: amount of {src_coin} exceed available")
+        amounts[src] += src_amount
+        amounts[dest] += dest_amount
+        track_investment = self.get_swap_investment(src_coin, src_amount * -1)
+        investments[src] -= track_investment
+        investments[dest] += track_investment
+        self.stored_investments.setdefault(swap["src"].id, (src_coin, to_cents(swap["src"].investment)))
+        self.stored_investments.setdefault(swap["dest"].id, (dest_coin, to_cents(swap["dest"].investment)))
+        self.investments[swap["src"].id] = track_investment * -1
+        self.investments[swap["dest"].id] = track_investment
+
+    def replay(self, actions: Iterable[Any]) -> Any:
+        tracker = self.tracker
+        index, amounts, investments = tracker.index, tracker.amounts, tracker.investments
+        swap: dict[Any, Swap] = {}
+        last_action = None
+        for data in actions:
+            last_action = data
+            coin = index.get(data.coin)
+            if coin is None:
+                coin = tracker.intern(data.coin)
+            if data.action_type in ["DEPOSIT", "WITHDRAW", "ADJUSTMENT"]:
+                investments[coin] += to_cents(data.investment)
+                amounts[coin] += to_sats(data.amount)
+            elif data.action_type in ["FEE", "INTEREST", "MINING", "TRANSFER"]:
+                amounts[coin] += to_sats(data.amount)
+            elif data.action_type == "SWAP":
+                if data.action_id not in swap:
+                    swap = {data.action_id: {}}
+                swap[data.action_id]["dest" if data.amount > 0.0 else "src"] = data
+                if all(k in swap[data.action_id] for k in ("dest", "src")):
+                    self.apply_swap(swap[data.action_id])
+            else:
+                raise Exception(f"Unknown action {data.action_type}")
+        return last_action
+
+
+def replay_dicts(rows: list[SimpleNamespace]) -> dict[str, dict[str, int]]:
+    report = DictReplay()
+    report.replay(rows)
+    return report.track
+
+
+def replay_tracker(rows: list[SimpleNamespace]) -> Tracker:
+    report = TrackerReplay()
+    report.replay(rows)
+    return report.tracker
+
+
+def replay_groups(rows: list[SimpleNamespace]) -> Tracker:
+    return replay_report(rows).track
+
+
+def fill_tracker(coins: list[str]) -> Tracker:
+    tracker = Tracker()
+    for coin in coins:
+        tracker.set(coin, 10**12, 10**6)
+    return tracker
+
+
+def measured(func: Callable[[], Any]) -> tuple[int, Any]:
+    # bytes still allocated by whatever func returns
+    gc.collect()
+    tracemalloc.start()
+    result = func()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size, result
+
+
+def check_replay(rows: list[SimpleNamespace], repeat: int) -> list[str]:
+    dict_time, tracker_time, dicts, tracker = race(repeat, lambda: replay_dicts(rows), lambda: replay_tracker(rows))
+    groups_time, groups = timed(lambda: replay_groups(rows))
+    as_dict = {coin: (values["amount"], values["investment"]) for coin, values in dicts.items()}
+    identical = as_dict == tracker.as_dict() == groups.as_dict()
+    print(f"rows:              {len(rows):,}")
+    print(f"replay dicts:      {dict_time:.3f}s ({len(rows) / dict_time:,.0f} rows/s)")
+    print(f"replay tracker:    {tracker_time:.3f}s ({len(rows) / tracker_time:,.0f} rows/s)")
+    print(f"speed-up:          {dict_time / tracker_time:.2f}x")
+    print(f"swap groups:       {groups_time:.3f}s ({len(rows) / groups_time:,.0f} rows/s)")
+    print(f"identical:         {identical}")
+    return [] if identical else ["the dicts, the Tracker and the swap groups end with different figures"]
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.ERROR)
+    parser = argparse.ArgumentParser(description="Benchmark the dict and Tracker implementations of Report.track.")
+    parser.add_argument("--rows", type=int, default=1000000, help="Number of synthetic actions")
+    parser.add_argument("--coins", type=int, default=10000, help="Coins in the tracker for the memory numbers")
+    parser.add_argument("--snapshots", type=int, default=10000, help="Snapshots taken for the what-if numbers")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs of the replays, the fastest is kept")
+    args = vars(parser.parse_args())
+
+    rows = [SimpleNamespace(**action._asdict()) for action in generate_actions(args["rows"], coins=10)]
+    failures = check_replay(rows, args["repeat"])
+
+    coins = [f"COIN{idx}" for idx in range(args["coins"])]
+    dict_size, _ = measured(lambda: {coin: {"amount": 10**12, "investment": 10**6} for coin in coins})
+    tracker_size, _ = measured(lambda: fill_tracker(coins))
+    print(f"{args['coins']:,} coins dicts:   {dict_size / 1024:,.0f} KiB")
+    print(f"{args['coins']:,} coins tracker: {tracker_size / 1024:,.0f} KiB")
+    if tracker_size >= dict_size:
+        failures.append(f"{args['coins']:,} coins take {tracker_size:,} bytes in the Tracker, {dict_size:,} in dicts")
+
+    # @INFO: what-if analysis keeps a copy of the state around, here one per replayed action on the synthetic coins
+    dicts = replay_dicts(rows[: args["snapshots"]])
+    tracker = replay_tracker(rows[: args["snapshots"]])
+    count = args["snapshots"]
+    dict_time, _ = timed(lambda: [{coin: dict(values) for coin, values in dicts.items()} for _ in range(count)])
+    tracker_time, _ = timed(lambda: [tracker.snapshot() for _ in range(count)])
+    dict_size, _ = measured(lambda: [{coin: dict(values) for coin, values in dicts.items()} for _ in range(count)])
+    tracker_size, _ = measured(lambda: [tracker.snapshot() for _ in range(count)])
+    print(f"snapshots dicts:   {dict_time:.3f}s, {dict_size / count:,.0f} bytes each")
+    print(f"snapshots tracker: {tracker_time:.3f}s, {tracker_size / count:,.0f} bytes each")
+    if tracker_size >= dict_size:
+        failures.append(
+            f"a Tracker snapshot takes {tracker_size / count:,.0f} bytes, {dict_size / count:,.0f} in dicts"
+        )
+    exit_with(failures)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,9 @@
+DROP TABLE IF EXISTS schema_migrations;
 DROP VIEW IF EXISTS portfolio;
 DROP VIEW IF EXISTS actual_investment;
+DROP TABLE IF EXISTS action_summary;
+DROP TABLE IF EXISTS tracker_checkpoint;
+DROP TABLE IF EXISTS replay_checkpoint;
 DROP TABLE IF EXISTS actions;
 CREATE TABLE actions(
     id UUID NOT NULL PRIMARY KEY,
@@ -14,16 +18,3 @@ CREATE TABLE actions(
     FOREIGN KEY(wallet) REFERENCES wallets(name),
     FOREIGN KEY(action_type) REFERENCES action_type(name)
 );
-CREATE VIEW portfolio AS
-SELECT coin,
-    SUM(amount) AS amount,
-    SUM(investment) AS investment,
-    SUM(investment) / SUM(amount) AS min_price
-FROM actions
-GROUP BY coin
-HAVING SUM(amount) > 0.00
-ORDER BY coin;
-CREATE VIEW actual_investment AS
-SELECT SUM(investment) AS investment
-FROM actions
-WHERE action_type IN ('DEPOSIT', 'WITHDRAW');
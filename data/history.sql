@@ -1,3 +1,5 @@
+DROP TABLE IF EXISTS history_1d;
+DROP TABLE IF EXISTS history_1h;
 DROP TABLE IF EXISTS history;
 DROP TABLE IF EXISTS history_index;
 CREATE TABLE history_index(
@@ -17,3 +19,27 @@ CREATE TABLE history(
     PRIMARY KEY (open_time, pair)
     FOREIGN KEY(file_id) REFERENCES history_index(id)
 );
+CREATE INDEX history_pair_time ON history(pair, open_time);
+-- 1h and 1d OHLC rollups of history, klines is the number of 1m klines in the bucket
+CREATE TABLE history_1h(
+    open_time INTEGER NOT NULL,
+    pair TEXT NOT NULL,
+    close_time INTEGER NOT NULL,
+    open REAL NOT NULL,
+    high REAL NOT NULL,
+    low REAL NOT NULL,
+    close REAL NOT NULL,
+    klines INTEGER NOT NULL,
+    PRIMARY KEY (pair, open_time)
+) WITHOUT ROWID;
+CREATE TABLE history_1d(
+    open_time INTEGER NOT NULL,
+    pair TEXT NOT NULL,
+    close_time INTEGER NOT NULL,
+    open REAL NOT NULL,
+    high REAL NOT NULL,
+    low REAL NOT NULL,
+    close REAL NOT NULL,
+    klines INTEGER NOT NULL,
+    PRIMARY KEY (pair, open_time)
+) WITHOUT ROWID;
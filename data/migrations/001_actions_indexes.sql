@@ -0,0 +1,2 @@
+CREATE INDEX IF NOT EXISTS actions_utc_date_action_id_idx ON actions(utc_date, action_id);
+CREATE INDEX IF NOT EXISTS actions_coin_action_type_idx ON actions(coin, action_type);
@@ -0,0 +1,12 @@
+CREATE TABLE IF NOT EXISTS tracker_checkpoint(
+    coin TEXT NOT NULL PRIMARY KEY,
+    amount DOUBLE PRECISION NOT NULL,
+    investment DOUBLE PRECISION NOT NULL,
+    FOREIGN KEY(coin) REFERENCES coins(coin_token)
+);
+CREATE TABLE IF NOT EXISTS replay_checkpoint(
+    id INTEGER NOT NULL PRIMARY KEY,
+    utc_date TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+    action_id UUID NOT NULL,
+    row_count INTEGER NOT NULL
+);
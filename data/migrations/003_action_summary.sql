@@ -0,0 +1,32 @@
+CREATE TABLE IF NOT EXISTS action_summary(
+    coin TEXT NOT NULL,
+    action_type TEXT NOT NULL,
+    amount NUMERIC(21, 8) NOT NULL DEFAULT 0.00,
+    investment NUMERIC(15, 2) NOT NULL DEFAULT 0.00,
+    PRIMARY KEY(coin, action_type),
+    FOREIGN KEY(coin) REFERENCES coins(coin_token),
+    FOREIGN KEY(action_type) REFERENCES action_type(name)
+);
+DELETE FROM action_summary;
+INSERT INTO action_summary(coin, action_type, amount, investment)
+SELECT coin,
+    action_type,
+    ROUND(SUM(amount), 8),
+    ROUND(SUM(investment), 2)
+FROM actions
+GROUP BY coin, action_type;
+DROP VIEW IF EXISTS portfolio;
+DROP VIEW IF EXISTS actual_investment;
+CREATE VIEW portfolio AS
+SELECT coin,
+    ROUND(SUM(amount), 8) AS amount,
+    ROUND(SUM(investment), 2) AS investment,
+    ROUND(SUM(investment), 2) / ROUND(SUM(amount), 8) AS min_price
+FROM action_summary
+GROUP BY coin
+HAVING ROUND(SUM(amount), 8) > 0.00
+ORDER BY coin;
+CREATE VIEW actual_investment AS
+SELECT ROUND(SUM(investment), 2) AS investment
+FROM action_summary
+WHERE action_type IN ('DEPOSIT', 'WITHDRAW');
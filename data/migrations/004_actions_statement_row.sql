@@ -0,0 +1 @@
+ALTER TABLE actions ADD COLUMN statement_row INTEGER NOT NULL DEFAULT 0;
@@ -0,0 +1,2 @@
+DROP INDEX IF EXISTS actions_utc_date_action_id_idx;
+CREATE INDEX IF NOT EXISTS actions_utc_date_action_id_idx ON actions(utc_date, action_id, statement_row);
@@ -1,11 +1,16 @@
 #!/usr/bin/env python
 
 import sys
-import logging
+import glob
 from os import path
 import argparse
+from datetime import datetime
+from typing import TYPE_CHECKING, Any
 
-from tools import Report
+# the tools modules pull in SQLAlchemy, requests and numpy, every command imports only what it uses so
+# --help and the light commands start fast. benchmarks/import_time.py keeps an eye on it
+if TYPE_CHECKING:
+    from tools.report import Report
 
 
 def validate_path(statement: str) -> str:
@@ -18,30 +23,335 @@ def validate_path(statement: str) -> str:
     return file_path
 
 
-def main() -> None:
-    logging.basicConfig(level=logging.DEBUG)
-    logging.info(f"Script {path.basename(__file__)} has started")
+def validate_statements(statement: str) -> list[str]:
+    # a CSV file, a directory of CSV files or a glob pattern, in name order
+    if path.isdir(statement):
+        file_list = sorted(glob.glob(path.join(statement, "*.csv")))
+    elif glob.has_magic(statement):
+        file_list = sorted(glob.glob(statement))
+    else:
+        file_list = [statement]
+    if not file_list:
+        raise argparse.ArgumentTypeError(f"No CSV statement found in '{statement}'")
+    return [validate_path(file_path) for file_path in file_list]
 
-    parser = argparse.ArgumentParser(description="Generate crypto asset table.")
-    parser.add_argument("--statement", required=False, type=validate_path, help="Path to CSV statement file")
-    args = vars(parser.parse_args())
 
-    r = Report()
+def get_statements(args: dict[str, Any]) -> list[str]:
+    # every statement once, in the order given on the command line
+    return list(dict.fromkeys(file_path for file_list in args["statement"] or [] for file_path in file_list))
+
+
+def validate_dir(csv_dir: str) -> str:
+    if not path.isdir(csv_dir):
+        raise argparse.ArgumentTypeError("Invalid directory")
+    return path.abspath(csv_dir)
+
+
+def validate_month(month: str) -> datetime:
+    try:
+        result = datetime.strptime(month, "%Y-%m")
+    except ValueError as e:
+        raise argparse.ArgumentTypeError("Invalid month, use YYYY-MM") from e
+    return result
+
+
+def validate_precision(precision: str) -> int:
+    # a number of minutes, hours or days such as 15m, 4h or 1d, in milliseconds
+    units = {"m": 60000, "h": 3600000, "d": 86400000}
+    if len(precision) < 2 or precision[-1] not in units or not precision[:-1].isdigit():
+        raise argparse.ArgumentTypeError("Invalid precision, use minutes, hours or days such as 15m, 4h or 1d")
+    return int(precision[:-1]) * units[precision[-1]]
+
+
+def validate_date(utc_date: str) -> datetime:
+    try:
+        result = datetime.fromisoformat(utc_date)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError("Invalid date, use YYYY-MM-DD or 'YYYY-MM-DD HH:MM:SS'") from e
+    return result
+
+
+def get_report(args: dict[str, Any]) -> "Report":
+    from tools.report import Report  # pylint: disable=import-outside-toplevel
+
+    r = Report(
+        price_ttl=args["price_ttl"],
+        max_workers=args["max_workers"],
+        database_url=args["database_url"],
+        price_snapshot=args["price_snapshot"],
+        snapshot_ttl=args["snapshot_ttl"],
+        offline=args["offline"],
+        history_db=args["price_history_db"],
+        operations_file=args["operations"],
+    )
+    if args["init_db"]:
+        r.storage.create_schema()
+    elif args["migrate_db"]:
+        r.storage.migrate()
+    return r
+
+
+def ingest(args: dict[str, Any]) -> None:
+    r = get_report(args)
+    if args["row_by_row"]:
+        for statement in get_statements(args):
+            r.load_raw_statement(statement, bulk=False)
+    else:
+        r.load_raw_statements(get_statements(args), args["workers"])
+    r.close()
+
+
+def process(args: dict[str, Any]) -> None:
+    r = get_report(args)
+    r.process(full=args["full_replay"], vectorised=args["vectorised"], dry_run=args["dry_run"])
+    r.close()
+
+
+def portfolio(args: dict[str, Any]) -> None:
+    r = get_report(args)
+    if args["verify_summary"] or args["repair_summary"]:
+        r.verify_summary(repair=args["repair_summary"])
+    if args["until"] and not args["as_of"]:
+        raise Exception("Error: --until needs --as-of")
+    if args["until"]:
+        r.get_portfolio_series(args["as_of"], args["until"], args["kline_store"], args["precision"])
+    elif args["as_of"]:
+        r.get_portfolio_as_of(args["as_of"], args["kline_store"], args["precision"])
+    else:
+        r.get_portfolio()
+    r.close()
+
+
+def save_prices(args: dict[str, Any]) -> None:
+    r = get_report(args)
+    r.save_price_snapshot(args["snapshot"])
+    r.close()
+
+
+def import_history(args: dict[str, Any]) -> None:
+    from tools.collect import Collect  # pylint: disable=import-outside-toplevel
+
+    c = Collect(args["history_db"])
+    c.save_history(args["csv_dir"], args["workers"])
+    if args["rebuild_rollups"]:
+        c.update_rollups(rebuild=True)
+    if args["kline_store"]:
+        c.load_klines(args["kline_store"], rebuild=True)
+    c.close_db()
+
+
+def download_history(args: dict[str, Any]) -> None:
+    from tools.collect import Collect  # pylint: disable=import-outside-toplevel
+    from tools.downloader import PAIRS  # pylint: disable=import-outside-toplevel
+
+    c = Collect(args["history_db"])
+    try:
+        c.download_history(args["pairs"] or PAIRS, args["start"], args["end"], args["base_url"], args["workers"])
+        if args["kline_store"]:
+            c.load_klines(args["kline_store"], rebuild=True)
+    finally:
+        c.close_db()
+
+
+def all_stages(args: dict[str, Any]) -> None:
+    # running without a command keeps the original behaviour: ingest, process and portfolio in one go
+    r = get_report(args)
     if args["statement"]:
-        r.load_raw_statement(args["statement"])
+        r.load_raw_statements(get_statements(args))
         r.process()
     r.get_portfolio()
     r.close()
 
 
-if __name__ == "__main__":
+def add_options(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--statement",
+        required=False,
+        nargs="+",
+        type=validate_statements,
+        help="CSV statement files, directories or glob patterns, loaded and processed before the portfolio when no "
+        "command is given",
+    )
+    parser.add_argument(
+        "--database-url",
+        required=False,
+        help="SQLAlchemy URL of the database, e.g. sqlite:///report.db (defaults to $REPORT_DATABASE_URL)",
+    )
+    parser.add_argument("--init-db", action="store_true", help="Create the schema before doing anything else")
+    parser.add_argument(
+        "--migrate-db", action="store_true", help="Apply the pending data/migrations/ to an existing schema first"
+    )
+    parser.add_argument(
+        "--operations",
+        required=False,
+        help="JSON file of extra statement operations and their action type "
+        "(defaults to $REPORT_OPERATIONS_FILE or data/operations.json)",
+    )
+    parser.add_argument(
+        "--price-ttl", type=float, default=30.0, help="Seconds a fetched price is reused (0 disables the cache)"
+    )
+    parser.add_argument("--max-workers", type=int, default=8, help="Maximum concurrent price requests")
+    parser.add_argument(
+        "--price-snapshot", required=False, help="Price snapshot written by save-prices, used before Binance if fresh"
+    )
+    parser.add_argument(
+        "--snapshot-ttl",
+        type=float,
+        default=3600.0,
+        help="Seconds the price snapshot is preferred over Binance, older snapshots are only a fallback",
+    )
+    parser.add_argument(
+        "--offline", action="store_true", help="Never call Binance, prices come from the snapshot or history"
+    )
+    parser.add_argument(
+        "--price-history-db", required=False, help="SQLite history database, its latest close is the last price source"
+    )
+    parser.add_argument("--profile", action="store_true", help="Print the time spent in every stage at the end")
+    parser.add_argument(
+        "--profile-output", required=False, help="Also run under cProfile and dump the pstats data to this file"
+    )
+
+
+def add_report_commands(commands: Any) -> None:
+    ingest_parser = commands.add_parser("ingest", help="Load CSV statements into the actions table")
+    ingest_parser.add_argument(
+        "statement", nargs="+", type=validate_statements, help="CSV statement files, directories or glob patterns"
+    )
+    ingest_parser.add_argument("--row-by-row", action="store_true", help="Insert and commit one row at a time")
+    ingest_parser.add_argument(
+        "--workers", type=int, default=None, help="Processes parsing statements in parallel when there are several"
+    )
+    ingest_parser.set_defaults(command=ingest)
+
+    process_parser = commands.add_parser("process", help="Replay the actions and update swap investments")
+    process_parser.add_argument(
+        "--full-replay", action="store_true", help="Ignore the saved checkpoint and replay every action"
+    )
+    process_parser.add_argument(
+        "--vectorised",
+        action="store_true",
+        help="Replay actions with the array based cost-basis engine (opt-in, not faster than the loop end to end)",
+    )
+    process_parser.add_argument(
+        "--dry-run", action="store_true", help="Compute swap investments without writing them back"
+    )
+    process_parser.set_defaults(command=process)
+
+    portfolio_parser = commands.add_parser("portfolio", help="Print the portfolio valued at current prices")
+    portfolio_parser.add_argument(
+        "--verify-summary", action="store_true", help="Recompute the portfolio summary from actions and report drift"
+    )
+    portfolio_parser.add_argument(
+        "--repair-summary", action="store_true", help="Like --verify-summary but rebuild the summary if it drifted"
+    )
+    portfolio_parser.add_argument(
+        "--as-of", type=validate_date, help="Portfolio at this UTC time instead of now, a bare date means 00:00:00"
+    )
+    portfolio_parser.add_argument(
+        "--until", type=validate_date, help="With --as-of, print one row per day from --as-of to this date"
+    )
+    portfolio_parser.add_argument(
+        "--kline-store", required=False, help="Value --as-of portfolios with the kline store built by import-history"
+    )
+    portfolio_parser.add_argument(
+        "--precision",
+        type=validate_precision,
+        help="Without --kline-store, value at the coarsest --price-history-db rollup within this precision, e.g. "
+        "1h (defaults to 1m for --as-of and 1d for --until)",
+    )
+    portfolio_parser.set_defaults(command=portfolio)
+
+    save_prices_parser = commands.add_parser("save-prices", help="Save current prices of the portfolio coins")
+    save_prices_parser.add_argument("snapshot", help="Price snapshot file to write")
+    save_prices_parser.set_defaults(command=save_prices)
+
+
+def add_history_commands(commands: Any) -> None:
+    history_parser = commands.add_parser("import-history", help="Import Binance 1m kline CSV files")
+    history_parser.add_argument("csv_dir", type=validate_dir, help="Directory with the kline CSV files")
+    history_parser.add_argument("--history-db", default="./sqlite2.db", help="SQLite file holding the history")
+    history_parser.add_argument("--workers", type=int, default=None, help="Processes parsing files in parallel")
+    history_parser.add_argument("--kline-store", required=False, help="Rebuild the kline price store in this directory")
+    history_parser.add_argument(
+        "--rebuild-rollups", action="store_true", help="Rebuild the 1h and 1d rollups of every pair in the history"
+    )
+    history_parser.set_defaults(command=import_history)
+
+    download_parser = commands.add_parser(
+        "download-history", help="Download the missing Binance 1m kline months straight into the history"
+    )
+    download_parser.add_argument("--history-db", default="./sqlite2.db", help="SQLite file holding the history")
+    download_parser.add_argument("--pairs", nargs="+", help="Pairs to download (defaults to the usual 30 pairs)")
+    download_parser.add_argument(
+        "--start",
+        type=validate_month,
+        help="First month, YYYY-MM (defaults to 2021-03), months already in the history are skipped",
+    )
+    download_parser.add_argument(
+        "--end", type=validate_month, help="Last month, YYYY-MM (defaults to the last complete month)"
+    )
+    download_parser.add_argument("--workers", type=int, default=8, help="Concurrent downloads")
+    download_parser.add_argument(
+        "--base-url", default="https://data.binance.vision", help="Binance public data server or a mirror of it"
+    )
+    download_parser.add_argument(
+        "--kline-store", required=False, help="Rebuild the kline price store in this directory"
+    )
+    download_parser.set_defaults(command=download_history)
+
+
+def get_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Generate crypto asset table.")
+    add_options(parser)
+    parser.set_defaults(command=all_stages)
+    commands = parser.add_subparsers(title="commands")
+    add_report_commands(commands)
+    add_history_commands(commands)
+    return parser
+
+
+def run_command(args: dict[str, Any]) -> None:
+    profiler = None
+    metrics = None
+    if args["profile"] or args["profile_output"]:
+        from tools.metrics import METRICS  # pylint: disable=import-outside-toplevel
+
+        metrics = METRICS
+        metrics.enable()
+    if args["profile_output"]:
+        import cProfile  # pylint: disable=import-outside-toplevel
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    args["command"](args)
+
+    if profiler:
+        profiler.disable()
+        profiler.dump_stats(args["profile_output"])
+    if metrics:
+        print(metrics.summary())
+
+
+def main() -> int:
+    args = vars(get_parser().parse_args())
+    # --help and bad arguments exit above, logging is only imported once there is a command to run
+    import logging  # pylint: disable=import-outside-toplevel
+
+    logging.basicConfig(level=logging.DEBUG)
+    logging.info(f"Script {path.basename(__file__)} has started")
+    exit_status = 0
     try:
-        exit_status = 0
-        main()
+        run_command(args)
+        if args["profile_output"]:
+            logging.info(f"Profile written to {args['profile_output']}, open it with 'python -m pstats'")
     except KeyboardInterrupt:
         logging.info("Bye!")
     except Exception as e:
         logging.exception(e)
         exit_status = 2
-    finally:
-        sys.exit(exit_status)
+    return exit_status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,3 +1,15 @@
+from importlib import import_module
+
 from .definitions import *
-from .report import Report
-from .collect import Collect
+
+# Report and Collect pull in SQLAlchemy, requests and numpy, they are imported the first time they are used
+LAZY_IMPORTS = {
+    "Report": ".report",
+    "Collect": ".collect",
+}
+
+
+def __getattr__(name: str):
+    if name not in LAZY_IMPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(import_module(LAZY_IMPORTS[name], __name__), name)
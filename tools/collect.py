@@ -1,99 +1,89 @@
 import sqlite3
 import logging
-import csv
+import math
 import uuid
-from datetime import datetime
-from os import path, listdir
-from typing import Any
-
-import requests
+import calendar
+from datetime import datetime, timezone
+from collections import deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from os import path, listdir, cpu_count
+from typing import Any, Callable, Iterable, Iterator
+
+import numpy as np
 from prettytable import PrettyTable
-
-from .definitions import ACTION_TYPE
-
-
-def get_action_type(operation: str) -> ACTION_TYPE:
-    action_type: ACTION_TYPE
-    transfer_choices = [
-        "POS savings purchase",
-        "POS savings redemption",
-        "transfer_out",
-        "transfer_in",
-    ]
-    swap_choices = [
-        "Small assets exchange BNB",
-        "Large OTC trading",
-        "Buy",
-        "Sell",
-    ]
-    same_choices = ["ADJUSTMENT", "TRANSFER", "INTEREST", "FEE", "WITHDRAW", "DEPOSIT", "MINING"]
-    if operation == "POS savings interest":
-        action_type = "INTEREST"
-    elif operation in transfer_choices:
-        action_type = "TRANSFER"
-    elif operation in swap_choices:
-        action_type = "SWAP"
-    elif operation.upper() in same_choices:
-        action_type = operation.upper()  # type: ignore[assignment]
-    else:
-        raise Exception(f"Error: action '{operation}' is invalid")
-    return action_type
-
-
-def process_raw_data(file_path: str) -> list[dict[str, str]]:
-    csv_reader: list[dict[str, str]]
-    with open(file_path, mode="r", encoding="utf-8") as csv_file:
-        csv_reader = [dict(row.items()) for row in csv.DictReader(csv_file, skipinitialspace=True)]
-
-    return csv_reader
-
-
-def load_hist_file(csv_dir: str, single_file: str, file_id: int) -> list[dict]:
-    file_content = []
-    pair = single_file.split("-")[0]
-    full_path = path.join(csv_dir, single_file)
-    with open(full_path, mode="r", encoding="utf-8") as csv_file:
-        reader = csv.reader(csv_file)
-        #      0      1    2   3   4       5        6
-        # Open time,Open,High,Low,Close,Volume,Close time,Quote asset volume,Number of trades,
-        # Taker buy base asset volume,Taker buy quote asset volume,Ignore
-        # open_time pair close_time open high low close
-        for row in reader:
-            file_content.append(
-                {
-                    "open_time": int(row[0]),
-                    "pair": pair,
-                    "close_time": int(row[6]),
-                    "open": float(row[1]),
-                    "high": float(row[2]),
-                    "low": float(row[3]),
-                    "close": float(row[4]),
-                    "file_id": file_id,
-                }
-            )
-    return file_content
+from sqlalchemy.orm import Session
+
+from .db import Actions
+from .metrics import METRICS
+from .downloader import (
+    BINANCE_DATA_URL,
+    FIRST_MONTH,
+    KlineDownloader,
+    KlineMonth,
+    get_last_complete_month,
+    get_missing_months,
+    read_kline_zip,
+)
+from .klines import KLINE_INTERVAL, KlineStore, to_epochs
+from .pricing import PricingEngine
+from .fixed import from_cents, to_cents, to_sats
+from .rollups import update_rollups
+from .prices import BinancePriceProvider
+from .operations import get_classifier
+from .readers import HistoryRow, chunked, load_hist_file, parse_statement_lines, process_raw_data, read_hist_file
+from .storage import Storage, create_storage, summarise
+from .swaps import Leg, apply_swap_group
+from .tracker import Tracker
 
 
 def get_epoch(utc_date: str) -> int:
-    utc_date = f"{utc_date[:-2]}00"
-    date_int = datetime.strptime(utc_date, "%Y-%m-%d %H:%M:%S").timestamp() * 1000
-    return int(date_int)
+    date_int = calendar.timegm(datetime.strptime(utc_date, "%Y-%m-%d %H:%M:%S").timetuple()) * 1000
+    return date_int - date_int % KLINE_INTERVAL
+
+
+def submit_in_order(
+    pool: Executor, task: Callable[..., Any], jobs: Iterable[tuple], workers: int
+) -> Iterator[tuple[tuple, Future]]:
+    # the pool works on the jobs while the caller is the only writer, at most 2 jobs per worker are kept in
+    # flight so memory doesn't grow when the writer falls behind
+    in_flight: deque[tuple[tuple, Future]] = deque()
+    for job in jobs:
+        in_flight.append((job, pool.submit(task, *job)))
+        if len(in_flight) >= workers * 2:
+            yield in_flight.popleft()
+    while in_flight:
+        yield in_flight.popleft()
 
 
 class Collect:
     STABLE_COIN = ("BUSD", "USDT")
     OTHER_BASE_COIN = ("BTC", "ETH", "BNB")
     FIAT_EXCHANGE_RATE = 1.28
+    CHUNK_SIZE = 5000
 
     def __init__(self, dbfile: str = "./sqlite2.db") -> None:
         self.conn = sqlite3.connect(dbfile, detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES)
         self.start_db()
+        # actions go through the same Storage as Report, the history tables stay on the sqlite3 connection
+        self.storage: Storage = create_storage(f"sqlite:///{dbfile}")
         self.logger = logging.getLogger("COLLECT")
         self.history_index_table = "history_index"
         self.actions_table = "actions"
         self.history_table = "history"
-        self.track: dict = {}
+        self.track = Tracker()
+        # pending SWAP and FEE legs of the last utc_date, see process()
+        self.swap: list[dict] = []
+        self.investments: dict[uuid.UUID, float] = {}
+        # value at the swap time of the dest legs priced by price_swaps() and not replayed yet
+        self.swap_values: dict[uuid.UUID, float] = {}
+        self.gain_loss: list[dict] = []
         self.binance_url = "https://api.binance.com"
+        self.prices = BinancePriceProvider(self.binance_url)
+        self.klines: KlineStore | None = None
+        self.pricing: PricingEngine | None = None
+        # (pair, first, last) open_time of every file written since the rollups were last updated
+        self.rollup_ranges: list[tuple[str, int, int]] = []
 
     def start_db(self) -> None:
         cursor = self.conn.cursor()
@@ -102,29 +92,38 @@ class Collect:
         self.conn.commit()
         cursor.close()
 
-    def proccess_raw_statement(self, file_list: str) -> None:
-        action_list: list[dict] = []
-        csv_reader = process_raw_data(file_list)
-        for line in csv_reader:
-            try:
-                datetime.strptime(line["UTC_Time"], "%Y-%m-%d %H:%M:%S")
-            except ValueError as err:
-                raise ValueError("Incorrect data format, should be %Y-%m-%d %H:%M:%S") from err
-
-            action_list.append(
-                {
-                    "id": str(uuid.uuid4()),
-                    "utc_date": line["UTC_Time"],
-                    "action_type": get_action_type(line["Operation"]),
-                    "coin": line["Coin"],
-                    "amount": float(line["Amount"]),
-                    "investment": float(line["Investment"]) if line["Investment"] else 0.00,
-                    "wallet": line["Wallet"],
-                }
+    def proccess_raw_statement(self, file_list: str, dry_run: bool = False) -> dict[uuid.UUID, float]:
+        self.track = Tracker()
+        self.swap = []
+        self.investments = {}
+        self.gain_loss = []
+        self.swap_values = {}
+        classifier = get_classifier()
+        statement_row = 1
+        # ids seen in the chunks before, a line repeated in the statement is replayed once like Report does
+        seen: set[uuid.UUID] = set()
+        for lines in chunked(process_raw_data(file_list), self.CHUNK_SIZE):
+            rows, unknown = parse_statement_lines(lines, classifier, statement_row)
+            if unknown:
+                raise Exception(f"Error: action '{next(iter(unknown))}' is invalid")
+            statement_row += len(lines)
+            action_list = [row for row_id, row in rows.items() if row_id not in seen]
+            seen.update(rows)
+
+            if not dry_run and action_list:
+                self.write_data(action_list)
+            self.price_swaps(action_list)
+            self.process(action_list)
+        self.end_process()
+
+        if dry_run:
+            self.logger.info(
+                f"Dry run: {len(self.investments)} swap investments and {len(self.gain_loss)} gain/loss rows "
+                "computed, nothing written"
             )
-
-        self.write_data(action_list)
-        self.process(action_list)
+        else:
+            self.write_investments()
+        return self.investments
 
     def executemany(self, sql_str: str, records) -> None:
         cursor = self.conn.cursor()
@@ -165,171 +164,325 @@ class Collect:
         self.executemany(sql_str, records)
 
     def write_data(self, records: list[dict]) -> None:
+        with self.storage.session() as session:
+            self.insert_actions(session, records)
+            session.commit()
+
+    def insert_actions(self, session: Session, records: list[dict]) -> int:
+        # the rows of a statement collected before are already there and left out, the caller commits
+        first_date = min(record["utc_date"] for record in records)
+        last_date = max(record["utc_date"] for record in records)
+        existing = {row.id for row in session.query(Actions.id).filter(Actions.utc_date.between(first_date, last_date))}
+        new_rows = [record for record in records if record["id"] not in existing]
+        if new_rows:
+            self.storage.insert_actions(session, new_rows)
+            self.storage.update_summary(
+                session,
+                summarise((row["coin"], row["action_type"], row["amount"], row["investment"]) for row in new_rows),
+            )
+        return len(new_rows)
+
+    def get_next_history_id(self) -> int:
         sql_str = f"""
-            INSERT INTO {self.actions_table}(id, utc_date, action_type, coin, amount, investment, wallet)
-            VALUES(:id, :utc_date, :action_type, :coin, :amount, :investment, :wallet);
+            SELECT COALESCE(MAX(id), 0) + 1
+            FROM {self.history_index_table}
         """
-        self.executemany(sql_str, records)
+        return self.query(sql_str, {})[0][0]
 
-    def get_history_id(self, file_name: str) -> int:
+    def get_history_pairs(self) -> list[str]:
         sql_str = f"""
-            SELECT id
+            SELECT file_name
             FROM {self.history_index_table}
-            WHERE file_name = :file_name
         """
-        row_id = self.query(sql_str, {"file_name": file_name})
-        if row_id:
-            result = 0
-        else:
+        return sorted({row[0].split("-")[0] for row in self.query(sql_str, {})})
+
+    def write_history(self, file_name: str, file_id: int, history: Iterable[HistoryRow]) -> None:
+        index_str = f"""
+            INSERT INTO {self.history_index_table}(id, file_name)
+            VALUES(?, ?);
+        """
+        history_str = f"""
+            INSERT INTO {self.history_table}(open_time, pair, close_time, open, high, low, close, file_id)
+            VALUES(?, ?, ?, ?, ?, ?, ?, ?);
+        """
+        # the file and its history_index row are committed together, a failed or interrupted import never
+        # marks a file as imported without its rows
+        with METRICS.span("history.write"):
+            with self.conn:
+                self.conn.execute(index_str, (file_id, file_name))
+                self.conn.executemany(history_str, self.track_rollup_range(history))
+        METRICS.count("history.files")
+
+    def track_rollup_range(self, history: Iterable[HistoryRow]) -> Iterator[HistoryRow]:
+        first = last = None
+        for row in history:
+            if first is None:
+                first = row
+            last = row
+            yield row
+        if first is not None and last is not None:
+            self.rollup_ranges.append((first[1], min(first[0], last[0]), max(first[0], last[0])))
+
+    def update_rollups(self, rebuild: bool = False) -> None:
+        if rebuild:
             sql_str = f"""
-                INSERT INTO {self.history_index_table} (file_name)
-                VALUES(:file_name)
+                SELECT pair, MIN(open_time), MAX(open_time)
+                FROM {self.history_table}
+                GROUP BY pair;
             """
-            result = self.insert(sql_str, {"file_name": file_name})
-        return result
+            self.rollup_ranges = [(row[0], row[1], row[2]) for row in self.query(sql_str, {})]
+        rows = 0
+        with METRICS.span("history.rollups"):
+            with self.conn:
+                for pair, first_time, last_time in sorted(self.rollup_ranges):
+                    rows += update_rollups(self.conn, pair, first_time, last_time)
+        self.logger.info(f"{rows} rollup klines of {len(self.rollup_ranges)} files updated")
+        self.rollup_ranges = []
+
+    def start_bulk_load(self) -> int:
+        cursor = self.conn.cursor()
+        synchronous = cursor.execute("PRAGMA synchronous;").fetchone()[0]
+        cursor.execute("PRAGMA journal_mode = WAL;")
+        cursor.execute("PRAGMA synchronous = OFF;")
+        cursor.execute("DROP INDEX IF EXISTS history_pair_time;")
+        self.conn.commit()
+        cursor.close()
+        return synchronous
+
+    def end_bulk_load(self, synchronous: int) -> None:
+        cursor = self.conn.cursor()
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS history_pair_time ON {self.history_table}(pair, open_time);")
+        cursor.execute(f"PRAGMA synchronous = {synchronous};")
+        cursor.execute("PRAGMA optimize;")
+        self.conn.commit()
+        cursor.close()
 
-    def write_history(self, history: list[dict]) -> None:
+    def save_history(self, csv_dir: str, workers: int | None = None) -> None:
+        if not path.isdir(csv_dir):
+            raise Exception(f"ERROR: invalid directory '{csv_dir}'")
+
+        # ids are handed out up front so the workers can tag the rows, a file whose import fails leaves no
+        # history_index row and its id is handed out again by the next run
+        existing = self.get_history_files()
+        new_files = [single_file for single_file in sorted(listdir(csv_dir)) if single_file not in existing]
+        first_id = self.get_next_history_id()
+        pending = [(single_file, first_id + idx) for idx, single_file in enumerate(new_files)]
+        workers = workers or cpu_count() or 1
+        self.logger.info(f"Importing {len(pending)} history files with {workers} workers")
+
+        synchronous = self.start_bulk_load()
+        try:
+            if workers == 1:
+                for single_file, file_id in pending:
+                    self.write_history(single_file, file_id, load_hist_file(csv_dir, single_file, file_id))
+            else:
+                with ProcessPoolExecutor(max_workers=workers) as pool:
+                    parsed_files = submit_in_order(pool, partial(read_hist_file, csv_dir), pending, workers)
+                    for (single_file, file_id), parsed in parsed_files:
+                        self.write_history(single_file, file_id, parsed.result())
+        finally:
+            # PRAGMA synchronous can't change inside a transaction, whatever a failure left open is rolled back
+            # first so the original error isn't masked
+            self.conn.rollback()
+            self.end_bulk_load(synchronous)
+            self.update_rollups()
+
+    def get_history_files(self) -> set[str]:
         sql_str = f"""
-            INSERT INTO {self.history_table}(open_time, pair, close_time, open, high, low, close, file_id)
-            VALUES(:open_time, :pair, :close_time, :open, :high, :low, :close, :file_id);
+            SELECT file_name
+            FROM {self.history_index_table}
         """
+        return {row[0] for row in self.query(sql_str, {})}
 
-        self.executemany(sql_str, history)
+    def write_history_zip(self, kline_month: KlineMonth, data: bytes) -> None:
+        file_id = self.get_next_history_id()
+        self.write_history(kline_month.file_name, file_id, read_kline_zip(data, kline_month, file_id))
 
-    def save_history(self, csv_dir) -> None:
-        if path.isdir(csv_dir):
-            for single_file in listdir(csv_dir):
-                file_id = self.get_history_id(single_file)
-                if file_id:
-                    result = load_hist_file(csv_dir, single_file, file_id)
-                    self.write_history(result)
+    def save_download(self, kline_month: KlineMonth, download: Future, failed: list[str]) -> None:
+        try:
+            data = download.result()
+        except Exception as err:  # pylint: disable=broad-except
+            # a failed month is left out of history_index so the next run retries it
+            self.logger.error(f"{kline_month.name}: {err}")
+            failed.append(kline_month.name)
+            return
+        if data is None:
+            self.logger.warning(f"{kline_month.name} is not published, skipped")
         else:
-            raise Exception(f"ERROR: invalid directory '{csv_dir}'")
+            self.write_history_zip(kline_month, data)
+
+    def download_history(
+        self,
+        pairs: Iterable[str],
+        start: datetime | None = None,
+        end: datetime | None = None,
+        base_url: str = BINANCE_DATA_URL,
+        workers: int = 8,
+    ) -> int:
+        existing = self.get_history_files()
+        end = end or get_last_complete_month(datetime.now(timezone.utc))
+        pending = get_missing_months(pairs, start or FIRST_MONTH, end, existing)
+        self.logger.info(f"Downloading {len(pending)} missing kline months with {workers} workers")
+
+        downloader = KlineDownloader(base_url, workers)
+        failed: list[str] = []
+        synchronous = self.start_bulk_load()
+        # threads download and check the zips
+        pool = ThreadPoolExecutor(max_workers=workers)
+        try:
+            downloads = submit_in_order(pool, downloader.fetch, [(kline_month,) for kline_month in pending], workers)
+            for (kline_month,), download in downloads:
+                self.save_download(kline_month, download, failed)
+        finally:
+            # an interrupted run doesn't wait for the months still queued
+            pool.shutdown(cancel_futures=True)
+            downloader.close()
+            # a month interrupted halfway is rolled back before the journal mode is restored
+            self.conn.rollback()
+            self.end_bulk_load(synchronous)
+            # months already committed get their rollups even when the run is interrupted
+            self.update_rollups()
+        if failed:
+            raise Exception(f"Error: {len(failed)} kline months failed, run again to retry them: {', '.join(failed)}")
+        return len(pending)
+
+    def write_investments(self) -> None:
+        with self.storage.session() as session:
+            deltas = []
+            for row_ids in chunked(self.investments, self.CHUNK_SIZE):
+                stored = session.query(Actions.id, Actions.coin, Actions.action_type, Actions.investment)
+                deltas += [
+                    (row.coin, row.action_type, 0.0, self.investments[row.id] - row.investment)
+                    for row in stored.filter(Actions.id.in_(row_ids))
+                ]
+            session.bulk_update_mappings(
+                Actions, [{"id": row_id, "investment": investment} for row_id, investment in self.investments.items()]
+            )
+            self.storage.update_summary(session, summarise(deltas))
+            if self.gain_loss:
+                self.insert_actions(session, self.gain_loss)
+            session.commit()
+        self.logger.info(f"{len(self.investments)} swap investments and {len(self.gain_loss)} gain/loss rows written")
+
+    def load_klines(self, store_dir: str, rebuild: bool = False) -> None:
+        self.klines = KlineStore(store_dir)
+        if rebuild:
+            self.klines.build(self.conn, self.history_table)
+        self.pricing = PricingEngine(self.klines, self.get_history_pairs(), self.STABLE_COIN)
+
+    def get_price(self, pair: str, open_time: int) -> float:
+        if self.klines is None:
+            raise Exception("ERROR: klines are not loaded, call load_klines() first")
+        result = self.klines.get_price(pair, open_time)
+        if np.isnan(result):
+            self.logger.error(f"ERROR: {pair=} {open_time=} NOT FOUND")
+            result = 0.0
+        return result
 
-    def update_row_investment(self, row_id: str, investment: float, coin: str) -> None:
-        sql_str = """
-            UPDATE actions
-            SET investment = :investment
-            WHERE id = :id;
-        """
-        self.execute(sql_str, {"investment": investment, "id": row_id})
-        self.track[coin]["investment"] += investment
-
-    # def get_price(self, pair: str, open_time: int) -> float:
-    #     sql_str = f"""
-    #         SELECT open, high, low, close
-    #         FROM {self.history_table}
-    #         WHERE open_time = :open_time
-    #         AND pair = :pair;
-    #     """
-
-    #     rows = self.query(sql_str, {"pair": pair, "open_time": open_time})
-    #     if rows:
-    #         row = rows[0]
-    #         result = (row[0] + row[1] + row[2] + row[3]) / 4
-    #     else:
-    #         logging.error(f"ERROR: {pair=} {open_time=} NOT FOUND")
-    #         logging.error(rows)
-    #         result = 0.0
-    #     return result
-
-    # def calculate_swap_investment(self, swap: dict) -> float:
-    #     amount = swap["dest"]["amount"]
-    #     coin = swap["dest"]["coin"]
-    #     utc_date = swap["utc_date"]
-    #     if coin not in self.STABLE_COIN:
-    #         utc_date = f"{utc_date[:-2]}00"
-    #         date_int = int(datetime.strptime(utc_date, "%Y-%m-%d %H:%M:%S").timestamp() * 1000)
-    #         price = self.get_price(f"{coin}BUSD", date_int)
-    #         investment = amount * price
-    #         investment = investment * self.FIAT_EXCHANGE_RATE
-    #     else:
-    #         investment = amount * self.FIAT_EXCHANGE_RATE
-    #     return investment
-
-    # def add_gain_loss(self, action: dict) -> None:
-    #     sql_str = """
-    #         INSERT INTO actions(id, utc_date, action_type, coin, amount, investment, wallet)
-    #         VALUES(:id, :utc_date, :action_type, :coin, :amount, :investment, :wallet);
-    #     """
-    #     self.execute(sql_str, action)
-    #     self.track[action["coin"]]["investment"] += action["investment"]
-
-    def update_investment(self, swap: dict) -> None:
-        # investment = self.calculate_swap_investment(swap)
-        src_id = swap["src"]["id"]
-        dest_id = swap["dest"]["id"]
-        src_coin = swap["src"]["coin"]
-        dest_coin = swap["dest"]["coin"]
-        src_amount = swap["src"]["amount"]
-        dest_amount = swap["dest"]["amount"]
-        # utc_date = swap["utc_date"]
-        # wallet = swap["wallet"]
-
-        track_investment = self.track[src_coin]["investment"] * ((src_amount * -1) / self.track[src_coin]["amount"])
-        # gain_loss = investment - track_investment
-        # action_type = ""
-        # if gain_loss > 0:
-        #     action_type = "GAIN"
-        # elif gain_loss < 0:
-        #     action_type = "LOSS"
-        # if action_type:
-        #     self.add_gain_loss(
-        #         {
-        #             "id": str(uuid.uuid4()),
-        #             "utc_date": utc_date,
-        #             "action_type": action_type,
-        #             "coin": dest_coin,
-        #             "amount": 0.00,
-        #             "investment": gain_loss,
-        #             "wallet": wallet,
-        #         }
-        #     )
-        # investment -= gain_loss  # IMPORTANT!
-        self.update_row_investment(src_id, track_investment * -1, src_coin)
-        self.update_row_investment(dest_id, track_investment, dest_coin)
-        self.track[src_coin]["amount"] += src_amount
-        self.track[dest_coin]["amount"] += dest_amount
-        # if self.track[src_coin]["investment"] < 0:
-        #     raise Exception(f"{src_coin} {self.track[src_coin]}")
-
-    def process(self, action_list: list[dict]) -> None:
-        swap: dict = {}
+    def calculate_swaps_investment(self, swaps: list[dict]) -> list[float]:
+        # swaps without a price at that minute are returned as NaN
+        if self.pricing is None:
+            raise Exception("ERROR: klines are not loaded, call load_klines() first")
+        amounts = np.array([swap["dest"]["amount"] for swap in swaps], dtype=np.float64)
+        prices = np.ones(len(swaps))
+        coins = np.array([swap["dest"]["coin"] for swap in swaps])
+        open_times = to_epochs([swap["utc_date"] for swap in swaps])
+        for coin in np.unique(coins):
+            selected = coins == coin
+            prices[selected] = self.pricing.get_prices(str(coin), open_times[selected])
+        missing = np.isnan(prices)
+        if missing.any():
+            self.logger.error(f"ERROR: {int(missing.sum())} swap prices NOT FOUND")
+        return (amounts * prices * self.FIAT_EXCHANGE_RATE).tolist()
+
+    def price_swaps(self, action_list: list[dict]) -> None:
+        # the bought legs of a chunk are priced in one batch before the chunk is replayed, update_investment()
+        # takes the value of its dest leg from here. A swap split across two chunks finds it from the chunk before
+        if self.pricing is None:
+            return
+        dest_legs = [action for action in action_list if action["action_type"] == "SWAP" and action["amount"] > 0.0]
+        if dest_legs:
+            values = self.calculate_swaps_investment([{"utc_date": leg["utc_date"], "dest": leg} for leg in dest_legs])
+            self.swap_values.update((leg["id"], value) for leg, value in zip(dest_legs, values))
+
+    def add_gain_loss(self, action: dict) -> None:
+        self.gain_loss.append(action)
+        self.track.investments[self.track.index[action["coin"]]] += to_cents(action["investment"])
+
+    def update_investment(self, legs: list[dict]) -> None:
+        # the cost basis is the one Report uses, every leg of the swap goes through tools/swaps.py at once
+        track = self.track
+        src = [leg for leg in legs if leg["action_type"] == "SWAP" and leg["amount"] <= 0.0]
+        dest = [leg for leg in legs if leg["action_type"] == "SWAP" and leg["amount"] > 0.0]
+        fees = [leg for leg in legs if leg["action_type"] == "FEE"]
+        if src and dest:
+            result = apply_swap_group(
+                track.amounts,
+                track.investments,
+                [Leg(track.index[leg["coin"]], to_sats(leg["amount"])) for leg in src],
+                [Leg(track.index[leg["coin"]], to_sats(leg["amount"])) for leg in dest],
+                [Leg(track.index[leg["coin"]], to_sats(leg["amount"])) for leg in fees],
+            )
+            for leg, investment in zip(src + dest + fees, result.src + result.dest + result.fees):
+                self.investments[leg["id"]] = from_cents(investment)
+            if self.pricing is not None:
+                self.add_swap_gain_loss(dest, result.dest)
+        else:
+            # fees without a swap only take amount, a swap missing one side is left out
+            for fee in fees:
+                track.amounts[track.index[fee["coin"]]] += to_sats(fee["amount"])
+            if src or dest:
+                self.logger.warning(f"WARNING: swap at {legs[0]['utc_date']} has no {'dest' if src else 'src'} leg")
+
+    def add_swap_gain_loss(self, dest: list[dict], investments: list[int]) -> None:
+        # the bought legs against their value at that minute, see price_swaps()
+        for leg, investment in zip(dest, investments):
+            value = self.swap_values.pop(leg["id"], math.nan)
+            gain_loss = 0 if math.isnan(value) else to_cents(value) - investment
+            if gain_loss:
+                # one row per bought leg, its id comes from the leg so collecting the statement again finds it
+                self.add_gain_loss(
+                    {
+                        "id": uuid.uuid5(leg["id"], "GAIN_LOSS"),
+                        "utc_date": leg["utc_date"],
+                        "action_type": "GAIN" if gain_loss > 0 else "LOSS",
+                        "coin": leg["coin"],
+                        "action_id": leg["action_id"],
+                        "amount": 0.00,
+                        "investment": from_cents(gain_loss),
+                        "wallet": leg["wallet"],
+                        "statement_row": leg["statement_row"],
+                    }
+                )
+
+    def process(self, action_list: Iterable[dict]) -> None:
+        # the SWAP and FEE legs of one trade share utc_date. They are held in self.swap until the utc_date
+        # changes, so a swap split across two chunks is still complete, see end_process()
+        track = self.track
         for action in action_list:
-            coin = action["coin"]
-            action_id = action["utc_date"]
-            amount = action["amount"]
-
-            if coin not in self.track:
-                self.track[coin] = {
-                    "amount": 0.0,
-                    "investment": 0.0,
-                }
-
-            if action["action_type"] in ["DEPOSIT", "WITHDRAW", "ADJUSTMENT"]:
-                self.track[coin]["investment"] += action["investment"]
-                self.track[coin]["amount"] += amount
-            elif action["action_type"] in ["FEE", "INTEREST", "MINING", "TRANSFER"]:
-                self.track[coin]["amount"] += amount
-            elif action["action_type"] == "SWAP":
-                # we process SWAP here
-                # we have two rows and we can't control the order of them
-                # swap should contain only two transactions
-
-                if action_id not in swap:
-                    swap.clear()
-                    swap = {action_id: {"utc_date": action["utc_date"], "wallet": action["wallet"]}}
-                src_dest = "dest" if amount > 0.0 else "src"
-                swap[action_id][src_dest] = {"amount": amount, "coin": coin, "id": action["id"]}
-
-                # we make sure we have the two rows stored in cache
-                # if "dest" in swap[action_id] and "src" in swap[action_id]:
-                if all(k in swap[action_id] for k in ("dest", "src")):
-                    self.update_investment(swap[action_id])
+            if self.swap and action["utc_date"] != self.swap[0]["utc_date"]:
+                self.update_investment(self.swap)
+                self.swap = []
+            coin = track.intern(action["coin"])
+            action_type = action["action_type"]
+            if action_type in ("DEPOSIT", "WITHDRAW", "ADJUSTMENT"):
+                track.investments[coin] += to_cents(action["investment"])
+                track.amounts[coin] += to_sats(action["amount"])
+            elif action_type in ("INTEREST", "MINING", "TRANSFER"):
+                track.amounts[coin] += to_sats(action["amount"])
+            elif action_type in ("SWAP", "FEE"):
+                self.swap.append(action)
             else:
-                raise Exception(f"Unknown action {action['action_type']}")
+                raise Exception(f"Unknown action {action_type}")
+
+    def end_process(self) -> None:
+        if self.swap:
+            self.update_investment(self.swap)
+            self.swap = []
 
     def close_db(self) -> None:
+        self.prices.close()
+        self.storage.close()
         self.conn.close()
 
     def get_actual_investment(self) -> float:
@@ -360,27 +513,34 @@ class Collect:
             "min_price",
             "difference",
         ]
-        with requests.Session() as sess:
-            for item in raw_portfolio:
-                raw_response = sess.get(f"{self.binance_url}/api/v3/avgPrice?symbol={item[0]}BUSD")
-                raw_response.raise_for_status()
-                json_response = raw_response.json()
-                current_price = round(float(json_response["price"]) * self.FIAT_EXCHANGE_RATE, 2)
-                now = datetime.now()
+        prices = self.prices.get_prices([item[0] for item in raw_portfolio])
+        unpriced = []
+        for item in raw_portfolio:
+            now = datetime.now()
+            price = prices.get(item[0])
+            if price is None:
+                # shown without a value and left out of the total
+                unpriced.append(item[0])
+                current_price: Any = "-"
+                current_value: Any = "-"
+                difference: Any = "-"
+            else:
+                current_price = round(price * self.FIAT_EXCHANGE_RATE, 2)
                 current_value = round(current_price * item[1], 2)
+                difference = round(current_value - item[2], 2)
                 all_values += current_value
-                table.add_row(
-                    [
-                        now.strftime("%H:%M:%S %d/%b/%Y"),
-                        item[2],  # investment
-                        item[0],  # coin
-                        item[1],  # amount
-                        current_price,
-                        current_value,
-                        item[3],  # min_price
-                        round(current_value - item[2], 2),  # difference
-                    ]
-                )
+            table.add_row(
+                [
+                    now.strftime("%H:%M:%S %d/%b/%Y"),
+                    item[2],  # investment
+                    item[0],  # coin
+                    item[1],  # amount
+                    current_price,
+                    current_value,
+                    item[3],  # min_price
+                    difference,
+                ]
+            )
         #         row = {
         #             "time": now.strftime("%H:%M:%S %d/%b/%Y"),
         #             "coin": item[0],
@@ -391,11 +551,13 @@ class Collect:
         #             "difference": value - item[2],
         #         }
         #         portfolio.append(row)
+        if unpriced:
+            self.logger.warning(f"WARNING: no price for {', '.join(unpriced)}, the total only adds up the priced coins")
         table.add_row(
             [
                 "-",
                 actual_investment,
-                "-",
+                "partial" if unpriced else "-",
                 "-",
                 "-",
                 round(all_values, 3),
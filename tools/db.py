@@ -1,5 +1,5 @@
 import uuid
-from sqlalchemy import Column, String, DateTime, Float, ForeignKey
+from sqlalchemy import Column, String, DateTime, Float, ForeignKey, Integer
 from sqlalchemy.orm import relationship, Mapped, registry
 from sqlalchemy.orm.decl_api import DeclarativeMeta
 from sqlalchemy.dialects.postgresql import UUID
@@ -55,6 +55,7 @@ class Actions(Base):
     amount: float = Column(Float(precision=13), nullable=False)
     investment: float = Column(Float(precision=7), nullable=False)
     wallet: str = Column(String, ForeignKey("wallets.name"))
+    statement_row: int = Column(Integer, nullable=False, server_default="0")
     wallet_rel: Mapped[str] = relationship("Wallets", back_populates="actions_rel")
     coin_rel: Mapped[str] = relationship("Coins", back_populates="actions_rel")
     action_type_rel: Mapped[str] = relationship("Action_Type", back_populates="actions_rel")
@@ -71,3 +72,26 @@ class Portfolio(Base):
 class Actual_Investment(Base):
     __tablename__ = "actual_investment"
     investment: float = Column(Float(precision=7), primary_key=True)
+
+
+class Action_Summary(Base):
+    __tablename__ = "action_summary"
+    coin: str = Column(String, ForeignKey("coins.coin_token"), primary_key=True)
+    action_type: str = Column(String, ForeignKey("action_type.name"), primary_key=True)
+    amount: float = Column(Float(precision=21), nullable=False)
+    investment: float = Column(Float(precision=15), nullable=False)
+
+
+class Tracker_Checkpoint(Base):
+    __tablename__ = "tracker_checkpoint"
+    coin: str = Column(String, ForeignKey("coins.coin_token"), primary_key=True)
+    amount: float = Column(Float(precision=53), nullable=False)
+    investment: float = Column(Float(precision=53), nullable=False)
+
+
+class Replay_Checkpoint(Base):
+    __tablename__ = "replay_checkpoint"
+    id: int = Column(Integer, primary_key=True)
+    utc_date = Column(DateTime(timezone=False), nullable=False)
+    action_id: Mapped[uuid.UUID] = Column(UUID(as_uuid=True), nullable=False)
+    row_count: int = Column(Integer, nullable=False)
@@ -1,15 +1,4 @@
-from typing import TypedDict, Literal
-
-from .db import Actions
-
-
-SWAP_KEYS = Literal["dest", "src"]
-
-
-class Swap(TypedDict):
-    dest: Actions
-    src: Actions
-
+from typing import Literal
 
 ACTION_TYPE = Literal[
     "ADJUSTMENT",
@@ -0,0 +1,145 @@
+import csv
+import io
+import hashlib
+import logging
+import zipfile
+from datetime import datetime, timedelta
+from typing import Iterable, Iterator, NamedTuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .metrics import METRICS
+from .readers import HistoryRow, parse_hist_rows
+
+BINANCE_DATA_URL = "https://data.binance.vision"
+KLINES_PATH = "data/spot/monthly/klines"
+# where a download into an empty history starts, the first month data/download.sh used to fetch
+FIRST_MONTH = datetime(2021, 3, 1)
+# pairs data/download.sh used to fetch
+PAIRS = (
+    "ADABTC",
+    "ADABUSD",
+    "ADAETH",
+    "ATOMBUSD",
+    "AXSBUSD",
+    "BNBBTC",
+    "BNBBUSD",
+    "BNBETH",
+    "BNBUSDT",
+    "BTCBUSD",
+    "BTCUSDT",
+    "DOGEBUSD",
+    "DOGEUSDT",
+    "DOTBUSD",
+    "ETHBTC",
+    "ETHBUSD",
+    "ETHUSDT",
+    "LTCBNB",
+    "LTCBTC",
+    "LTCBUSD",
+    "LTCUSDT",
+    "LUNABUSD",
+    "SOLBNB",
+    "SOLBUSD",
+    "UNIBUSD",
+    "XMRBNB",
+    "XMRBTC",
+    "XMRBUSD",
+    "XMRUSDT",
+    "XRPBUSD",
+)
+
+
+class KlineMonth(NamedTuple):
+    pair: str
+    year: int
+    month: int
+
+    @property
+    def name(self) -> str:
+        return f"{self.pair}-1m-{self.year}-{self.month:02d}"
+
+    @property
+    def file_name(self) -> str:
+        # the CSV inside the zip, the name history_index knows the month by
+        return f"{self.name}.csv"
+
+
+def get_months(start: datetime, end: datetime) -> list[tuple[int, int]]:
+    months = []
+    year, month = start.year, start.month
+    while (year, month) <= (end.year, end.month):
+        months.append((year, month))
+        year, month = year + month // 12, month % 12 + 1
+    return months
+
+
+def get_last_complete_month(now: datetime) -> datetime:
+    # Binance publishes a month once it is over
+    last_day = now.replace(day=1) - timedelta(days=1)
+    return datetime(last_day.year, last_day.month, 1)
+
+
+def get_missing_months(pairs: Iterable[str], start: datetime, end: datetime, existing: set[str]) -> list[KlineMonth]:
+    # every month of every pair from start to end that history_index doesn't have, so a month that failed or a pair
+    # cut short by an interruption is fetched by the next run whatever the other pairs hold
+    return [
+        kline_month
+        for pair in pairs
+        for kline_month in (KlineMonth(pair, year, month) for year, month in get_months(start, end))
+        if kline_month.file_name not in existing
+    ]
+
+
+def read_kline_zip(data: bytes, kline_month: KlineMonth, file_id: int) -> Iterator[HistoryRow]:
+    with zipfile.ZipFile(io.BytesIO(data)) as zip_file:
+        with zip_file.open(kline_month.file_name) as member:
+            yield from parse_hist_rows(
+                csv.reader(io.TextIOWrapper(member, encoding="utf-8", newline="")), kline_month.pair, file_id
+            )
+
+
+class KlineDownloader:
+    CHUNK_SIZE = 1 << 16
+
+    def __init__(self, base_url: str = BINANCE_DATA_URL, workers: int = 8, timeout: float = 60.0) -> None:
+        self.logger = logging.getLogger("DOWNLOADER")
+        self.base_url = base_url.rstrip("/")
+        self.workers = max(1, workers)
+        self.timeout = timeout
+        self.sess = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.workers)
+        self.sess.mount("http://", adapter)
+        self.sess.mount("https://", adapter)
+
+    def get_url(self, kline_month: KlineMonth) -> str:
+        return f"{self.base_url}/{KLINES_PATH}/{kline_month.pair}/1m/{kline_month.name}.zip"
+
+    def fetch_checksum(self, url: str) -> str:
+        raw_response = self.sess.get(f"{url}.CHECKSUM", timeout=self.timeout)
+        raw_response.raise_for_status()
+        # "<sha256>  <file name>"
+        return raw_response.text.split()[0].lower()
+
+    def fetch(self, kline_month: KlineMonth) -> bytes | None:
+        # the zip of the month once its SHA-256 matches the published checksum, None if Binance has no such file
+        url = self.get_url(kline_month)
+        with METRICS.span("download.http"):
+            with self.sess.get(url, stream=True, timeout=self.timeout) as raw_response:
+                if raw_response.status_code == 404:
+                    return None
+                raw_response.raise_for_status()
+                sha256 = hashlib.sha256()
+                data = bytearray()
+                for chunk in raw_response.iter_content(self.CHUNK_SIZE):
+                    sha256.update(chunk)
+                    data += chunk
+            checksum = self.fetch_checksum(url)
+        METRICS.count("download.bytes", len(data))
+        if sha256.hexdigest() != checksum:
+            raise Exception(f"Error: checksum of '{kline_month.name}.zip' doesn't match, {sha256.hexdigest()}")
+        return bytes(data)
+
+    def close(self) -> None:
+        self.sess.close()
@@ -0,0 +1,173 @@
+from operator import itemgetter
+from typing import Any, Iterable, NamedTuple
+
+import numpy as np
+
+from .fixed import AMOUNT_SCALE, INVESTMENT_SCALE
+from .swaps import Leg, apply_swap_group, get_swap_investment
+from .tracker import Tracker
+
+# codes below INVESTMENT_TYPES move investment and amount, codes below SWAP_TYPE move only amount
+TYPE_CODES = {
+    "DEPOSIT": 0,
+    "WITHDRAW": 1,
+    "ADJUSTMENT": 2,
+    "FEE": 3,
+    "INTEREST": 4,
+    "MINING": 5,
+    "TRANSFER": 6,
+    "SWAP": 7,
+}
+INVESTMENT_TYPES = 3
+SWAP_TYPE = TYPE_CODES["SWAP"]
+FEE_TYPE = TYPE_CODES["FEE"]
+
+
+class Ledger(NamedTuple):
+    coins: list[str]
+    coin_idx: np.ndarray
+    type_code: np.ndarray
+    action_id: list[Any]
+    amount: np.ndarray
+    investment: np.ndarray
+
+
+class Replay(NamedTuple):
+    investment: np.ndarray
+    legs: np.ndarray  # rows whose investment was set by a swap
+    track: Tracker
+    swaps: int
+
+
+def build_ledger(rows: Iterable[tuple[str, str, Any, float, float]]) -> Ledger:
+    # rows are (coin, action_type, action_id, amount, investment) ordered by utc_date, amounts are turned into
+    # satoshis and investments into cents like tools.fixed does
+    rows = list(rows)
+    coins, action_types, action_ids, amounts, investments = (list(map(itemgetter(idx), rows)) for idx in range(5))
+    coin_ids = {coin: idx for idx, coin in enumerate(dict.fromkeys(coins))}
+    unknown = set(action_types) - TYPE_CODES.keys()
+    if unknown:
+        raise Exception(f"Unknown action {', '.join(sorted(unknown))}")
+    return Ledger(
+        coins=list(coin_ids),
+        coin_idx=np.fromiter(map(coin_ids.__getitem__, coins), dtype=np.int32, count=len(coins)),
+        type_code=np.fromiter(map(TYPE_CODES.__getitem__, action_types), dtype=np.int8, count=len(action_types)),
+        action_id=action_ids,
+        amount=np.rint(np.array(amounts, dtype=np.float64) * AMOUNT_SCALE).astype(np.int64),
+        investment=np.rint(np.array(investments, dtype=np.float64) * INVESTMENT_SCALE).astype(np.int64),
+    )
+
+
+def group_by_coin(ledger: Ledger, *values: np.ndarray) -> tuple[list[np.ndarray], list[list[list[int]]]]:
+    # row numbers of every coin and the running totals of each values array, in ledger order. Entry n of a
+    # running total is the sum of the first n rows of that coin, integers make it exact in any order
+    order = np.argsort(ledger.coin_idx, kind="stable")
+    bounds = np.searchsorted(ledger.coin_idx[order], np.arange(len(ledger.coins) + 1)).tolist()
+    coin_rows = [order[bounds[idx] : bounds[idx + 1]] for idx in range(len(ledger.coins))]
+    grouped = []
+    for column in values:
+        ordered = column[order]
+        grouped.append(
+            [
+                np.concatenate(([0], np.cumsum(ordered[bounds[idx] : bounds[idx + 1]]))).tolist()
+                for idx in range(len(ledger.coins))
+            ]
+        )
+    return coin_rows, grouped
+
+
+def group_swaps(ledger: Ledger) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # the SWAP and FEE legs of every action_id with both a src and a dest leg, like Report.replay groups them.
+    # Returns the leg rows ordered by group, then src/dest/fee, then row, the number of src, dest and fee legs of
+    # each group and for every leg the row after the last row of its action_id, the group is applied once all the
+    # rows of the action_id are in
+    action_ids = ledger.action_id
+    new_group = np.ones(len(action_ids), dtype=bool)
+    new_group[1:] = [current != previous for current, previous in zip(action_ids[1:], action_ids)]
+    group = np.cumsum(new_group) - 1
+    ends = np.append(np.flatnonzero(new_group)[1:], len(action_ids))
+
+    # role 0 is a src leg, 1 a dest leg and 2 a fee, anything else is not part of the swap
+    role = np.full(len(action_ids), 3, dtype=np.int8)
+    is_swap = ledger.type_code == SWAP_TYPE
+    role[is_swap] = ledger.amount[is_swap] > 0
+    role[ledger.type_code == FEE_TYPE] = 2
+    counts = np.bincount(group * 4 + role, minlength=len(ends) * 4).reshape(-1, 4)
+    complete = (counts[:, 0] > 0) & (counts[:, 1] > 0)
+
+    legs = np.flatnonzero(complete[group] & (role < 3))
+    legs = legs[np.lexsort((legs, role[legs], group[legs]))]
+    return legs, counts[complete, :3], ends[group[legs]]
+
+
+def rows_before(coin_rows: list[np.ndarray], coins: np.ndarray, rows: np.ndarray) -> np.ndarray:
+    # how many rows of each coin come before the given rows
+    result = np.zeros(len(rows), dtype=np.int64)
+    for coin, coin_row in enumerate(coin_rows):
+        selected = coins == coin
+        result[selected] = np.searchsorted(coin_row, rows[selected])
+    return result
+
+
+def replay_ledger(ledger: Ledger, track: Tracker | None = None) -> Replay:
+    new_track = track.copy() if track else Tracker()
+    tracked = [new_track.intern(coin) for coin in ledger.coins]
+    # a swap missing one side is left out and the fees around it only take amount
+    leg_rows, sizes, leg_ends = group_swaps(ledger)
+    grouped = np.zeros(len(ledger.amount), dtype=bool)
+    grouped[leg_rows] = True
+    coin_rows, (amount_totals, investment_totals) = group_by_coin(
+        ledger,
+        np.where(grouped | (ledger.type_code == SWAP_TYPE), 0, ledger.amount),
+        np.where(ledger.type_code < INVESTMENT_TYPES, ledger.investment, 0),
+    )
+    leg_coins = ledger.coin_idx[leg_rows]
+    leg_until = rows_before(coin_rows, leg_coins, leg_ends).tolist()
+    leg_coins_list = leg_coins.tolist()
+    leg_amounts = ledger.amount[leg_rows].tolist()
+
+    amount = [new_track.amounts[idx] for idx in tracked]
+    investment = [new_track.investments[idx] for idx in tracked]
+    applied = [0] * len(ledger.coins)
+    leg_investments: list[int] = []
+
+    # only the swap groups need the running state, the rows in between are caught up from the running totals
+    start = 0
+    for src_count, dest_count, fee_count in sizes.tolist():
+        end = start + src_count + dest_count + fee_count
+        for coin, coin_until in zip(leg_coins_list[start:end], leg_until[start:end]):
+            if coin_until > applied[coin]:
+                amount[coin] += amount_totals[coin][coin_until] - amount_totals[coin][applied[coin]]
+                investment[coin] += investment_totals[coin][coin_until] - investment_totals[coin][applied[coin]]
+                applied[coin] = coin_until
+        if end - start == 2:
+            # one src and one dest leg, the usual trade, is applied without building the legs
+            src_coin, dest_coin = leg_coins_list[start], leg_coins_list[start + 1]
+            amount[src_coin] += leg_amounts[start]
+            moved = get_swap_investment(amount, investment, src_coin, leg_amounts[start] * -1)
+            investment[src_coin] -= moved
+            amount[dest_coin] += leg_amounts[start + 1]
+            investment[dest_coin] += moved
+            leg_investments += (moved * -1, moved)
+        else:
+            legs = list(map(Leg, leg_coins_list[start:end], leg_amounts[start:end]))
+            outcome = apply_swap_group(
+                amount,
+                investment,
+                legs[:src_count],
+                legs[src_count : src_count + dest_count],
+                legs[src_count + dest_count :],
+            )
+            leg_investments += outcome.src
+            leg_investments += outcome.dest
+            leg_investments += outcome.fees
+        start = end
+
+    result = ledger.investment.copy()
+    result[leg_rows] = np.array(leg_investments, dtype=np.int64)
+    for idx, track_idx in enumerate(tracked):
+        new_track.amounts[track_idx] = amount[idx] + amount_totals[idx][-1] - amount_totals[idx][applied[idx]]
+        new_track.investments[track_idx] = (
+            investment[idx] + investment_totals[idx][-1] - investment_totals[idx][applied[idx]]
+        )
+    return Replay(investment=result, legs=leg_rows, track=new_track, swaps=len(sizes))
@@ -0,0 +1,63 @@
+from decimal import ROUND_HALF_EVEN, Decimal
+
+# amounts are tracked as integer satoshis (1e-8) and investments as integer cents, matching the
+# NUMERIC(13, 8) and NUMERIC(7, 2) columns so every sum is exact. Floats only exist at the database boundary
+AMOUNT_DECIMALS = 8
+INVESTMENT_DECIMALS = 2
+AMOUNT_SCALE = 10**AMOUNT_DECIMALS
+INVESTMENT_SCALE = 10**INVESTMENT_DECIMALS
+
+
+def round_units(text: str, decimals: int) -> int:
+    # a plain "-123.456" is read as integer digits and rounded half to even like Decimal would. Anything
+    # else such as exponents goes through Decimal, which also raises on what isn't a number
+    whole, _, fraction = text.partition(".")
+    negative = whole[:1] == "-"
+    digits = whole[1:] if negative else whole
+    extra = len(fraction) - decimals
+    if not (digits + fraction).isdecimal():
+        result = int(Decimal(text).scaleb(decimals).to_integral_value(ROUND_HALF_EVEN))
+    elif extra <= 0:
+        result = int(whole + fraction) * 10**-extra
+    else:
+        units = int(digits + fraction[:decimals])
+        rest = fraction[decimals:].rstrip("0")
+        if rest and (rest[0] > "5" or (rest[0] == "5" and (len(rest) > 1 or units % 2))):
+            units += 1
+        result = -units if negative else units
+    return result
+
+
+def parse_units(text: str, decimals: int) -> int:
+    # statements write every figure with all its decimals, "-123.45678900" is an int once the point is dropped
+    result = None
+    if text[-1 - decimals : len(text) - decimals] == "." and "_" not in text:
+        try:
+            result = int(text.replace(".", "", 1))
+        except ValueError:
+            pass
+    return round_units(text, decimals) if result is None else result
+
+
+def to_sats(amount: float) -> int:
+    return round(amount * AMOUNT_SCALE)
+
+
+def to_cents(investment: float) -> int:
+    return round(investment * INVESTMENT_SCALE)
+
+
+def from_sats(sats: int) -> float:
+    return sats / AMOUNT_SCALE
+
+
+def from_cents(cents: int) -> float:
+    return cents / INVESTMENT_SCALE
+
+
+def div_round(numerator: int, denominator: int) -> int:
+    # numerator / denominator rounded half to even like round() does, denominator has to be positive
+    quotient, remainder = divmod(numerator, denominator)
+    if 2 * remainder > denominator or (2 * remainder == denominator and quotient % 2):
+        quotient += 1
+    return quotient
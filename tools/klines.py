@@ -0,0 +1,100 @@
+import logging
+import sqlite3
+from os import path, makedirs, listdir
+
+import numpy as np
+
+KLINE_DTYPE = np.dtype(
+    [
+        ("open_time", np.int64),
+        ("open", np.float64),
+        ("high", np.float64),
+        ("low", np.float64),
+        ("close", np.float64),
+    ]
+)
+KLINE_INTERVAL = 60000
+
+
+def to_epochs(utc_dates: list[str]) -> np.ndarray:
+    minutes = np.array(utc_dates, dtype="datetime64[s]").astype("datetime64[m]")
+    return minutes.astype(np.int64) * KLINE_INTERVAL
+
+
+def lookup_prices(
+    times: np.ndarray,
+    ohlc: np.ndarray,
+    open_times: np.ndarray,
+    interval: int = KLINE_INTERVAL,
+    precision: int = KLINE_INTERVAL,
+) -> np.ndarray:
+    # price of the kline containing each timestamp, NaN where there is no kline. At kline precision a
+    # timestamp stands for its whole minute and gets the OHLC average. Otherwise it gets the open of its bucket:
+    # the high, low and close of a 1h or 1d bucket come later than its start, a day valued at 00:00 would see the
+    # rest of the day
+    prices = np.full(open_times.shape, np.nan)
+    if len(times):
+        idx = np.searchsorted(times, open_times, side="right") - 1
+        found = (idx >= 0) & (open_times - times[np.maximum(idx, 0)] < interval)
+        if interval == precision == KLINE_INTERVAL:
+            prices[found] = ohlc[idx[found]].mean(axis=1)
+        else:
+            prices[found] = ohlc[idx[found], 0]
+    return prices
+
+
+class KlineStore:
+    def __init__(self, store_dir: str) -> None:
+        self.store_dir = store_dir
+        self.logger = logging.getLogger("KLINES")
+        self.pairs: dict[str, tuple[np.ndarray, np.ndarray]] = {}
+
+    def get_file(self, pair: str, column: str) -> str:
+        return path.join(self.store_dir, f"{pair}.{column}.npy")
+
+    def build(self, conn: sqlite3.Connection, history_table: str = "history", pairs: list[str] | None = None) -> None:
+        makedirs(self.store_dir, exist_ok=True)
+        if pairs is None:
+            pairs = [row[0] for row in conn.execute(f"SELECT DISTINCT pair FROM {history_table};")]
+        for pair in pairs:
+            cursor = conn.execute(
+                f"""
+                SELECT open_time, open, high, low, close
+                FROM {history_table}
+                WHERE pair = ?
+                ORDER BY open_time;
+                """,
+                (pair,),
+            )
+            klines = np.fromiter(cursor, dtype=KLINE_DTYPE)
+            cursor.close()
+            ohlc = np.column_stack([klines["open"], klines["high"], klines["low"], klines["close"]])
+            np.save(self.get_file(pair, "time"), np.ascontiguousarray(klines["open_time"]))
+            np.save(self.get_file(pair, "ohlc"), ohlc)
+            self.pairs.pop(pair, None)
+            self.logger.debug(f"{pair}: {len(klines)} klines stored")
+
+    def available_pairs(self) -> list[str]:
+        pairs = []
+        if path.isdir(self.store_dir):
+            pairs = sorted(name[: -len(".time.npy")] for name in listdir(self.store_dir) if name.endswith(".time.npy"))
+        return pairs
+
+    def load(self, pair: str) -> tuple[np.ndarray, np.ndarray]:
+        if pair not in self.pairs:
+            time_file = self.get_file(pair, "time")
+            if path.exists(time_file):
+                self.pairs[pair] = (
+                    np.load(time_file, mmap_mode="r"),
+                    np.load(self.get_file(pair, "ohlc"), mmap_mode="r"),
+                )
+            else:
+                self.pairs[pair] = (np.empty(0, dtype=np.int64), np.empty((0, 4), dtype=np.float64))
+        return self.pairs[pair]
+
+    def get_prices(self, pair: str, open_times: np.ndarray) -> np.ndarray:
+        times, ohlc = self.load(pair)
+        return lookup_prices(times, ohlc, np.asarray(open_times, dtype=np.int64))
+
+    def get_price(self, pair: str, open_time: int) -> float:
+        return float(self.get_prices(pair, np.array([open_time]))[0])
@@ -0,0 +1,64 @@
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import ContextManager, Iterator
+
+from prettytable import PrettyTable
+
+NO_SPAN = nullcontext()
+
+
+class Metrics:
+    def __init__(self) -> None:
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.spans: dict[str, list[float]] = {}
+        self.counters: dict[str, int] = {}
+
+    def enable(self) -> None:
+        self.enabled = True
+
+    def reset(self) -> None:
+        with self.lock:
+            self.spans.clear()
+            self.counters.clear()
+
+    def span(self, name: str) -> ContextManager:
+        return self.timed(name) if self.enabled else NO_SPAN
+
+    @contextmanager
+    def timed(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                self.spans.setdefault(name, []).append(elapsed)
+
+    def count(self, name: str, value: int = 1) -> None:
+        if self.enabled:
+            with self.lock:
+                self.counters[name] = self.counters.get(name, 0) + value
+
+    def summary(self) -> PrettyTable:
+        table = PrettyTable()
+        table.field_names = ["name", "calls", "total (s)", "mean (ms)", "max (ms)"]
+        table.align["name"] = "l"
+        with self.lock:
+            for name, timings in sorted(self.spans.items()):
+                table.add_row(
+                    [
+                        name,
+                        len(timings),
+                        f"{sum(timings):,.3f}",
+                        f"{sum(timings) / len(timings) * 1000:,.3f}",
+                        f"{max(timings) * 1000:,.3f}",
+                    ]
+                )
+            for name, value in sorted(self.counters.items()):
+                table.add_row([name, f"{value:,}", "-", "-", "-"])
+        return table
+
+
+METRICS = Metrics()
@@ -0,0 +1,93 @@
+import json
+import os
+from collections import Counter
+from os import path
+from types import MappingProxyType
+from typing import Iterable, Mapping, get_args
+
+from .definitions import ACTION_TYPE
+
+OPERATIONS_FILE_ENV = "REPORT_OPERATIONS_FILE"
+DEFAULT_OPERATIONS_FILE = path.join(path.dirname(path.dirname(path.abspath(__file__))), "data", "operations.json")
+ACTION_TYPES = frozenset(get_args(ACTION_TYPE))
+# statement operation -> action type, operations are matched case-insensitively
+OPERATIONS: Mapping[str, ACTION_TYPE] = MappingProxyType(
+    {
+        "POS savings interest": "INTEREST",
+        "POS savings purchase": "TRANSFER",
+        "POS savings redemption": "TRANSFER",
+        "transfer_out": "TRANSFER",
+        "transfer_in": "TRANSFER",
+        "Small assets exchange BNB": "SWAP",
+        "Large OTC trading": "SWAP",
+        "Buy": "SWAP",
+        "Sell": "SWAP",
+        "ADJUSTMENT": "ADJUSTMENT",
+        "TRANSFER": "TRANSFER",
+        "INTEREST": "INTEREST",
+        "FEE": "FEE",
+        "WITHDRAW": "WITHDRAW",
+        "DEPOSIT": "DEPOSIT",
+        "MINING": "MINING",
+    }
+)
+
+
+def load_aliases(operations_file: str) -> dict[str, str]:
+    # a JSON object of {"Binance operation": "ACTION_TYPE"}
+    with open(operations_file, encoding="utf-8") as json_file:
+        aliases = json.load(json_file)
+    if not isinstance(aliases, dict) or not all(isinstance(value, str) for value in aliases.values()):
+        raise Exception(f"Error: '{operations_file}' must map operations to action types")
+    return aliases
+
+
+class OperationClassifier:
+    def __init__(self, aliases: Mapping[str, str] | None = None) -> None:
+        operations = {**OPERATIONS, **(aliases or {})}
+        invalid = sorted(operation for operation, action_type in operations.items() if action_type not in ACTION_TYPES)
+        if invalid:
+            raise Exception(f"Error: operations {', '.join(invalid)} map to an unknown action type")
+        self.folded: Mapping[str, ACTION_TYPE] = MappingProxyType(
+            {operation.casefold(): action_type for operation, action_type in operations.items()}  # type: ignore
+        )
+        # exact spellings already seen, a statement repeats a handful of them so most rows are one dict hit
+        self.known: dict[str, ACTION_TYPE] = {}
+
+    def lookup(self, operation: str) -> ACTION_TYPE | None:
+        action_type = self.known.get(operation)
+        if action_type is None:
+            action_type = self.folded.get(operation.strip().casefold())
+            if action_type is not None:
+                self.known[operation] = action_type
+        return action_type
+
+    def classify(self, operation: str) -> ACTION_TYPE:
+        action_type = self.lookup(operation)
+        if action_type is None:
+            raise Exception(f"Error: action '{operation}' is invalid")
+        return action_type
+
+    def classify_column(self, operations: Iterable[str]) -> tuple[list[ACTION_TYPE | None], Counter[str]]:
+        # every distinct operation is looked up once, unknown ones come back as None and are counted
+        operations = list(operations)
+        action_types = {operation: self.lookup(operation) for operation in dict.fromkeys(operations)}
+        unknown: Counter[str] = Counter()
+        if None in action_types.values():
+            unknown.update(operation for operation in operations if action_types[operation] is None)
+        return list(map(action_types.__getitem__, operations)), unknown
+
+
+CLASSIFIERS: dict[str | None, OperationClassifier] = {}
+
+
+def get_classifier(operations_file: str | None = None) -> OperationClassifier:
+    # built-in operations, then data/operations.json, then operations_file or $REPORT_OPERATIONS_FILE on top
+    operations_file = operations_file or os.environ.get(OPERATIONS_FILE_ENV)
+    if operations_file not in CLASSIFIERS:
+        aliases: dict[str, str] = {}
+        for aliases_file in (DEFAULT_OPERATIONS_FILE, operations_file):
+            if aliases_file and (aliases_file != DEFAULT_OPERATIONS_FILE or path.exists(aliases_file)):
+                aliases.update(load_aliases(aliases_file))
+        CLASSIFIERS[operations_file] = OperationClassifier(aliases)
+    return CLASSIFIERS[operations_file]
@@ -0,0 +1,220 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from os import path, replace
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .metrics import METRICS
+
+
+class PriceCache:
+    def __init__(self, ttl: float) -> None:
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.prices: dict[str, tuple[float, float]] = {}
+
+    def get(self, coin: str) -> float | None:
+        price = None
+        with self.lock:
+            if coin in self.prices:
+                expires, cached_price = self.prices[coin]
+                if expires > time.monotonic():
+                    price = cached_price
+                else:
+                    del self.prices[coin]
+        return price
+
+    def set(self, coin: str, price: float) -> None:
+        if self.ttl > 0:
+            with self.lock:
+                self.prices[coin] = (time.monotonic() + self.ttl, price)
+
+
+class PriceProvider(ABC):
+    def __init__(self, ttl: float = 30.0) -> None:
+        self.logger = logging.getLogger("PRICES")
+        self.cache = PriceCache(ttl)
+
+    @abstractmethod
+    def fetch_prices(self, coins: list[str]) -> dict[str, float]:
+        pass
+
+    def get_prices(self, coins: list[str]) -> dict[str, float]:
+        prices: dict[str, float] = {}
+        missing: list[str] = []
+        for coin in dict.fromkeys(coins):
+            cached_price = self.cache.get(coin)
+            if cached_price is None:
+                missing.append(coin)
+            else:
+                prices[coin] = cached_price
+
+        METRICS.count("prices.cache_hits", len(prices))
+        METRICS.count("prices.cache_misses", len(missing))
+        if missing:
+            self.logger.debug(f"Fetching {len(missing)} prices, {len(prices)} served from cache")
+            for coin, price in self.fetch_prices(missing).items():
+                self.cache.set(coin, price)
+                prices[coin] = price
+        return prices
+
+    def close(self) -> None:
+        pass
+
+
+class BinancePriceProvider(PriceProvider):
+    QUOTE_COIN = "BUSD"
+    BATCH_SIZE = 100
+
+    def __init__(self, binance_url: str, ttl: float = 30.0, max_workers: int = 8) -> None:
+        super().__init__(ttl)
+        self.binance_url = binance_url
+        self.max_workers = max(1, max_workers)
+        self.sess = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_workers)
+        self.sess.mount("http://", adapter)
+        self.sess.mount("https://", adapter)
+
+    def fetch_symbol(self, symbol: str) -> dict[str, float]:
+        with METRICS.span("prices.http"):
+            raw_response = self.sess.get(f"{self.binance_url}/api/v3/ticker/price", params={"symbol": symbol})
+        METRICS.count("prices.http_calls")
+        if raw_response.status_code == 400:
+            # an invalid or delisted symbol, left out so the other prices still come back
+            self.logger.warning(f"WARNING: Binance rejected symbol {symbol}")
+            return {}
+        raw_response.raise_for_status()
+        json_response = raw_response.json()
+        return {json_response["symbol"]: float(json_response["price"])}
+
+    def fetch_batch(self, symbols: list[str]) -> dict[str, float]:
+        if len(symbols) == 1:
+            return self.fetch_symbol(symbols[0])
+
+        with METRICS.span("prices.http"):
+            raw_response = self.sess.get(
+                f"{self.binance_url}/api/v3/ticker/price",
+                params={"symbols": json.dumps(symbols, separators=(",", ":"))},
+            )
+        METRICS.count("prices.http_calls")
+        if raw_response.status_code == 400:
+            # Binance rejects the whole batch when a single symbol is invalid, we split it in halves
+            # so only the rejected symbols end up being requested one by one
+            self.logger.warning(f"Batch of {len(symbols)} symbols was rejected, splitting it")
+            middle = len(symbols) // 2
+            prices = self.fetch_batch(symbols[:middle])
+            prices.update(self.fetch_batch(symbols[middle:]))
+        else:
+            raw_response.raise_for_status()
+            prices = {item["symbol"]: float(item["price"]) for item in raw_response.json()}
+        return prices
+
+    def fetch_prices(self, coins: list[str]) -> dict[str, float]:
+        symbols = [f"{coin}{self.QUOTE_COIN}" for coin in coins]
+        chunks = [symbols[start : start + self.BATCH_SIZE] for start in range(0, len(symbols), self.BATCH_SIZE)]
+        symbol_prices: dict[str, float] = {}
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(chunks))) as pool:
+            for chunk_prices in pool.map(self.fetch_batch, chunks):
+                symbol_prices.update(chunk_prices)
+        missing = [coin for coin, symbol in zip(coins, symbols) if symbol not in symbol_prices]
+        if missing:
+            self.logger.warning(f"WARNING: no price found for {', '.join(missing)}")
+        return {coin: symbol_prices[symbol] for coin, symbol in zip(coins, symbols) if symbol in symbol_prices}
+
+    def close(self) -> None:
+        self.sess.close()
+
+
+def save_snapshot(snapshot_file: str, prices: dict[str, float], created: float | None = None) -> None:
+    # written to a temporary file first so a reader never sees half a snapshot
+    snapshot = {"created": time.time() if created is None else created, "prices": prices}
+    with open(f"{snapshot_file}.tmp", mode="w", encoding="utf-8") as json_file:
+        json.dump(snapshot, json_file, separators=(",", ":"), sort_keys=True)
+    replace(f"{snapshot_file}.tmp", snapshot_file)
+
+
+def load_snapshot(snapshot_file: str) -> tuple[float, dict[str, float]]:
+    with open(snapshot_file, encoding="utf-8") as json_file:
+        snapshot = json.load(json_file)
+    return float(snapshot["created"]), {coin: float(price) for coin, price in snapshot["prices"].items()}
+
+
+class SnapshotPriceProvider(PriceProvider):
+    # prices saved by save_snapshot(), coins that are not in the file are left out
+    def __init__(self, snapshot_file: str) -> None:
+        super().__init__(ttl=0)
+        self.snapshot_file = snapshot_file
+        self.created = 0.0
+        self.prices: dict[str, float] = {}
+        if path.exists(snapshot_file):
+            self.created, self.prices = load_snapshot(snapshot_file)
+
+    def age(self) -> float:
+        return time.time() - self.created
+
+    def fetch_prices(self, coins: list[str]) -> dict[str, float]:
+        METRICS.count("prices.snapshot", len(coins))
+        return {coin: self.prices[coin] for coin in coins if coin in self.prices}
+
+
+class HistoryPriceProvider(PriceProvider):
+    # latest close of COIN<quote> in the kline history table, coins without klines are left out
+    QUOTE_COINS = ("BUSD", "USDT")
+
+    def __init__(self, history_db: str, history_table: str = "history") -> None:
+        super().__init__(ttl=0)
+        self.history_db = history_db
+        self.history_table = history_table
+
+    def fetch_prices(self, coins: list[str]) -> dict[str, float]:
+        METRICS.count("prices.history", len(coins))
+        prices: dict[str, float] = {}
+        if not path.exists(self.history_db):
+            return prices
+        conn = sqlite3.connect(f"file:{self.history_db}?mode=ro", uri=True)
+        try:
+            for coin in coins:
+                for quote in self.QUOTE_COINS:
+                    row = conn.execute(
+                        f"SELECT close FROM {self.history_table} WHERE pair = ? ORDER BY open_time DESC LIMIT 1;",
+                        (f"{coin}{quote}",),
+                    ).fetchone()
+                    if row:
+                        prices[coin] = float(row[0])
+                        break
+        finally:
+            conn.close()
+        return prices
+
+
+class ChainedPriceProvider(PriceProvider):
+    # asks every provider in turn for the coins the previous ones did not price, a provider that fails is skipped.
+    # Coins no provider knows are left out
+    def __init__(self, providers: list[PriceProvider], ttl: float = 30.0) -> None:
+        super().__init__(ttl)
+        self.providers = providers
+
+    def fetch_prices(self, coins: list[str]) -> dict[str, float]:
+        prices: dict[str, float] = {}
+        for provider in self.providers:
+            missing = [coin for coin in coins if coin not in prices]
+            if not missing:
+                break
+            try:
+                prices.update(provider.fetch_prices(missing))
+            except (requests.RequestException, OSError, sqlite3.Error) as e:
+                self.logger.warning(f"WARNING: {type(provider).__name__} failed, trying the next source: {e}")
+        missing = [coin for coin in coins if coin not in prices]
+        if missing:
+            self.logger.warning(f"WARNING: no price found for {', '.join(missing)} in any source")
+        return prices
+
+    def close(self) -> None:
+        for provider in self.providers:
+            provider.close()
@@ -0,0 +1,83 @@
+import logging
+
+import numpy as np
+
+from .klines import KlineStore
+from .rollups import HistoryStore
+
+# (pair, inverted): inverted means we hold the quote coin of the pair and need 1 / price
+Hop = tuple[str, bool]
+
+
+def split_pair(pair: str, quote_coins: tuple[str, ...]) -> tuple[str, str] | None:
+    result = None
+    for quote in quote_coins:
+        if pair.endswith(quote) and len(pair) > len(quote):
+            result = (pair[: -len(quote)], quote)
+            break
+    return result
+
+
+class PricingEngine:
+    QUOTE_COINS = ("BUSD", "USDT", "BTC", "ETH", "BNB")
+    MAX_HOPS = 3
+
+    def __init__(
+        self, klines: KlineStore | HistoryStore, pairs: list[str], stable_coins: tuple[str, ...] = ("BUSD", "USDT")
+    ) -> None:
+        self.logger = logging.getLogger("PRICING")
+        self.klines = klines
+        self.stable_coins = stable_coins
+        self.graph: dict[str, list[tuple[str, Hop]]] = {}
+        self.paths: dict[str, list[list[Hop]]] = {}
+        for pair in pairs:
+            coins = split_pair(pair, self.QUOTE_COINS)
+            if coins:
+                base, quote = coins
+                self.graph.setdefault(base, []).append((quote, (pair, False)))
+                self.graph.setdefault(quote, []).append((base, (pair, True)))
+            else:
+                self.logger.warning(f"Unknown quote coin in pair '{pair}'")
+
+    def find_paths(self, coin: str) -> list[list[Hop]]:
+        # every simple path up to MAX_HOPS ending in a stable coin, shortest first
+        paths: list[list[Hop]] = []
+        stack: list[tuple[str, list[Hop], set[str]]] = [(coin, [], {coin})]
+        while stack:
+            current, hops, visited = stack.pop()
+            for neighbor, hop in self.graph.get(current, []):
+                if neighbor in visited:
+                    continue
+                if neighbor in self.stable_coins:
+                    paths.append(hops + [hop])
+                elif len(hops) + 1 < self.MAX_HOPS:
+                    stack.append((neighbor, hops + [hop], visited | {neighbor}))
+        paths.sort(key=len)
+        return paths
+
+    def get_paths(self, coin: str) -> list[list[Hop]]:
+        if coin not in self.paths:
+            self.paths[coin] = self.find_paths(coin)
+            if not self.paths[coin]:
+                self.logger.warning(f"No pair path from {coin} to {self.stable_coins}")
+        return self.paths[coin]
+
+    def get_prices(self, coin: str, open_times: np.ndarray) -> np.ndarray:
+        open_times = np.asarray(open_times, dtype=np.int64)
+        if coin in self.stable_coins:
+            return np.ones(open_times.shape)
+
+        prices = np.full(open_times.shape, np.nan)
+        for hops in self.get_paths(coin):
+            missing = np.isnan(prices)
+            if not missing.any():
+                break
+            path_prices = np.ones(int(missing.sum()))
+            for pair, inverted in hops:
+                hop_prices = self.klines.get_prices(pair, open_times[missing])
+                path_prices = path_prices / hop_prices if inverted else path_prices * hop_prices
+            prices[missing] = path_prices
+        return prices
+
+    def get_price(self, coin: str, open_time: int) -> float:
+        return float(self.get_prices(coin, np.array([open_time]))[0])
@@ -0,0 +1,101 @@
+import csv
+import uuid
+from collections import Counter
+from datetime import datetime
+from itertools import islice
+from os import path
+from typing import Iterable, Iterator, TypeVar
+
+from .definitions import ACTION_TYPE
+from .fixed import AMOUNT_DECIMALS, INVESTMENT_DECIMALS, from_cents, from_sats, parse_units
+from .operations import OperationClassifier, get_classifier
+
+T = TypeVar("T")
+
+HistoryRow = tuple[int, str, int, float, float, float, float, int]
+
+
+def chunked(items: Iterable[T], size: int) -> Iterator[list[T]]:
+    iterator = iter(items)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def process_raw_data(file_path: str) -> Iterator[dict[str, str]]:
+    with open(file_path, mode="r", encoding="utf-8") as csv_file:
+        yield from csv.DictReader(csv_file, skipinitialspace=True)
+
+
+def parse_statement_line(line: dict[str, str], action_type: ACTION_TYPE, statement_row: int = 0) -> dict:
+    try:
+        row_date = datetime.strptime(line["UTC_Time"], "%Y-%m-%d %H:%M:%S")
+    except ValueError as err:
+        raise ValueError("Incorrect data format, should be %Y-%m-%d %H:%M:%S") from err
+    return {
+        "id": uuid.uuid5(uuid.NAMESPACE_DNS, line["UTC_Time"] + line["Coin"] + line["Amount"]),
+        "utc_date": row_date,
+        "action_type": action_type,
+        "coin": line["Coin"],
+        "action_id": uuid.uuid5(uuid.NAMESPACE_DNS, line["UTC_Time"]),
+        "amount": from_sats(parse_units(line["Amount"], AMOUNT_DECIMALS)),
+        "investment": from_cents(parse_units(line["Investment"], INVESTMENT_DECIMALS)),
+        "wallet": line["Wallet"],
+        "statement_row": statement_row,
+    }
+
+
+def parse_statement_lines(
+    lines: Iterable[dict[str, str]], classifier: OperationClassifier, first_row: int = 1
+) -> tuple[dict[uuid.UUID, dict], Counter[str]]:
+    # rows by id, a line repeated in the statement is kept once, and the count of every unknown operation.
+    # first_row is the position in the statement of the first line
+    lines = list(lines)
+    action_types, unknown = classifier.classify_column(line["Operation"] for line in lines)
+    rows: dict[uuid.UUID, dict] = {}
+    for statement_row, (line, action_type) in enumerate(zip(lines, action_types), start=first_row):
+        if action_type is not None:
+            row = parse_statement_line(line, action_type, statement_row)
+            rows.setdefault(row["id"], row)
+    return rows, unknown
+
+
+def read_statement(
+    file_path: str, operations_file: str | None = None
+) -> tuple[dict[uuid.UUID, dict], Counter[str], int]:
+    # used by worker processes, the classifier can't be pickled so every worker builds its own
+    lines = list(process_raw_data(file_path))
+    rows, unknown = parse_statement_lines(lines, get_classifier(operations_file))
+    return rows, unknown, len(lines)
+
+
+def get_action_type(operation: str) -> ACTION_TYPE:
+    return get_classifier().classify(operation)
+
+
+def parse_hist_rows(rows: Iterable[list[str]], pair: str, file_id: int) -> Iterator[HistoryRow]:
+    #      0      1    2   3   4       5        6
+    # Open time,Open,High,Low,Close,Volume,Close time,Quote asset volume,Number of trades,
+    # Taker buy base asset volume,Taker buy quote asset volume,Ignore
+    # open_time pair close_time open high low close file_id
+    for row in rows:
+        yield (
+            int(row[0]),
+            pair,
+            int(row[6]),
+            float(row[1]),
+            float(row[2]),
+            float(row[3]),
+            float(row[4]),
+            file_id,
+        )
+
+
+def load_hist_file(csv_dir: str, single_file: str, file_id: int) -> Iterator[HistoryRow]:
+    pair = single_file.split("-")[0]
+    full_path = path.join(csv_dir, single_file)
+    with open(full_path, mode="r", encoding="utf-8") as csv_file:
+        yield from parse_hist_rows(csv.reader(csv_file), pair, file_id)
+
+
+def read_hist_file(csv_dir: str, single_file: str, file_id: int) -> list[HistoryRow]:
+    return list(load_hist_file(csv_dir, single_file, file_id))
@@ -1,181 +1,660 @@
+import math
 import logging
-import csv
 from datetime import datetime
 import uuid
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from os import cpu_count
 
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from typing import TYPE_CHECKING, Any, Iterable
+
+from sqlalchemy import func, insert
 from sqlalchemy.exc import IntegrityError
-import requests
+from sqlalchemy.orm import Query
 from prettytable import PrettyTable
 
-from .db import Actions, Portfolio, Actual_Investment
-from .definitions import ACTION_TYPE, SWAP_KEYS, Swap
-
-
-def process_raw_data(file_path: str) -> list[dict[str, str]]:
-    csv_reader: list[dict[str, str]]
-    with open(file_path, mode="r", encoding="utf-8") as csv_file:
-        csv_reader = [dict(row.items()) for row in csv.DictReader(csv_file, skipinitialspace=True)]
-
-    return csv_reader
-
-
-def cast_to_float(number, precision: int) -> float:
-    return round(float(number), precision)
-
-
-def get_action_type(operation: str) -> ACTION_TYPE:
-    action_type: ACTION_TYPE
-    transfer_choices = [
-        "POS savings purchase",
-        "POS savings redemption",
-        "transfer_out",
-        "transfer_in",
-    ]
-    swap_choices = [
-        "Small assets exchange BNB",
-        "Large OTC trading",
-        "Buy",
-        "Sell",
-    ]
-    same_choices = ["ADJUSTMENT", "TRANSFER", "INTEREST", "FEE", "WITHDRAW", "DEPOSIT", "MINING"]
-    if operation == "POS savings interest":
-        action_type = "INTEREST"
-    elif operation in transfer_choices:
-        action_type = "TRANSFER"
-    elif operation in swap_choices:
-        action_type = "SWAP"
-    elif operation.upper() in same_choices:
-        action_type = operation.upper()  # type: ignore[assignment]
-    else:
-        raise Exception(f"Error: action '{operation}' is invalid")
-    return action_type
+from .db import Actions, Action_Summary, Portfolio, Actual_Investment, Tracker_Checkpoint, Replay_Checkpoint
+from .fixed import (
+    AMOUNT_DECIMALS,
+    AMOUNT_SCALE,
+    INVESTMENT_DECIMALS,
+    from_cents,
+    from_sats,
+    to_cents,
+    to_sats,
+)
+from .metrics import METRICS
+from .tracker import Tracker
+from .storage import Storage, create_storage, summarise
+from .swaps import Leg, apply_swap_group
+from .operations import get_classifier
+from .readers import chunked, parse_statement_line, parse_statement_lines, process_raw_data, read_statement
+
+if TYPE_CHECKING:
+    from collections.abc import Sequence
+
+    import numpy as np
+
+    from .prices import PriceProvider
+    from .timeline import Timeline
+
+INVESTMENT_ACTIONS = frozenset(("DEPOSIT", "WITHDRAW", "ADJUSTMENT"))
+AMOUNT_ACTIONS = frozenset(("INTEREST", "MINING", "TRANSFER"))
+SWAP_GROUP_ACTIONS = frozenset(("SWAP", "FEE"))
+
+
+def format_money(value: float) -> str:
+    return "-" if math.isnan(value) else f"{value:,.2f}"
 
 
 class Report:
     FIAT_EXCHANGE_RATE = 1.25
     STABLE_COINS = ["BUSD", "USDT"]
+    INSERT_CHUNK_SIZE = 5000
+    REPLAY_BATCH_SIZE = 10000
+    DAY_PRECISION = 86400000  # milliseconds between the rows of get_portfolio_series
 
-    def __init__(self) -> None:
-        engine = create_engine(
-            "postgresql+psycopg2://juanpa:@localhost/report", logging_name="postgresqlt-conn", echo=False
-        )
-        Session = sessionmaker(bind=engine)
-        self.conn = Session()
+    def __init__(
+        self,
+        price_ttl: float = 30.0,
+        max_workers: int = 8,
+        binance_url: str = "https://api.binance.com",
+        database_url: str | None = None,
+        price_snapshot: str | None = None,
+        snapshot_ttl: float = 3600.0,
+        offline: bool = False,
+        history_db: str | None = None,
+        operations_file: str | None = None,
+    ) -> None:
+        self.storage: Storage = create_storage(database_url)
+        self.conn = self.storage.session()
         self.logger = logging.getLogger("REPORT")
-        self.track: dict = {}
-        self.binance_url = "https://api.binance.com"
+        self.operations_file = operations_file
+        self.classifier = get_classifier(operations_file)
+        self.track = Tracker()
+        self.investments: dict[uuid.UUID, int] = {}
+        self.stored_investments: dict[uuid.UUID, tuple[str, str, int]] = {}
+        self.binance_url = binance_url
+        self.price_ttl = price_ttl
+        self.max_workers = max_workers
+        self.price_snapshot = price_snapshot
+        self.snapshot_ttl = snapshot_ttl
+        self.offline = offline
+        self.history_db = history_db
+        self.price_provider: PriceProvider | None = None
 
-    def load_raw_statement(self, file_list: str) -> None:
-        csv_reader = process_raw_data(file_list)
-        for line in csv_reader:
-            try:
-                row_date = datetime.strptime(line["UTC_Time"], "%Y-%m-%d %H:%M:%S")
-            except ValueError as err:
-                raise ValueError("Incorrect data format, should be %Y-%m-%d %H:%M:%S") from err
-            row_id = uuid.uuid5(uuid.NAMESPACE_DNS, line["UTC_Time"] + line["Coin"] + line["Amount"])
+    @property
+    def prices(self) -> "PriceProvider":
+        if self.price_provider is None:
+            self.price_provider = self.create_price_provider()
+        return self.price_provider
+
+    @prices.setter
+    def prices(self, price_provider: "PriceProvider") -> None:
+        self.price_provider = price_provider
+
+    def create_price_provider(self) -> "PriceProvider":
+        # pylint: disable=import-outside-toplevel
+        from .prices import BinancePriceProvider, ChainedPriceProvider, HistoryPriceProvider, SnapshotPriceProvider
+
+        if not (self.price_snapshot or self.history_db):
+            if self.offline:
+                raise Exception("Error: offline prices need a price snapshot or a history database")
+            return BinancePriceProvider(self.binance_url, ttl=self.price_ttl, max_workers=self.max_workers)
+
+        # a fresh snapshot is used before the network, a stale one only when Binance can't be reached.
+        # The latest close in the history table is the last resort
+        live: list[PriceProvider] = []
+        if not self.offline:
+            live.append(BinancePriceProvider(self.binance_url, ttl=0, max_workers=self.max_workers))
+        providers = live
+        if self.price_snapshot:
+            snapshot = SnapshotPriceProvider(self.price_snapshot)
+            if snapshot.age() > self.snapshot_ttl and snapshot.prices:
+                self.logger.info(f"Price snapshot '{self.price_snapshot}' is {snapshot.age():,.0f}s old")
+            providers = [snapshot, *live] if snapshot.age() <= self.snapshot_ttl else [*live, snapshot]
+        if self.history_db:
+            providers.append(HistoryPriceProvider(self.history_db))
+        return ChainedPriceProvider(providers, ttl=self.price_ttl)
+
+    def save_price_snapshot(self, snapshot_file: str) -> dict[str, float]:
+        # live prices of every coin in the portfolio, always fetched from Binance
+        # pylint: disable=import-outside-toplevel
+        from .prices import BinancePriceProvider, save_snapshot
+
+        coins = [item.coin for item in self.conn.query(Portfolio).all() if item.coin not in self.STABLE_COINS]
+        live = BinancePriceProvider(self.binance_url, ttl=0, max_workers=self.max_workers)
+        try:
+            prices = live.get_prices(coins)
+        finally:
+            live.close()
+        save_snapshot(snapshot_file, prices)
+        self.logger.info(f"{len(prices)} prices saved to '{snapshot_file}'")
+        return prices
+
+    def load_raw_statement(self, file_list: str, bulk: bool = True) -> tuple[int, int]:
+        if bulk:
+            return self.bulk_load_raw_statement(file_list)
+
+        inserted = 0
+        skipped = 0
+        for statement_row, line in enumerate(process_raw_data(file_list), start=1):
+            with METRICS.span("statement.parse"):
+                row = parse_statement_line(line, self.classifier.classify(line["Operation"]), statement_row)
             try:
-                self.conn.add(
-                    Actions(
-                        id=row_id,
-                        utc_date=row_date,
-                        action_type=get_action_type(line["Operation"]),
-                        coin=line["Coin"],
-                        action_id=uuid.uuid5(uuid.NAMESPACE_DNS, line["UTC_Time"]),
-                        amount=cast_to_float(line["Amount"], 8),
-                        investment=cast_to_float(line["Investment"], 2),
-                        wallet=line["Wallet"],
+                with METRICS.span("statement.insert"):
+                    self.conn.add(Actions(**row))
+                    self.storage.update_summary(
+                        self.conn, summarise([(row["coin"], row["action_type"], row["amount"], row["investment"])])
                     )
-                )
-                self.conn.commit()
+                    self.conn.commit()
+                inserted += 1
             except IntegrityError:
                 self.conn.rollback()
-                self.logger.warning(f"Row '{row_id}' was reverted")
+                skipped += 1
+                self.logger.warning(f"Row '{row['id']}' was reverted")
+        METRICS.count("statement.rows", inserted + skipped)
+        METRICS.count("statement.inserted", inserted)
+        METRICS.count("statement.skipped", skipped)
+        return inserted, skipped
 
-    def get_swap_percentage(self, action: Actions) -> float:
-        src_coin = action.coin
-        src_amount = action.amount * -1
+    def get_existing_ids(self, first_date: datetime, last_date: datetime) -> set[uuid.UUID]:
+        # a statement covers a contiguous period so a single range scan is enough to find duplicates
+        query = self.conn.query(Actions.id).filter(Actions.utc_date.between(first_date, last_date))
+        return {row.id for row in query}
 
-        if self.track[src_coin]["amount"] < src_amount:
-            percentage = 1.0
-        elif self.track[src_coin]["amount"] > 0.0:
-            percentage = src_amount / self.track[src_coin]["amount"]
-        else:
-            percentage = 0.0
+    def insert_rows(self, rows: dict[uuid.UUID, dict]) -> int:
+        # rows inserted earlier in this transaction are found here as well, the caller commits
+        first_date = min(row["utc_date"] for row in rows.values())
+        last_date = max(row["utc_date"] for row in rows.values())
+        existing_ids = self.get_existing_ids(first_date, last_date)
+        new_rows = [row for row_id, row in rows.items() if row_id not in existing_ids]
+        if not new_rows:
+            return 0
+        inserted_ids = self.storage.insert_actions(self.conn, new_rows)
+        self.storage.update_summary(
+            self.conn,
+            summarise(
+                (row["coin"], row["action_type"], row["amount"], row["investment"])
+                for row_id, row in rows.items()
+                if row_id in inserted_ids
+            ),
+        )
+        return len(inserted_ids)
 
-        return percentage
+    def report_unknown(self, unknown: Counter[str], file_list: str) -> None:
+        if unknown:
+            operations = ", ".join(f"'{operation}' ({count} rows)" for operation, count in unknown.most_common())
+            raise Exception(f"Error: unknown operations in '{file_list}': {operations}")
+
+    def bulk_load_raw_statement(self, file_list: str) -> tuple[int, int]:
+        total = 0
+        inserted = 0
+        unknown: Counter[str] = Counter()
+        chunks = chunked(process_raw_data(file_list), self.INSERT_CHUNK_SIZE)
+        try:
+            while True:
+                with METRICS.span("statement.parse"):
+                    lines = next(chunks, [])
+                    rows, chunk_unknown = parse_statement_lines(lines, self.classifier, total + 1)
+                    unknown.update(chunk_unknown)
+                if not lines:
+                    break
+                total += len(lines)
+                if rows:
+                    with METRICS.span("statement.insert"):
+                        inserted += self.insert_rows(rows)
+            self.report_unknown(unknown, file_list)
+            with METRICS.span("statement.commit"):
+                self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+
+        skipped = total - inserted
+        METRICS.count("statement.rows", total)
+        METRICS.count("statement.inserted", inserted)
+        METRICS.count("statement.skipped", skipped)
+        self.logger.info(f"Statement '{file_list}': {inserted} rows inserted, {skipped} rows skipped")
+        return inserted, skipped
+
+    def load_raw_statements(self, statements: list[str], workers: int | None = None) -> tuple[int, int]:
+        # overlapping exports of the same account, every statement is parsed by a worker process and the
+        # rows are merged on their uuid5 id before the database is touched. Then one insert and one commit
+        if len(statements) == 1:
+            return self.bulk_load_raw_statement(statements[0])
+        workers = min(workers or cpu_count() or 1, len(statements))
+        total = 0
+        rows: dict[uuid.UUID, dict] = {}
+        unknown: Counter[str] = Counter()
+        with METRICS.span("statement.parse"):
+            if workers == 1:
+                parsed = [read_statement(statement, self.operations_file) for statement in statements]
+            else:
+                with ProcessPoolExecutor(max_workers=workers) as pool:
+                    parsed = list(pool.map(read_statement, statements, [self.operations_file] * len(statements)))
+            # statements are merged in the order they were given, the first copy of a row is kept
+            for statement_rows, statement_unknown, lines in parsed:
+                total += lines
+                unknown.update(statement_unknown)
+                for row_id, row in statement_rows.items():
+                    rows.setdefault(row_id, row)
+        self.report_unknown(unknown, ", ".join(statements))
+        self.logger.info(f"{len(statements)} statements parsed with {workers} workers: {len(rows)} distinct rows")
+
+        inserted = 0
+        try:
+            with METRICS.span("statement.insert"):
+                ordered = sorted(rows.values(), key=lambda row: row["utc_date"])
+                for chunk in chunked(ordered, self.INSERT_CHUNK_SIZE):
+                    inserted += self.insert_rows({row["id"]: row for row in chunk})
+            with METRICS.span("statement.commit"):
+                self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+
+        skipped = total - inserted
+        METRICS.count("statement.rows", total)
+        METRICS.count("statement.inserted", inserted)
+        METRICS.count("statement.skipped", skipped)
+        self.logger.info(f"{len(statements)} statements: {inserted} rows inserted, {skipped} rows skipped")
+        return inserted, skipped
 
     def get_actual_investment(self) -> float:
         result = self.conn.query(Actual_Investment).first()
         return result.investment
 
-    def update_investment(self, swap: Swap) -> None:
-        src_coin = swap["src"].coin
-        dest_coin = swap["dest"].coin
-        src_amount = round(swap["src"].amount, 8)
-        tracked_src_amount = round(self.track[src_coin]["amount"], 8)
-        dest_amount = swap["dest"].amount
-
-        if (tracked_src_amount + src_amount) < 0:
-            self.logger.warning(f"WARNING: amount of {src_coin} exceed available")
-
-        self.track[src_coin]["amount"] = tracked_src_amount + src_amount
-        self.track[dest_coin]["amount"] = self.track[dest_coin]["amount"] + dest_amount
-        swap_percentage = self.get_swap_percentage(swap["src"])
-        track_investment = cast_to_float(self.track[src_coin]["investment"] * swap_percentage, 2)
-        self.track[src_coin]["investment"] -= track_investment
-        self.track[dest_coin]["investment"] += track_investment
-        swap["src"].investment = track_investment * -1
-        swap["dest"].investment = track_investment
-        self.conn.commit()
-
-    def get_current_price(self, sess: requests.Session, coin: str) -> float:
-        if coin in self.STABLE_COINS:
-            current_price = self.FIAT_EXCHANGE_RATE
+    def update_investment(self, src: list[Actions], dest: list[Actions], fees: list[Actions]) -> None:
+        if src and dest:
+            with METRICS.span("replay.swap"):
+                self.apply_swap(src, dest, fees)
+            METRICS.count("replay.swaps")
         else:
-            raw_response = sess.get(f"{self.binance_url}/api/v3/avgPrice?symbol={coin}BUSD")
-            raw_response.raise_for_status()
-            json_response = raw_response.json()
-            current_price = float(json_response["price"]) * self.FIAT_EXCHANGE_RATE
-        return current_price
-
-    def process(self) -> None:
-        swap: dict[str, Swap] = {}
-        for data in self.conn.query(Actions).order_by(Actions.utc_date).all():
-            if data.coin not in self.track:
-                self.track[data.coin] = {
-                    "amount": 0.0,
-                    "investment": 0.0,
-                }
-
-            if data.action_type in ["DEPOSIT", "WITHDRAW", "ADJUSTMENT"]:
-                self.track[data.coin]["investment"] += data.investment
-                self.track[data.coin]["amount"] += data.amount
-            elif data.action_type in ["FEE", "INTEREST", "MINING", "TRANSFER"]:
-                self.track[data.coin]["amount"] += data.amount
-            elif data.action_type == "SWAP":
-                # we process SWAP here
-                # we have two rows and we can't control the order of them
-                # swap should contain only two transactions
-
-                if data.action_id not in swap:
-                    swap.clear()
-                    swap = {data.action_id: {}}  # type: ignore[typeddict-item]
-                src_dest: SWAP_KEYS = "dest" if data.amount > 0.0 else "src"
-                swap[data.action_id][src_dest] = data
-
-                # we make sure we have the two rows stored in cache
-                # if "dest" in swap[action_id] and "src" in swap[action_id]:
-                if all(k in swap[data.action_id] for k in ("dest", "src")):
-                    self.update_investment(swap[data.action_id])
+            # fees without a swap only take amount, a swap missing one side is left out
+            for fee in fees:
+                self.track.amounts[self.track.index[fee.coin]] += to_sats(fee.amount)
+            if src or dest:
+                self.logger.warning(f"WARNING: swap {(src or dest)[0].action_id} has no {'dest' if src else 'src'} leg")
+
+    def apply_swap(self, src: list[Actions], dest: list[Actions], fees: list[Actions]) -> None:
+        # the coins of the legs were interned by replay()
+        index = self.track.index
+        result = apply_swap_group(
+            self.track.amounts,
+            self.track.investments,
+            [Leg(index[leg.coin], to_sats(leg.amount)) for leg in src],
+            [Leg(index[leg.coin], to_sats(leg.amount)) for leg in dest],
+            [Leg(index[leg.coin], to_sats(leg.amount)) for leg in fees] if fees else (),
+        )
+        for coin in result.short:
+            self.logger.warning(f"WARNING: amount of {self.track.coins[coin]} exceed available")
+        if result.mixed:
+            self.logger.warning(f"WARNING: swap {src[0].action_id} buys several coins, investment split by amount")
+        # the legs are written back in bulk at the end of the pass, see write_investments(). Every leg is in
+        # a single group so it is seen once per pass
+        stored_investments, investments = self.stored_investments, self.investments
+        for leg, investment in zip(src + dest + fees, result.src + result.dest + result.fees):
+            row_id = leg.id
+            stored_investments[row_id] = (leg.coin, leg.action_type, to_cents(leg.investment))
+            investments[row_id] = investment
+
+    def get_current_prices(self, coins: list[str]) -> dict[str, float]:
+        prices = self.prices.get_prices([coin for coin in coins if coin not in self.STABLE_COINS])
+        current_prices: dict[str, float] = {}
+        for coin in coins:
+            if coin in self.STABLE_COINS:
+                current_prices[coin] = self.FIAT_EXCHANGE_RATE
             else:
-                raise Exception(f"Unknown action {data.action_type}")
+                # a coin without a price is shown as NaN, see format_money()
+                current_prices[coin] = prices.get(coin, math.nan) * self.FIAT_EXCHANGE_RATE
+        return current_prices
+
+    def get_current_price(self, coin: str) -> float:
+        return self.get_current_prices([coin])[coin]
+
+    def count_actions_until(self, utc_date: datetime) -> int:
+        return self.conn.query(func.count(Actions.id)).filter(Actions.utc_date <= utc_date).scalar()
+
+    def load_checkpoint(self) -> Replay_Checkpoint | None:
+        self.track = Tracker()
+        checkpoint = self.conn.query(Replay_Checkpoint).first()
+        if checkpoint and self.count_actions_until(checkpoint.utc_date) != checkpoint.row_count:
+            self.logger.warning(f"Back-dated actions found before {checkpoint.utc_date}, replaying from scratch")
+            checkpoint = None
+        if checkpoint:
+            for row in self.conn.query(Tracker_Checkpoint).all():
+                self.track.set(row.coin, to_sats(row.amount), to_cents(row.investment))
+        return checkpoint
+
+    def save_checkpoint(self, last_action: Actions) -> None:
+        if last_action.utc_date is None:
+            raise Exception(f"Error: action '{last_action.id}' has no utc_date, the checkpoint can't be saved")
+        self.conn.query(Tracker_Checkpoint).delete()
+        for coin, amount, investment in self.track.items():
+            self.conn.add(Tracker_Checkpoint(coin=coin, amount=from_sats(amount), investment=from_cents(investment)))
+        self.conn.merge(
+            Replay_Checkpoint(
+                id=1,
+                utc_date=last_action.utc_date,
+                action_id=last_action.action_id,
+                row_count=self.count_actions_until(last_action.utc_date),
+            )
+        )
+
+    def replay(self, actions: Iterable[Actions]) -> Actions | None:
+        # SWAP legs and FEE rows of the pending action_id
+        src: list[Actions] = []
+        dest: list[Actions] = []
+        fees: list[Actions] = []
+        group_id: uuid.UUID | None = None
+        last_action: Actions | None = None
+        track = self.track
+        index, amounts, investments = track.index, track.amounts, track.investments
+        for data in actions:
+            last_action = data
+            # @INFO: rows of one action_id are adjacent. Its SWAP and FEE legs are held until the action_id changes
+            # and applied together after the other rows of that second, in whatever order the legs came. Only a
+            # pending group needs the UUID compare
+            if group_id is not None and data.action_id != group_id:
+                self.update_investment(src, dest, fees)
+                src, dest, fees = [], [], []
+                group_id = None
+            coin = index.get(data.coin)
+            if coin is None:
+                coin = track.intern(data.coin)
+
+            action_type = data.action_type
+            if action_type in INVESTMENT_ACTIONS:
+                investments[coin] += to_cents(data.investment)
+                amounts[coin] += to_sats(data.amount)
+            elif action_type in AMOUNT_ACTIONS:
+                amounts[coin] += to_sats(data.amount)
+            elif action_type in SWAP_GROUP_ACTIONS:
+                group_id = data.action_id
+                if action_type == "FEE":
+                    fees.append(data)
+                elif data.amount > 0.0:
+                    dest.append(data)
+                else:
+                    src.append(data)
+            else:
+                raise Exception(f"Unknown action {action_type}")
+        if group_id is not None:
+            self.update_investment(src, dest, fees)
+        return last_action
+
+    def replay_vectorised(self, rows: list[Any]) -> Any:
+        from .engine import build_ledger, replay_ledger  # pylint: disable=import-outside-toplevel
+
+        ledger = build_ledger((row.coin, row.action_type, row.action_id, row.amount, row.investment) for row in rows)
+        result = replay_ledger(ledger, self.track)
+        METRICS.count("replay.swaps", result.swaps)
+        for idx in result.legs.tolist():
+            row = rows[idx]
+            self.stored_investments[row.id] = (row.coin, row.action_type, to_cents(row.investment))
+            self.investments[row.id] = int(result.investment[idx])
+        self.track = result.track
+        return rows[-1] if rows else None
+
+    def write_investments(self, investments: dict[uuid.UUID, int]) -> None:
+        # one executemany UPDATE instead of flushing every dirty ORM object, the caller commits
+        self.conn.bulk_update_mappings(
+            Actions,
+            [{"id": row_id, "investment": from_cents(investment)} for row_id, investment in investments.items()],
+        )
+        deltas = []
+        for row_id, investment in investments.items():
+            coin, action_type, stored_investment = self.stored_investments[row_id]
+            deltas.append((coin, action_type, 0.0, from_cents(investment - stored_investment)))
+        self.storage.update_summary(self.conn, summarise(deltas))
+
+    def rebuild_summary(self) -> None:
+        self.conn.query(Action_Summary).delete()
+        totals = self.conn.query(
+            Actions.coin,
+            Actions.action_type,
+            func.round(func.sum(Actions.amount), AMOUNT_DECIMALS),
+            func.round(func.sum(Actions.investment), INVESTMENT_DECIMALS),
+        ).group_by(Actions.coin, Actions.action_type)
+        self.conn.execute(
+            insert(Action_Summary).from_select(
+                [Action_Summary.coin, Action_Summary.action_type, Action_Summary.amount, Action_Summary.investment],
+                totals.statement,
+            )
+        )
+
+    def verify_summary(self, repair: bool = False) -> list[tuple[str, str, float, float]]:
+        expected = summarise(
+            self.conn.query(
+                Actions.coin, Actions.action_type, func.sum(Actions.amount), func.sum(Actions.investment)
+            ).group_by(Actions.coin, Actions.action_type)
+        )
+        stored = summarise(
+            self.conn.query(
+                Action_Summary.coin, Action_Summary.action_type, Action_Summary.amount, Action_Summary.investment
+            )
+        )
+        differences = []
+        for coin, action_type in sorted(expected.keys() | stored.keys()):
+            expected_amount, expected_investment = expected.get((coin, action_type), (0.0, 0.0))
+            stored_amount, stored_investment = stored.get((coin, action_type), (0.0, 0.0))
+            if (expected_amount, expected_investment) != (stored_amount, stored_investment):
+                amount_diff = round(stored_amount - expected_amount, 8)
+                investment_diff = round(stored_investment - expected_investment, 2)
+                differences.append((coin, action_type, amount_diff, investment_diff))
+                self.logger.warning(f"Summary of {coin} {action_type} is off by {amount_diff} / {investment_diff}")
+
+        if not differences:
+            self.logger.info("Summary matches the actions table")
+        elif repair:
+            try:
+                self.rebuild_summary()
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                raise
+            self.logger.info(f"Summary rebuilt, {len(differences)} rows were off")
+        return differences
+
+    def get_replay_query(self, checkpoint: Replay_Checkpoint | None = None) -> Query:
+        # only the replayed columns, in the order of actions_utc_date_action_id_idx so the database walks the
+        # index instead of sorting the table (see data/migrations/ and benchmarks/replay_query.py). The legs of one
+        # action_id come in statement order, the order Collect reads them in, and paired swaps match src and dest by it
+        query = self.conn.query(
+            Actions.id,
+            Actions.utc_date,
+            Actions.coin,
+            Actions.action_type,
+            Actions.action_id,
+            Actions.amount,
+            Actions.investment,
+        )
+        if checkpoint:
+            query = query.filter(Actions.utc_date > checkpoint.utc_date)
+        return query.order_by(Actions.utc_date, Actions.action_id, Actions.statement_row)
+
+    def process(self, full: bool = False, vectorised: bool = False, dry_run: bool = False) -> dict[uuid.UUID, float]:
+        self.investments = {}
+        self.stored_investments = {}
+        if full:
+            self.track = Tracker()
+            checkpoint = None
+        else:
+            checkpoint = self.load_checkpoint()
+        query = self.get_replay_query(checkpoint)
+        # the array engine stays opt-in, loading every row up front costs more than its faster arithmetic
+        # saves (see benchmarks/suite.py process vs process_vectorised)
+        if vectorised:
+            with METRICS.span("replay.load"):
+                rows = query.all()
+            METRICS.count("replay.rows", len(rows))
+            with METRICS.span("replay.run"):
+                last_action = self.replay_vectorised(rows)
+        else:
+            # the loop replays the rows while they are fetched, loading is part of replay.run
+            with METRICS.span("replay.run"):
+                last_action = self.replay(query.yield_per(self.REPLAY_BATCH_SIZE))
+
+        if dry_run:
+            self.logger.info(f"Dry run: {len(self.investments)} swap investments computed, nothing written")
+        elif last_action:
+            try:
+                with METRICS.span("replay.write"):
+                    self.write_investments(self.investments)
+                    self.save_checkpoint(last_action)
+                    self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                raise
+            self.logger.info(f"{len(self.investments)} swap investments written")
+        return {row_id: from_cents(investment) for row_id, investment in self.investments.items()}
 
     def get_portfolio(self) -> None:
+        with METRICS.span("portfolio.query"):
+            actual_investment = self.get_actual_investment()
+            portfolio = self.conn.query(Portfolio).all()
+        with METRICS.span("portfolio.prices"):
+            current_prices = self.get_current_prices([item.coin for item in portfolio])
+        with METRICS.span("portfolio.render"):
+            self.render_portfolio(portfolio, current_prices, actual_investment)
+
+    def get_timeline(self) -> "Timeline":
+        from .timeline import Timeline  # pylint: disable=import-outside-toplevel
+
+        with METRICS.span("timeline.build"):
+            rows = (
+                self.conn.query(Actions)
+                .with_entities(Actions.coin, Actions.action_type, Actions.utc_date, Actions.amount, Actions.investment)
+                .order_by(Actions.utc_date)
+                .all()
+            )
+            timeline = Timeline(rows)
+        METRICS.count("timeline.rows", len(rows))
+        return timeline
+
+    def get_historical_prices(
+        self,
+        coins: list[str],
+        utc_dates: "Sequence[datetime] | np.ndarray",
+        kline_store: str | None = None,
+        precision: int | None = None,
+    ) -> dict[str, "np.ndarray"]:
+        # prices of every coin at every date from the kline store built by 'import-history --kline-store', or else
+        # from the coarsest history rollup within precision milliseconds. NaN where there is no kline
+        # pylint: disable=import-outside-toplevel
+        import numpy as np
+        from .klines import KLINE_INTERVAL, KlineStore
+        from .pricing import PricingEngine
+        from .rollups import HistoryStore
+        from .timeline import to_datetime64
+
+        klines: KlineStore | HistoryStore
+        if kline_store:
+            klines = KlineStore(kline_store)
+        elif self.history_db:
+            klines = HistoryStore(self.history_db, precision or KLINE_INTERVAL)
+        else:
+            raise Exception("Error: historical prices need a kline store or a history database")
+        pricing = PricingEngine(klines, klines.available_pairs(), tuple(self.STABLE_COINS))
+        open_times = to_datetime64(utc_dates).astype("datetime64[ms]").astype(np.int64)
+        prices: dict[str, np.ndarray] = {}
+        for coin in coins:
+            prices[coin] = pricing.get_prices(coin, open_times) * self.FIAT_EXCHANGE_RATE
+            missing = int(np.isnan(prices[coin]).sum())
+            if missing:
+                self.logger.warning(f"WARNING: no kline price for {coin} at {missing} of {len(open_times)} dates")
+        if isinstance(klines, HistoryStore):
+            klines.close()
+        return prices
+
+    def get_portfolio_as_of(
+        self, as_of: datetime, kline_store: str | None = None, precision: int | None = None
+    ) -> list[Portfolio]:
+        # holdings as the portfolio view would have shown them at as_of, valued at kline prices if there are any
+        with METRICS.span("portfolio.query"):
+            timeline = self.get_timeline()
+            portfolio = [
+                Portfolio(
+                    coin=coin,
+                    amount=from_sats(amount),
+                    investment=from_cents(investment),
+                    min_price=from_cents(investment) / from_sats(amount),
+                )
+                for coin, (amount, investment) in sorted(timeline.at(as_of).items())
+                if amount > 0
+            ]
+            actual_investment = from_cents(timeline.actual_at(as_of))
+        prices: dict[str, float] = {}
+        if kline_store or self.history_db:
+            with METRICS.span("portfolio.prices"):
+                coin_prices = self.get_historical_prices(
+                    [item.coin for item in portfolio], [as_of], kline_store, precision
+                )
+                prices = {coin: float(price[0]) for coin, price in coin_prices.items()}
+        with METRICS.span("portfolio.render"):
+            self.render_portfolio(portfolio, prices, actual_investment, at=as_of)
+        return portfolio
+
+    def get_portfolio_series(
+        self, start: datetime, until: datetime, kline_store: str | None = None, precision: int | None = None
+    ) -> list[tuple[datetime, float, float, float]]:
+        # one row per day from start to until: (date, actual investment, portfolio investment, value), the value
+        # is NaN without kline prices. A daily row is valued at daily history rollups unless precision is finer
+        import numpy as np  # pylint: disable=import-outside-toplevel
+
+        with METRICS.span("portfolio.query"):
+            timeline = self.get_timeline()
+            dates: np.ndarray = np.arange(
+                np.datetime64(start, "s"), np.datetime64(until, "s") + 1, np.timedelta64(1, "D")
+            )
+            series = timeline.series(dates)
+            actual = timeline.actual_series(dates)
+        prices: dict[str, np.ndarray] = {}
+        if kline_store or self.history_db:
+            with METRICS.span("portfolio.prices"):
+                prices = self.get_historical_prices(list(series), dates, kline_store, precision or self.DAY_PRECISION)
+
+        invested = np.zeros(len(dates), dtype=np.int64)
+        values = np.zeros(len(dates)) if prices else np.full(len(dates), np.nan)
+        for coin, (amounts, investments) in series.items():
+            held = amounts > 0
+            invested += np.where(held, investments, 0)
+            if prices:
+                values += np.where(held, amounts / AMOUNT_SCALE * prices[coin], 0.0)
+
+        rows = [
+            (date, from_cents(actual_cents), from_cents(invested_cents), value)
+            for date, actual_cents, invested_cents, value in zip(
+                dates.astype(datetime).tolist(), actual.tolist(), invested.tolist(), values.tolist()
+            )
+        ]
+        with METRICS.span("portfolio.render"):
+            table = PrettyTable()
+            table.field_names = ["date", "actual_investment", "investment", "value", "difference"]
+            for date, actual_investment, investment, value in rows:
+                table.add_row(
+                    [
+                        date.strftime("%d/%b/%Y"),
+                        f"{actual_investment:,.2f}",
+                        f"{investment:,.2f}",
+                        format_money(value),
+                        format_money(value - actual_investment),
+                    ]
+                )
+            print(table)
+        return rows
+
+    def render_portfolio(
+        self,
+        portfolio: list[Portfolio],
+        current_prices: dict[str, float],
+        actual_investment: float,
+        at: datetime | None = None,
+    ) -> None:
         all_values = 0.0
-        current_investment = 0.0
-        actual_investment = self.get_actual_investment()
+        current_investment = 0
+        unpriced = []
         table = PrettyTable()
         table.field_names = [
             "time",
@@ -187,43 +666,51 @@ class Report:
             "min_price",
             "difference",
         ]
-        with requests.Session() as sess:
-            for item in self.conn.query(Portfolio).all():
-                current_price = self.get_current_price(sess, item.coin)
-                now = datetime.now()
-                current_value = current_price * item.amount
+        now = at or datetime.now()
+        for item in portfolio:
+            current_price = current_prices.get(item.coin, math.nan)
+            current_value = current_price * item.amount
+            if math.isnan(current_value):
+                unpriced.append(item.coin)
+            else:
                 all_values += current_value
-                investment = item.investment
-                current_investment = current_investment + investment
-                table.add_row(
-                    [
-                        now.strftime("%H:%M:%S %d/%b/%Y"),
-                        item.coin,  # coin
-                        f"{item.amount:,.8f}",  # amount
-                        f"{investment:,.2f}",  # investment
-                        f"{current_price:,.2f}",
-                        f"{current_value:,.2f}",
-                        f"{item.min_price:,.2f}",  # min_price
-                        f"{current_value - investment:,.2f}",  # difference
-                    ]
-                )
+            investment = item.investment
+            current_investment += to_cents(investment)
+            table.add_row(
+                [
+                    now.strftime("%H:%M:%S %d/%b/%Y"),
+                    item.coin,  # coin
+                    f"{item.amount:,.8f}",  # amount
+                    f"{investment:,.2f}",  # investment
+                    format_money(current_price),
+                    format_money(current_value),
+                    f"{item.min_price:,.2f}",  # min_price
+                    format_money(current_value - investment),  # difference
+                ]
+            )
+        if unpriced:
+            self.logger.warning(f"WARNING: no price for {', '.join(unpriced)}, the total only adds up the priced coins")
         table.add_row(
             [
                 "-",
-                "-",
+                "partial" if unpriced else "-",
                 "-",
                 f"{actual_investment:,.2f}",
                 "-",
-                f"{all_values:,.2f}",
+                format_money(all_values),
                 "-",
-                f"{all_values - actual_investment:,.2f}",
+                format_money(all_values - actual_investment),
             ]
         )
-        if current_investment != actual_investment:
-            msg = f"WARNING: {current_investment=} are different {actual_investment=} "
-            msg += f"{actual_investment - current_investment}"
+        # compared in cents, only a real difference (e.g. investment left on sold out coins) is reported
+        if current_investment != to_cents(actual_investment):
+            msg = f"WARNING: current_investment={from_cents(current_investment)} are different {actual_investment=} "
+            msg += f"{from_cents(to_cents(actual_investment) - current_investment)}"
             self.logger.warning(msg)
         print(table)
 
     def close(self) -> None:
+        if self.price_provider is not None:
+            self.price_provider.close()
         self.conn.close()
+        self.storage.close()
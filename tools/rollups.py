@@ -0,0 +1,152 @@
+import logging
+import sqlite3
+from typing import Any
+
+import numpy as np
+
+from .klines import KLINE_DTYPE, KLINE_INTERVAL, lookup_prices
+from .metrics import METRICS
+
+HOUR_INTERVAL = 60 * KLINE_INTERVAL
+DAY_INTERVAL = 24 * HOUR_INTERVAL
+# resolution -> (table, interval in milliseconds), every rollup is built from the one before it
+RESOLUTIONS: dict[str, tuple[str, int]] = {
+    "1m": ("history", KLINE_INTERVAL),
+    "1h": ("history_1h", HOUR_INTERVAL),
+    "1d": ("history_1d", DAY_INTERVAL),
+}
+ROLLUP_DTYPE = np.dtype(KLINE_DTYPE.descr + [("klines", np.int64)])
+ROLLUP_SQL = """
+    CREATE TABLE IF NOT EXISTS {table}(
+        open_time INTEGER NOT NULL,
+        pair TEXT NOT NULL,
+        close_time INTEGER NOT NULL,
+        open REAL NOT NULL,
+        high REAL NOT NULL,
+        low REAL NOT NULL,
+        close REAL NOT NULL,
+        klines INTEGER NOT NULL,
+        PRIMARY KEY (pair, open_time)
+    ) WITHOUT ROWID;
+"""
+
+
+def get_resolution(precision: int) -> str:
+    # coarsest resolution whose buckets are no longer than precision milliseconds
+    result = "1m"
+    for resolution, (_, interval) in RESOLUTIONS.items():
+        if interval <= precision:
+            result = resolution
+    return result
+
+
+def create_rollups(conn: sqlite3.Connection) -> None:
+    # data/history.sql creates them as well, this covers history databases made before the rollups
+    for table, _ in list(RESOLUTIONS.values())[1:]:
+        conn.execute(ROLLUP_SQL.format(table=table))
+
+
+def aggregate(
+    times: np.ndarray, ohlc: np.ndarray, klines: np.ndarray, interval: int
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # time ordered klines into buckets of interval: open of the first, highest high, lowest low and close of the last
+    buckets = times - times % interval
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    ends = np.r_[starts[1:], len(times)] - 1
+    bucket_ohlc = np.column_stack(
+        [
+            ohlc[starts, 0],
+            np.maximum.reduceat(ohlc[:, 1], starts),
+            np.minimum.reduceat(ohlc[:, 2], starts),
+            ohlc[ends, 3],
+        ]
+    )
+    return buckets[starts], bucket_ohlc, np.add.reduceat(klines, starts)
+
+
+def update_rollups(conn: sqlite3.Connection, pair: str, first_time: int, last_time: int) -> int:
+    # only the buckets between first_time and last_time are recomputed, each rollup from the finer one just
+    # written, so importing a month reads that month of 1m klines once. The caller commits
+    create_rollups(conn)
+    rows = 0
+    resolutions = list(RESOLUTIONS.values())
+    for (source, _), (table, interval) in zip(resolutions, resolutions[1:]):
+        start = first_time - first_time % interval
+        end = last_time - last_time % interval + interval
+        klines_column = "1" if source == resolutions[0][0] else "klines"
+        cursor = conn.execute(
+            f"""
+            SELECT open_time, open, high, low, close, {klines_column}
+            FROM {source}
+            WHERE pair = ? AND open_time >= ? AND open_time < ?
+            ORDER BY open_time;
+            """,
+            (pair, start, end),
+        )
+        source_rows = np.fromiter(cursor, dtype=ROLLUP_DTYPE)
+        cursor.close()
+        if source_rows.size == 0:
+            break
+        ohlc = np.column_stack([source_rows["open"], source_rows["high"], source_rows["low"], source_rows["close"]])
+        times, ohlc, klines = aggregate(source_rows["open_time"], ohlc, source_rows["klines"], interval)
+        conn.executemany(
+            f"""
+            INSERT OR REPLACE INTO {table}(open_time, pair, close_time, open, high, low, close, klines)
+            VALUES(?, ?, ?, ?, ?, ?, ?, ?);
+            """,
+            (
+                (open_time, pair, open_time + interval - 1, *prices, count)
+                for open_time, prices, count in zip(times.tolist(), ohlc.tolist(), klines.tolist())
+            ),
+        )
+        rows += len(times)
+    return rows
+
+
+class HistoryStore:
+    # prices from the history database with the interface of KlineStore. Every lookup reads the coarsest
+    # table that is within precision milliseconds, timestamps it can't price fall back to the finer tables
+    def __init__(self, history_db: str, precision: int = KLINE_INTERVAL) -> None:
+        self.logger = logging.getLogger("KLINES")
+        self.precision = precision
+        self.conn = sqlite3.connect(f"file:{history_db}?mode=ro", uri=True)
+        tables = {row[0] for row in self.conn.execute("SELECT name FROM sqlite_master WHERE type = 'table';")}
+        resolutions = list(RESOLUTIONS.values())[: list(RESOLUTIONS).index(get_resolution(precision)) + 1]
+        self.resolutions = [(table, interval) for table, interval in reversed(resolutions) if table in tables]
+
+    def available_pairs(self) -> list[str]:
+        # history_index knows every imported file, its name starts with the pair
+        return sorted({row[0].split("-")[0] for row in self.conn.execute("SELECT file_name FROM history_index;")})
+
+    def load(self, table: str, pair: str, first_time: int, last_time: int) -> tuple[np.ndarray, np.ndarray]:
+        cursor = self.conn.execute(
+            f"""
+            SELECT open_time, open, high, low, close
+            FROM {table}
+            WHERE pair = ? AND open_time > ? AND open_time <= ?
+            ORDER BY open_time;
+            """,
+            (pair, first_time, last_time),
+        )
+        klines = np.fromiter(cursor, dtype=KLINE_DTYPE)
+        cursor.close()
+        METRICS.count(f"klines.{table}", len(klines))
+        return klines["open_time"], np.column_stack([klines["open"], klines["high"], klines["low"], klines["close"]])
+
+    def get_prices(self, pair: str, open_times: Any) -> np.ndarray:
+        open_times = np.asarray(open_times, dtype=np.int64)
+        prices = np.full(open_times.shape, np.nan)
+        for table, interval in self.resolutions:
+            missing = np.isnan(prices)
+            if not missing.any():
+                break
+            wanted = open_times[missing]
+            times, ohlc = self.load(table, pair, int(wanted.min()) - interval, int(wanted.max()))
+            prices[missing] = lookup_prices(times, ohlc, wanted, interval, self.precision)
+        return prices
+
+    def get_price(self, pair: str, open_time: int) -> float:
+        return float(self.get_prices(pair, np.array([open_time]))[0])
+
+    def close(self) -> None:
+        self.conn.close()
@@ -0,0 +1,225 @@
+import csv
+import io
+import logging
+import os
+import uuid
+from abc import ABC, abstractmethod
+from os import path
+from typing import Any, Iterable, cast
+
+from sqlalchemy import create_engine, event, func
+from sqlalchemy.engine import CursorResult, Engine, make_url
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import QueuePool, StaticPool
+from sqlalchemy.dialects import postgresql, sqlite
+
+from .db import Actions, Action_Summary
+from .fixed import AMOUNT_DECIMALS, INVESTMENT_DECIMALS, from_cents, from_sats, to_cents, to_sats
+
+DATABASE_URL_ENV = "REPORT_DATABASE_URL"
+DEFAULT_DATABASE_URL = "postgresql+psycopg2://juanpa:@localhost/report"
+SCHEMA_FILES = ("db-definitions.sql", "actions.sql")
+SCHEMA_DIR = path.join(path.dirname(path.dirname(path.abspath(__file__))), "data")
+MIGRATIONS_DIR = path.join(SCHEMA_DIR, "migrations")
+ACTION_COLUMNS = [
+    "id",
+    "utc_date",
+    "action_type",
+    "coin",
+    "action_id",
+    "amount",
+    "investment",
+    "wallet",
+    "statement_row",
+]
+
+
+def get_database_url(database_url: str | None = None) -> str:
+    return database_url or os.environ.get(DATABASE_URL_ENV) or DEFAULT_DATABASE_URL
+
+
+def summarise(rows: Iterable[tuple[str, str, float, float]]) -> dict[tuple[str, str], tuple[float, float]]:
+    # rows are (coin, action_type, amount, investment), totals are added up in satoshis and cents
+    totals: dict[tuple[str, str], list[int]] = {}
+    for coin, action_type, amount, investment in rows:
+        total = totals.setdefault((coin, action_type), [0, 0])
+        total[0] += to_sats(amount)
+        total[1] += to_cents(investment)
+    return {key: (from_sats(sats), from_cents(cents)) for key, (sats, cents) in totals.items()}
+
+
+class Storage(ABC):
+    PLACEHOLDER = "%s"
+
+    def __init__(self, engine: Engine) -> None:
+        self.logger = logging.getLogger("STORAGE")
+        self.engine = engine
+        self.session_factory = sessionmaker(bind=engine)
+
+    def session(self) -> Session:
+        return self.session_factory()
+
+    @abstractmethod
+    def insert(self, table: Any) -> Any:
+        pass
+
+    @abstractmethod
+    def insert_actions(self, conn: Session, rows: list[dict]) -> set[uuid.UUID]:
+        pass
+
+    def update_summary(self, conn: Session, deltas: dict[tuple[str, str], tuple[float, float]]) -> None:
+        # action_summary moves together with actions so portfolio and actual_investment only read
+        # a few rows per coin, the caller commits. Totals are rounded to the column scale because SQLite adds
+        # them as floats
+        if deltas:
+            stmt = self.insert(Action_Summary).values(
+                [
+                    {"coin": coin, "action_type": action_type, "amount": amount, "investment": investment}
+                    for (coin, action_type), (amount, investment) in deltas.items()
+                ]
+            )
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[Action_Summary.coin, Action_Summary.action_type],
+                set_={
+                    "amount": func.round(Action_Summary.amount + stmt.excluded.amount, AMOUNT_DECIMALS),
+                    "investment": func.round(Action_Summary.investment + stmt.excluded.investment, INVESTMENT_DECIMALS),
+                },
+            )
+            conn.execute(stmt)
+
+    def create_schema(self) -> None:
+        # the scripts in data/ are plain SQL that both PostgreSQL and SQLite understand. actions.sql only has
+        # the base actions table, every table and view added since comes from the migrations
+        raw_conn = self.engine.raw_connection()
+        try:
+            cursor = raw_conn.cursor()
+            for file_name in SCHEMA_FILES:
+                with open(path.join(SCHEMA_DIR, file_name), encoding="utf-8") as sql_file:
+                    self.execute_script(cursor, sql_file.read())
+            raw_conn.commit()
+        finally:
+            raw_conn.close()
+        self.logger.info(f"Schema created on {self.engine.url.get_backend_name()}")
+        self.migrate()
+
+    def migrate(self) -> list[str]:
+        # data/migrations/*.sql run once each in name order, the applied ones are kept in schema_migrations.
+        # create_schema() drops that table with actions so a new schema gets every migration again
+        raw_conn = self.engine.raw_connection()
+        applied: list[str] = []
+        try:
+            cursor = raw_conn.cursor()
+            cursor.execute("CREATE TABLE IF NOT EXISTS schema_migrations(name TEXT NOT NULL PRIMARY KEY);", ())
+            cursor.execute("SELECT name FROM schema_migrations;", ())
+            done = {row[0] for row in cursor.fetchall()}
+            for file_name in sorted(os.listdir(MIGRATIONS_DIR)):
+                if file_name.endswith(".sql") and file_name not in done:
+                    with open(path.join(MIGRATIONS_DIR, file_name), encoding="utf-8") as sql_file:
+                        self.execute_script(cursor, sql_file.read())
+                    cursor.execute(f"INSERT INTO schema_migrations(name) VALUES ({self.PLACEHOLDER});", (file_name,))
+                    raw_conn.commit()
+                    applied.append(file_name)
+        finally:
+            raw_conn.close()
+        if applied:
+            self.logger.info(f"Migrations applied: {', '.join(applied)}")
+        return applied
+
+    def execute_script(self, cursor: Any, sql_script: str) -> None:
+        cursor.execute(sql_script)
+
+    def close(self) -> None:
+        self.engine.dispose()
+
+
+class PostgresStorage(Storage):
+    def __init__(self, database_url: str, pool_size: int = 5) -> None:
+        engine = create_engine(
+            database_url,
+            logging_name="postgresqlt-conn",
+            echo=False,
+            executemany_mode="values_plus_batch",
+            pool_size=pool_size,
+            pool_pre_ping=True,
+        )
+        super().__init__(engine)
+
+    def insert(self, table: Any) -> Any:
+        return postgresql.insert(table)
+
+    def insert_actions(self, conn: Session, rows: list[dict]) -> set[uuid.UUID]:
+        # COPY can't skip duplicates, rows are copied into a temporary table and moved from there
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows([row[column] for column in ACTION_COLUMNS] for row in rows)
+        buffer.seek(0)
+        columns = ", ".join(ACTION_COLUMNS)
+        cursor = conn.connection().connection.cursor()
+        cursor.execute("CREATE TEMP TABLE IF NOT EXISTS actions_load (LIKE actions INCLUDING DEFAULTS) ON COMMIT DROP;")
+        cursor.execute("TRUNCATE actions_load;")
+        cursor.copy_expert(f"COPY actions_load({columns}) FROM STDIN WITH (FORMAT csv)", buffer)
+        cursor.execute(f"""
+            INSERT INTO actions({columns})
+            SELECT {columns}
+            FROM actions_load
+            ON CONFLICT (id) DO NOTHING
+            RETURNING id;
+            """)
+        inserted_ids = {uuid.UUID(str(row[0])) for row in cursor.fetchall()}
+        cursor.close()
+        return inserted_ids
+
+
+class SQLiteStorage(Storage):
+    PLACEHOLDER = "?"
+
+    def __init__(self, database_url: str, pool_size: int = 5) -> None:
+        url = make_url(database_url)
+        self.in_memory = url.database in (None, "", ":memory:")
+        if self.in_memory:
+            # every session has to see the same in-memory database, so there is only one connection
+            engine = create_engine(
+                database_url, echo=False, poolclass=StaticPool, connect_args={"check_same_thread": False}
+            )
+        else:
+            engine = create_engine(database_url, echo=False, poolclass=QueuePool, pool_size=pool_size)
+        event.listen(engine, "connect", self.set_pragmas)
+        super().__init__(engine)
+        if self.in_memory:
+            self.create_schema()
+
+    def set_pragmas(self, dbapi_conn: Any, _connection_record: Any) -> None:
+        cursor = dbapi_conn.cursor()
+        cursor.execute("PRAGMA foreign_keys = ON;")
+        if not self.in_memory:
+            cursor.execute("PRAGMA journal_mode = WAL;")
+            cursor.execute("PRAGMA synchronous = NORMAL;")
+        cursor.close()
+
+    def insert(self, table: Any) -> Any:
+        return sqlite.insert(table)
+
+    def execute_script(self, cursor: Any, sql_script: str) -> None:
+        cursor.executescript(sql_script)
+
+    def insert_actions(self, conn: Session, rows: list[dict]) -> set[uuid.UUID]:
+        result = cast(
+            CursorResult, conn.execute(sqlite.insert(Actions).on_conflict_do_nothing(index_elements=[Actions.id]), rows)
+        )
+        if result.rowcount != len(rows):
+            # SQLite has no RETURNING here, the caller already dropped the ids it found so this
+            # only happens when another writer got in between
+            raise Exception(f"Error: {len(rows) - result.rowcount} actions were inserted by another writer")
+        return {row["id"] for row in rows}
+
+
+def create_storage(database_url: str | None = None, pool_size: int = 5) -> Storage:
+    database_url = get_database_url(database_url)
+    backend = make_url(database_url).get_backend_name()
+    storage: Storage
+    if backend == "postgresql":
+        storage = PostgresStorage(database_url, pool_size)
+    elif backend == "sqlite":
+        storage = SQLiteStorage(database_url, pool_size)
+    else:
+        raise Exception(f"Error: database backend '{backend}' is not supported")
+    return storage
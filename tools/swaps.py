@@ -0,0 +1,120 @@
+from typing import NamedTuple, Sequence
+
+from .fixed import div_round
+
+
+class Leg(NamedTuple):
+    coin: int  # index into the amounts and investments lists
+    amount: int  # satoshis, src and fee legs are negative
+
+
+class SwapGroup(NamedTuple):
+    # investment in cents written to every src, dest and fee leg, in the order they were given
+    src: list[int]
+    dest: list[int]
+    fees: list[int]
+    short: list[int]  # src coins that ended below zero
+    mixed: bool  # dest legs of several coins that couldn't be paired with the src legs
+
+
+def get_swap_investment(amounts: list[int], investments: list[int], coin: int, swapped: int) -> int:
+    # share of the tracked investment of coin that moves with the swapped satoshis, once they left the coin
+    amount, tracked = amounts[coin], investments[coin]
+    if amount < swapped:
+        investment = tracked
+    elif amount > 0:
+        investment = div_round(tracked * swapped, amount)
+    else:
+        investment = 0
+    return investment
+
+
+def split(total: int, weights: Sequence[int]) -> list[int]:
+    # total shared pro-rata by weights, rounding the running sum keeps the parts adding up to total exactly
+    weight_sum = sum(weights)
+    if weight_sum <= 0:
+        weights = [1] * len(weights)
+        weight_sum = len(weights)
+    parts = []
+    done = 0
+    running = 0
+    for weight in weights:
+        running += weight
+        share = div_round(total * running, weight_sum)
+        parts.append(share - done)
+        done = share
+    return parts
+
+
+def apply_swap_group(
+    amounts: list[int], investments: list[int], src: Sequence[Leg], dest: Sequence[Leg], fees: Sequence[Leg] = ()
+) -> SwapGroup:
+    # @INFO: every leg of one action_id at once. The investment leaving the src coins is shared by the dest legs
+    # pro-rata to their amounts, legs of one coin are pooled so N dust coins into M BNB legs is a single pass.
+    # When the dest legs are of several coins the amounts can't be compared, if there are as many src as dest legs
+    # they are paired in order like separate trades of the same second, otherwise the split is by amount anyway.
+    # FEE legs are part of the cost of what was bought: the investment of the fee moves to the dest legs, unless
+    # the fee was paid in a dest coin where it stays anyway
+    if len(src) == 1 and len(dest) == 1 and not fees:
+        # one src and one dest leg, the usual trade
+        (src_coin, src_amount), (dest_coin, dest_amount) = src[0], dest[0]
+        amounts[src_coin] += src_amount
+        moved = get_swap_investment(amounts, investments, src_coin, src_amount * -1)
+        investments[src_coin] -= moved
+        amounts[dest_coin] += dest_amount
+        investments[dest_coin] += moved
+        return SwapGroup([moved * -1], [moved], [], [src_coin] if amounts[src_coin] < 0 else [], False)
+
+    dest_coins = {leg.coin for leg in dest}
+    paired = len(dest_coins) > 1 and len(src) == len(dest)
+    src_investment = [0] * len(src)
+    short = []
+    if paired:
+        weights = []
+        for idx, (src_leg, dest_leg) in enumerate(zip(src, dest)):
+            amounts[src_leg.coin] += src_leg.amount
+            if amounts[src_leg.coin] < 0:
+                short.append(src_leg.coin)
+            moved = get_swap_investment(amounts, investments, src_leg.coin, src_leg.amount * -1)
+            investments[src_leg.coin] -= moved
+            amounts[dest_leg.coin] += dest_leg.amount
+            investments[dest_leg.coin] += moved
+            src_investment[idx] = moved * -1
+            weights.append(moved)
+        dest_investment = list(weights)
+    else:
+        src_legs: dict[int, list[int]] = {}
+        for idx, leg in enumerate(src):
+            src_legs.setdefault(leg.coin, []).append(idx)
+        total = 0
+        for coin, legs in src_legs.items():
+            swapped = sum(src[idx].amount for idx in legs) * -1
+            amounts[coin] -= swapped
+            if amounts[coin] < 0:
+                short.append(coin)
+            moved = get_swap_investment(amounts, investments, coin, swapped)
+            investments[coin] -= moved
+            total += moved
+            for idx, part in zip(legs, split(moved, [src[idx].amount * -1 for idx in legs])):
+                src_investment[idx] = part * -1
+        weights = [leg.amount for leg in dest]
+        dest_investment = split(total, weights)
+
+    fee_investment = [0] * len(fees)
+    fee_total = 0
+    for idx, leg in enumerate(fees):
+        amounts[leg.coin] += leg.amount
+        if leg.coin not in dest_coins:
+            moved = get_swap_investment(amounts, investments, leg.coin, leg.amount * -1)
+            investments[leg.coin] -= moved
+            fee_investment[idx] = moved * -1
+            fee_total += moved
+    fee_parts = split(fee_total, weights)
+
+    for idx, leg in enumerate(dest):
+        if not paired:
+            amounts[leg.coin] += leg.amount
+            investments[leg.coin] += dest_investment[idx]
+        investments[leg.coin] += fee_parts[idx]
+        dest_investment[idx] += fee_parts[idx]
+    return SwapGroup(src_investment, dest_investment, fee_investment, short, len(dest_coins) > 1 and not paired)
@@ -0,0 +1,66 @@
+from datetime import datetime
+from operator import itemgetter
+from typing import Iterable, Sequence
+
+import numpy as np
+
+from .fixed import AMOUNT_SCALE, INVESTMENT_SCALE
+
+ACTUAL_INVESTMENT_TYPES = ("DEPOSIT", "WITHDRAW")
+
+
+def to_datetime64(utc_dates: Sequence[datetime] | np.ndarray) -> np.ndarray:
+    return np.array(utc_dates, dtype="datetime64[s]")
+
+
+class Timeline:
+    # running totals of every coin ordered by utc_date, entry n is the sum of the first n actions of the coin.
+    # Holdings at any time are a binary search away, so a year of daily values is one searchsorted per coin
+    # instead of 365 replays. Amounts are satoshis and investments cents like Report.track
+    def __init__(self, rows: Iterable[tuple[str, str, datetime, float, float]]) -> None:
+        # rows are (coin, action_type, utc_date, amount, investment) ordered by utc_date
+        rows = list(rows)
+        coins, action_types, utc_dates, amounts, investments = (list(map(itemgetter(idx), rows)) for idx in range(5))
+        times = to_datetime64(utc_dates)
+        amount = np.rint(np.array(amounts, dtype=np.float64) * AMOUNT_SCALE).astype(np.int64)
+        investment = np.rint(np.array(investments, dtype=np.float64) * INVESTMENT_SCALE).astype(np.int64)
+
+        coin_ids = {coin: idx for idx, coin in enumerate(dict.fromkeys(coins))}
+        coin_idx = np.fromiter(map(coin_ids.__getitem__, coins), dtype=np.int32, count=len(coins))
+        order = np.argsort(coin_idx, kind="stable")
+        bounds = np.searchsorted(coin_idx[order], np.arange(len(coin_ids) + 1)).tolist()
+        self.coins: dict[str, tuple[np.ndarray, np.ndarray, np.ndarray]] = {}
+        for coin, idx in coin_ids.items():
+            selected = order[bounds[idx] : bounds[idx + 1]]
+            self.coins[coin] = (
+                times[selected],
+                np.concatenate(([0], np.cumsum(amount[selected]))),
+                np.concatenate(([0], np.cumsum(investment[selected]))),
+            )
+        actual = np.isin(np.array(action_types, dtype=object), ACTUAL_INVESTMENT_TYPES)
+        self.actual = (times[actual], np.concatenate(([0], np.cumsum(investment[actual]))))
+
+    def __len__(self) -> int:
+        return sum(len(times) for times, _, _ in self.coins.values())
+
+    def series(self, utc_dates: Sequence[datetime] | np.ndarray) -> dict[str, tuple[np.ndarray, np.ndarray]]:
+        # amount and investment of every coin after the last action at or before each date
+        dates = to_datetime64(utc_dates)
+        result = {}
+        for coin, (times, amounts, investments) in self.coins.items():
+            idx = np.searchsorted(times, dates, side="right")
+            result[coin] = (amounts[idx], investments[idx])
+        return result
+
+    def actual_series(self, utc_dates: Sequence[datetime] | np.ndarray) -> np.ndarray:
+        times, investments = self.actual
+        return investments[np.searchsorted(times, to_datetime64(utc_dates), side="right")]
+
+    def at(self, utc_date: datetime) -> dict[str, tuple[int, int]]:
+        return {
+            coin: (int(amounts[0]), int(investments[0]))
+            for coin, (amounts, investments) in self.series([utc_date]).items()
+        }
+
+    def actual_at(self, utc_date: datetime) -> int:
+        return int(self.actual_series([utc_date])[0])
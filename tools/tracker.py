@@ -0,0 +1,73 @@
+from typing import Iterator, NamedTuple
+
+
+class Snapshot(NamedTuple):
+    coins: tuple[str, ...]
+    amounts: tuple[int, ...]
+    investments: tuple[int, ...]
+
+
+class Tracker:
+    # running amount (satoshis) and investment (cents) of every coin. Coins are interned to an index into
+    # parallel lists so the replay loop does one dict lookup per row and plain list arithmetic after that. Python
+    # lists beat numpy here because the loop touches a single element at a time
+    __slots__ = ("index", "coins", "amounts", "investments")
+
+    def __init__(self) -> None:
+        self.index: dict[str, int] = {}
+        self.coins: list[str] = []
+        self.amounts: list[int] = []
+        self.investments: list[int] = []
+
+    def intern(self, coin: str) -> int:
+        idx = self.index.get(coin)
+        if idx is None:
+            idx = self.index[coin] = len(self.coins)
+            self.coins.append(coin)
+            self.amounts.append(0)
+            self.investments.append(0)
+        return idx
+
+    def __contains__(self, coin: str) -> bool:
+        return coin in self.index
+
+    def __len__(self) -> int:
+        return len(self.coins)
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Tracker):
+            return NotImplemented
+        return self.as_dict() == other.as_dict()
+
+    def get(self, coin: str) -> tuple[int, int]:
+        idx = self.index[coin]
+        return self.amounts[idx], self.investments[idx]
+
+    def set(self, coin: str, amount: int, investment: int) -> None:
+        idx = self.intern(coin)
+        self.amounts[idx] = amount
+        self.investments[idx] = investment
+
+    def items(self) -> Iterator[tuple[str, int, int]]:
+        return zip(self.coins, self.amounts, self.investments)
+
+    def as_dict(self) -> dict[str, tuple[int, int]]:
+        return {coin: (amount, investment) for coin, amount, investment in self.items()}
+
+    def snapshot(self) -> Snapshot:
+        return Snapshot(tuple(self.coins), tuple(self.amounts), tuple(self.investments))
+
+    def restore(self, snapshot: Snapshot) -> None:
+        self.coins = list(snapshot.coins)
+        self.amounts = list(snapshot.amounts)
+        self.investments = list(snapshot.investments)
+        self.index = {coin: idx for idx, coin in enumerate(self.coins)}
+
+    @classmethod
+    def from_snapshot(cls, snapshot: Snapshot) -> "Tracker":
+        tracker = cls()
+        tracker.restore(snapshot)
+        return tracker
+
+    def copy(self) -> "Tracker":
+        return Tracker.from_snapshot(self.snapshot())